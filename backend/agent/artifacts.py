@@ -0,0 +1,144 @@
+"""
+Artifact Store
+Large request payloads (input text, extracted text) are stored once per
+request and referenced from the AgentState by handle. Nodes read them
+through TextView, a window onto the stored string that slices and searches
+without copying it.
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional, Pattern, Union
+import hashlib
+import re
+
+
+HANDLE_PREFIX = "artifact://"
+
+LEADING_WHITESPACE = re.compile(r"\s*")
+
+# Characters hashed per slice, so a digest never copies the whole text
+DIGEST_SLICE_CHARS = 1024 * 1024
+
+
+class TextView:
+    """
+    Read-only window onto a string
+
+    Slicing a view returns a narrower view; only preview() and str()
+    produce a new string.
+    """
+
+    __slots__ = ("_text", "start", "end")
+
+    def __init__(self, text: str, start: int = 0, end: Optional[int] = None):
+        self._text = text
+        self.start = start
+        self.end = len(text) if end is None else end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __bool__(self) -> bool:
+        return self.end > self.start
+
+    def __getitem__(self, key: slice) -> "TextView":
+        start, end, _ = key.indices(len(self))
+        return TextView(self._text, self.start + start, self.start + max(start, end))
+
+    def __str__(self) -> str:
+        if self.start == 0 and self.end == len(self._text):
+            return self._text
+        return self._text[self.start:self.end]
+
+    def preview(self, max_chars: int) -> str:
+        return self._text[self.start:min(self.end, self.start + max_chars)]
+
+    def strip(self) -> "TextView":
+        """View without leading and trailing whitespace"""
+        start = LEADING_WHITESPACE.match(self._text, self.start, self.end).end()
+        end = self.end
+        while end > start and self._text[end - 1].isspace():
+            end -= 1
+        return TextView(self._text, start, end)
+
+    def endswith(self, suffix: str) -> bool:
+        return self._text.endswith(suffix, self.start, self.end)
+
+    def search(self, pattern: Pattern):
+        return pattern.search(self._text, self.start, self.end)
+
+    def finditer(self, pattern: Pattern) -> Iterator:
+        return pattern.finditer(self._text, self.start, self.end)
+
+
+@dataclass
+class ArtifactStore:
+    """
+    Per-request store of large payloads
+
+    A dataclass so checkpoints of a paused request serialize it, storing
+    each payload once even when several state fields reference it.
+    """
+
+    items: Dict[str, Any] = field(default_factory=dict)
+    digests: Dict[str, str] = field(default_factory=dict)  # Content keys of text payloads, by handle
+
+    def put(self, value: Any, name: str = "artifact", digest: Optional[str] = None) -> str:
+        """
+        Store a payload and return its handle
+
+        Args:
+            value: The payload
+            name: Label used in the handle
+            digest: Known content key (e.g. upload hash and extractor version),
+                so consumers can cache by content without hashing the payload
+        """
+        handle = f"{HANDLE_PREFIX}{name}/{len(self.items)}"
+        self.items[handle] = value
+        if digest is not None:
+            self.digests[handle] = digest
+        return handle
+
+    def get(self, handle: str) -> Any:
+        return self.items[handle]
+
+    def view(self, handle: str) -> TextView:
+        return TextView(self.items[handle] or "")
+
+    def __contains__(self, handle) -> bool:
+        return isinstance(handle, str) and handle in self.items
+
+
+def resolve(state, field: str) -> Any:
+    """Value of a state field, following its handle into the request's artifact store"""
+    value = state.get(field)
+    artifacts = state.get('artifacts')
+    if artifacts is not None and value in artifacts:
+        return artifacts.get(value)
+    return value
+
+
+def text_view(state, field: str = "extracted_text") -> TextView:
+    """TextView of a text field, whether it holds a handle or (e.g. set directly in tests) the text"""
+    return TextView(resolve(state, field) or "")
+
+
+def text_preview(state, max_chars: int, field: str = "extracted_text") -> str:
+    return text_view(state, field).preview(max_chars)
+
+
+def content_digest(state, field: str = "extracted_text") -> Optional[str]:
+    """Stored content key of a text field held by handle, if one was given to put()"""
+    artifacts = state.get('artifacts')
+    if artifacts is None or not isinstance(state.get(field), str):
+        return None
+    return artifacts.digests.get(state[field])
+
+
+def text_digest(text: Union[str, TextView]) -> str:
+    """SHA-256 of text, hashed in slices so a large view is never copied whole"""
+    view = TextView(text) if isinstance(text, str) else text
+    digest = hashlib.sha256()
+    for start in range(0, len(view), DIGEST_SLICE_CHARS):
+        digest.update(view[start:start + DIGEST_SLICE_CHARS].preview(DIGEST_SLICE_CHARS).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
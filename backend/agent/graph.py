@@ -1,13 +1,65 @@
+from typing import Dict, List, Optional, Union
 from langgraph.graph import StateGraph, END
-from backend.agent.state import AgentState
+from langgraph.types import Send
+from langgraph.utils.runnable import RunnableCallable
+from langchain.prompts import ChatPromptTemplate
+from backend.agent.state import AgentState, TaskType
+from backend.llm.config import get_chain, register_chain
+from backend.agent.artifacts import text_view
+from backend.services.metrics import timed_node, INTENT_CLASSIFICATIONS
+from backend.agent.intent_rules import classify_followup, fast_path_enabled
+from backend.services.tracing import traced_node
+from backend.agent.single_call import (
+    classify_and_execute_node,
+    aclassify_and_execute_node,
+    route_after_single_call,
+    single_call_enabled
+)
 from backend.agent.nodes import (
     extract_content_node,
+    aextract_content_node,
     classify_intent_node,
+    aclassify_intent_node,
     execute_task_node,
+    aexecute_task_node,
+    run_task_node,
+    arun_task_node,
+    merge_results_node,
     ask_followup_node
 )
 
 
+FOLLOWUP_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """Based on the user's clarification, determine the task they want.
+
+Tasks:
+- SUMMARIZE
+- SENTIMENT
+- CODE_EXPLAIN
+- EXTRACT
+- QA
+
+Respond with just the task name."""),
+    ("user", """Original content type: {input_type}
+Original question: {clarification_question}
+User's response: {response}
+
+What task do they want?""")
+])
+
+register_chain("followup", FOLLOWUP_PROMPT, route="followup")
+
+
+def route_after_extraction(state: AgentState) -> Union[str, List[Send]]:
+    """Skip intent classification when the caller already fixed the task(s)"""
+    if state.get('tasks'):
+        # Fan out: one branch per task over the same extracted text
+        return [Send("run_task", {**state, "detected_task": task}) for task in state['tasks']]
+    if state.get('detected_task'):
+        return "execute_task"
+    return "classify_intent"
+
+
 def should_ask_followup(state: AgentState) -> str:
     """Decide whether to ask follow-up question or proceed with task"""
     if state['needs_clarification'] or state['confidence'] < 0.7:
@@ -15,38 +67,91 @@ def should_ask_followup(state: AgentState) -> str:
     return "execute_task"
 
 
-def create_agent_workflow() -> StateGraph:
-    """Create the LangGraph workflow for the agent"""
+def input_chars(state: AgentState) -> int:
+    return len(text_view(state))
+
+
+def graph_node(name: str, func, afunc=None) -> RunnableCallable:
+    """Timed, traced node running `func` under workflow.invoke and `afunc` (if any) under workflow.ainvoke"""
+    return RunnableCallable(
+        traced_node(name, timed_node(name, func), input_chars),
+        traced_node(name, timed_node(name, afunc), input_chars) if afunc else None,
+        name=name
+    )
+
+
+def create_agent_workflow(single_call: Optional[bool] = None, checkpointer=None) -> StateGraph:
+    """
+    Create the LangGraph workflow for the agent
+    
+    Args:
+        single_call: Classify and execute in one LLM call (defaults to
+            SINGLE_CALL_MODE); low-confidence requests still ask a follow-up
+        checkpointer: Makes the graph resumable: it pauses after
+            ask_followup and continues into execute_task once the thread
+            is updated with the user's answer (see aresume_followup)
+    """
+    if single_call is None:
+        single_call = single_call_enabled()
     
     # Initialize workflow
     workflow = StateGraph(AgentState)
     
     # Add nodes
-    workflow.add_node("extract_content", extract_content_node)
-    workflow.add_node("classify_intent", classify_intent_node)
-    workflow.add_node("ask_followup", ask_followup_node)
-    workflow.add_node("execute_task", execute_task_node)
+    classify_node = "classify_and_execute" if single_call else "classify_intent"
+    workflow.add_node("extract_content", graph_node("extract_content", extract_content_node, aextract_content_node))
+    if single_call:
+        workflow.add_node(classify_node, graph_node(classify_node, classify_and_execute_node, aclassify_and_execute_node))
+    else:
+        workflow.add_node(classify_node, graph_node(classify_node, classify_intent_node, aclassify_intent_node))
+    workflow.add_node("ask_followup", graph_node("ask_followup", ask_followup_node))
+    workflow.add_node("execute_task", graph_node("execute_task", execute_task_node, aexecute_task_node))
+    workflow.add_node("run_task", graph_node("run_task", run_task_node, arun_task_node))
+    workflow.add_node("merge_results", graph_node("merge_results", merge_results_node))
     
     # Set entry point
     workflow.set_entry_point("extract_content")
     
     # Add edges
-    workflow.add_edge("extract_content", "classify_intent")
-    
-    # Conditional edge based on clarity
     workflow.add_conditional_edges(
-        "classify_intent",
-        should_ask_followup,
+        "extract_content",
+        route_after_extraction,
         {
-            "ask_followup": "ask_followup",
-            "execute_task": "execute_task"
+            "classify_intent": classify_node,
+            "execute_task": "execute_task",
+            "run_task": "run_task"
         }
     )
     
+    # Conditional edge based on clarity
+    if single_call:
+        workflow.add_conditional_edges(
+            classify_node,
+            route_after_single_call,
+            {
+                "ask_followup": "ask_followup",
+                "execute_task": "execute_task",
+                "done": END
+            }
+        )
+    else:
+        workflow.add_conditional_edges(
+            classify_node,
+            should_ask_followup,
+            {
+                "ask_followup": "ask_followup",
+                "execute_task": "execute_task"
+            }
+        )
+    
     # Terminal edges
-    workflow.add_edge("ask_followup", END)
+    workflow.add_edge("ask_followup", "execute_task" if checkpointer else END)
     workflow.add_edge("execute_task", END)
+    workflow.add_edge("run_task", "merge_results")
+    workflow.add_edge("merge_results", END)
     
+    if checkpointer:
+        return workflow.compile(checkpointer=checkpointer, interrupt_after=["ask_followup"])
     return workflow.compile()
 
 
@@ -64,61 +169,120 @@ def process_followup_response(
     Returns:
         Updated state with new task
     """
-    from backend.agent.state import TaskType
-    from backend.llm.config import get_llm
-    from langchain.prompts import ChatPromptTemplate
-    
-    llm = get_llm(temperature=0.1)
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """Based on the user's clarification, determine the task they want.
-
-Tasks:
-- SUMMARIZE
-- SENTIMENT
-- CODE_EXPLAIN
-- EXTRACT
-- QA
-
-Respond with just the task name."""),
-        ("user", """Original content type: {input_type}
-Original question: {clarification_question}
-User's response: {response}
-
-What task do they want?""")
-    ])
-    
-    chain = prompt | llm
-    
     try:
-        result = chain.invoke({
-            "input_type": original_state['input_type'],
-            "clarification_question": original_state.get('clarification_question', ''),
-            "response": followup_response
-        })
-        
-        task_str = result.content.strip().upper()
-        
-        # Map to task
-        task_mapping = {
-            "SUMMARIZE": TaskType.SUMMARIZE,
-            "SENTIMENT": TaskType.SENTIMENT,
-            "CODE_EXPLAIN": TaskType.CODE_EXPLAIN,
-            "EXTRACT": TaskType.EXTRACT,
-            "QA": TaskType.QA
-        }
-        
-        detected_task = task_mapping.get(task_str, TaskType.QA)
-        
-        # Update state
-        original_state['detected_task'] = detected_task.value
-        original_state['confidence'] = 1.0
-        original_state['needs_clarification'] = False
-        original_state['user_goal'] = followup_response
+        if not apply_followup_rules(original_state, followup_response):
+            result = get_chain("followup").invoke(followup_inputs(original_state, followup_response))
+            apply_followup_task(original_state, result.content, followup_response)
         
         # Execute the task
         return execute_task_node(original_state)
         
     except Exception as e:
         original_state['errors'].append(f"Follow-up processing error: {str(e)}")
-        return original_state
\ No newline at end of file
+        return original_state
+
+
+async def aprocess_followup_response(
+    original_state: AgentState,
+    followup_response: str
+) -> AgentState:
+    """Async variant of process_followup_response"""
+    try:
+        if not apply_followup_rules(original_state, followup_response):
+            result = await get_chain("followup").ainvoke(followup_inputs(original_state, followup_response))
+            apply_followup_task(original_state, result.content, followup_response)
+        
+        return await aexecute_task_node(original_state)
+        
+    except Exception as e:
+        original_state['errors'].append(f"Follow-up processing error: {str(e)}")
+        return original_state
+
+
+async def aresume_followup(
+    workflow,
+    config: Dict,
+    followup_response: str
+) -> Optional[AgentState]:
+    """
+    Resume a checkpointed thread paused at ask_followup
+    
+    Args:
+        workflow: Workflow compiled with a checkpointer
+        config: Config naming the thread
+        followup_response: User's clarification response
+        
+    Returns:
+        Final state after execute_task, or None if the thread is unknown or expired
+    """
+    snapshot = await workflow.aget_state(config)
+    if not snapshot.values:
+        return None
+    
+    state = dict(snapshot.values)
+    
+    try:
+        if not apply_followup_rules(state, followup_response):
+            result = await get_chain("followup").ainvoke(followup_inputs(state, followup_response))
+            apply_followup_task(state, result.content, followup_response)
+    except Exception as e:
+        state['errors'].append(f"Follow-up processing error: {str(e)}")
+        return state
+    
+    # Record the answer as ask_followup's output, then continue into execute_task
+    await workflow.aupdate_state(
+        config,
+        {field: state[field] for field in ("detected_task", "confidence", "needs_clarification", "user_goal", "classifier", "conversation_history")},
+        as_node="ask_followup"
+    )
+    return await workflow.ainvoke(None, config)
+
+
+def followup_inputs(original_state: AgentState, followup_response: str) -> Dict:
+    return {
+        "input_type": original_state['input_type'],
+        "clarification_question": original_state.get('clarification_question', ''),
+        "response": followup_response
+    }
+
+
+def apply_followup_rules(original_state: AgentState, followup_response: str) -> bool:
+    """Set the task from the local follow-up matcher; False means ask the LLM"""
+    if not fast_path_enabled():
+        return False
+    
+    task = classify_followup(followup_response, original_state.get('clarification_question'))
+    if task is None:
+        return False
+    
+    apply_followup_task(original_state, task.name, followup_response, classifier="rules")
+    return True
+
+
+def apply_followup_task(original_state: AgentState, content: str, followup_response: str, classifier: str = "llm"):
+    """Map the model's task name onto the state (QA when unrecognized)"""
+    task_str = content.strip().upper()
+    
+    # Map to task
+    task_mapping = {
+        "SUMMARIZE": TaskType.SUMMARIZE,
+        "SENTIMENT": TaskType.SENTIMENT,
+        "CODE_EXPLAIN": TaskType.CODE_EXPLAIN,
+        "EXTRACT": TaskType.EXTRACT,
+        "QA": TaskType.QA
+    }
+    
+    detected_task = task_mapping.get(task_str, TaskType.QA)
+    
+    # Update state
+    original_state['detected_task'] = detected_task.value
+    original_state['confidence'] = 1.0
+    original_state['needs_clarification'] = False
+    original_state['user_goal'] = followup_response
+    original_state['conversation_history'] = [
+        *(original_state.get('conversation_history') or []),
+        {"role": "assistant", "content": original_state.get('clarification_question') or ""},
+        {"role": "user", "content": followup_response}
+    ]
+    original_state['classifier'] = classifier
+    INTENT_CLASSIFICATIONS.labels(f"followup_{classifier}", detected_task.value).inc()
\ No newline at end of file
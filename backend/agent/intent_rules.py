@@ -0,0 +1,147 @@
+"""
+Rule-Based Intent Classifier
+Applies the classifier prompt's keyword guidelines locally so requests with
+an obvious intent skip the LLM round-trip; anything ambiguous returns None
+and goes to the LLM classifier
+"""
+
+from typing import Dict, Optional, Union
+import os
+import re
+
+from backend.agent.artifacts import TextView
+from backend.agent.state import InputType, TaskType
+from backend.extractors.ocr import detect_code_in_text
+
+
+# Only the start of the text is treated as the user's instruction; keywords
+# deeper in pasted content are not
+INSTRUCTION_WINDOW_CHARS = int(os.getenv("INTENT_RULE_WINDOW_CHARS", "200"))
+
+# Explicit questions are only trusted in short messages
+QUESTION_MAX_CHARS = int(os.getenv("INTENT_RULE_QUESTION_MAX_CHARS", "500"))
+
+KEYWORD_RULES = [
+    (TaskType.SUMMARIZE, re.compile(r"\b(summari[sz]e|summary|tl;?dr)\b", re.IGNORECASE)),
+    (TaskType.SENTIMENT, re.compile(r"\b(sentiment|feelings?)\b", re.IGNORECASE)),
+    (TaskType.EXTRACT, re.compile(r"\baction[ -]items?\b", re.IGNORECASE)),
+]
+
+EXPLAIN_PATTERN = re.compile(r"\bexplain\b", re.IGNORECASE)
+
+KEYWORD_CONFIDENCE = 0.9
+QUESTION_CONFIDENCE = 0.85
+
+# Follow-up replies: longer replies are left to the LLM
+FOLLOWUP_MAX_CHARS = int(os.getenv("FOLLOWUP_RULE_MAX_CHARS", "200"))
+
+# Keywords and synonyms a clarification reply picks a task with; the same
+# patterns find the options a clarification question offered
+FOLLOWUP_RULES = [
+    (TaskType.SUMMARIZE, re.compile(
+        r"\b(summar\w*|tl;?dr|recap|overview|gist|sum (it )?up|(key|main) points|short version)\b", re.IGNORECASE)),
+    (TaskType.SENTIMENT, re.compile(
+        r"\b(sentiment|feelings?|feel|tone|mood|emotions?|positive or negative)\b", re.IGNORECASE)),
+    (TaskType.CODE_EXPLAIN, re.compile(
+        r"\b(explain\w*|walk me through|what (does|do) (this|the|it) (code|snippet|function)\w*)\b", re.IGNORECASE)),
+    (TaskType.EXTRACT, re.compile(
+        r"\b(action[ -]items?|to-?dos?|next steps|follow-?ups|deadlines|extract\w*)\b", re.IGNORECASE)),
+    (TaskType.QA, re.compile(r"\b(answer a question|questions?|ask)\b", re.IGNORECASE)),
+]
+
+# "Yes" to a question that offered one thing picks that offer
+AFFIRMATIVE_PATTERN = re.compile(
+    r"^\s*(yes|yeah|yep|sure|ok(ay)?|please( do)?|go ahead|do it|sounds good)\b[\s.!,]*(please|thanks?( you)?)?[\s.!]*$",
+    re.IGNORECASE
+)
+
+# Negated replies ("not a summary") are left to the LLM
+NEGATION_PATTERN = re.compile(r"\b(no|not|don'?t|doesn'?t|without|instead|rather than)\b", re.IGNORECASE)
+
+
+def fast_path_enabled() -> bool:
+    return os.getenv("INTENT_FAST_PATH", "true").lower() in ("1", "true", "yes")
+
+
+def classify_by_rules(text: Union[str, TextView], input_type: str) -> Optional[Dict]:
+    """
+    Classify typed text whose intent is unambiguous
+
+    Extracted content (image, PDF, audio, YouTube) carries no instruction,
+    so it always goes to the LLM.
+
+    Args:
+        text: The user's text (only its start is copied)
+        input_type: Input type of the request
+
+    Returns:
+        Dict with task, confidence and reasoning, or None when the rules
+        do not give exactly one answer
+    """
+    if input_type != InputType.TEXT or not text:
+        return None
+
+    view = TextView(text) if isinstance(text, str) else text
+    stripped = view.strip()
+    if not stripped:
+        return None
+    instruction = stripped.preview(INSTRUCTION_WINDOW_CHARS)
+
+    matched = [(task, rule.search(instruction)) for task, rule in KEYWORD_RULES]
+    matched = [(task, match) for task, match in matched if match]
+
+    if EXPLAIN_PATTERN.search(instruction) and detect_code_in_text(str(view))["is_code"]:
+        matched.append((TaskType.CODE_EXPLAIN, EXPLAIN_PATTERN.search(instruction)))
+
+    if len(matched) > 1:
+        return None
+
+    if matched:
+        task, match = matched[0]
+        return {
+            "task": task,
+            "confidence": KEYWORD_CONFIDENCE,
+            "reasoning": f"The request mentions \"{match.group(0).lower()}\"."
+        }
+
+    if stripped.endswith("?") and len(stripped) <= QUESTION_MAX_CHARS:
+        return {
+            "task": TaskType.QA,
+            "confidence": QUESTION_CONFIDENCE,
+            "reasoning": "The user asked an explicit question."
+        }
+
+    return None
+
+
+def classify_followup(reply: str, question: Optional[str] = "") -> Optional[TaskType]:
+    """
+    Map a reply to a clarification question onto a task
+
+    Args:
+        reply: The user's answer
+        question: The clarification question that was asked
+
+    Returns:
+        The task, or None when the reply is ambiguous (negated, naming
+        several tasks, or matching nothing) and the LLM should decide
+    """
+    reply = (reply or "").strip()
+    if not reply or len(reply) > FOLLOWUP_MAX_CHARS:
+        return None
+
+    if AFFIRMATIVE_PATTERN.match(reply):
+        # The first option the question offered, e.g. "Would you like a summary, or something else?"
+        offered = [(match.start(), task) for task, rule in FOLLOWUP_RULES
+                   for match in [rule.search(question or "")] if match]
+        return min(offered, key=lambda option: option[0])[1] if offered else None
+
+    if NEGATION_PATTERN.search(reply):
+        return None
+
+    matched = {task for task, rule in FOLLOWUP_RULES if rule.search(reply)}
+    if len(matched) == 1:
+        return matched.pop()
+    if not matched and reply.endswith("?"):
+        return TaskType.QA
+    return None
@@ -1,14 +1,64 @@
+from typing import Dict, Optional, Tuple
 from backend.agent.state import AgentState, TaskType, InputType
+from backend.agent.artifacts import content_digest, resolve, text_view
+from backend.extractors import ocr, pdf, audio
 from backend.extractors.ocr import extract_text_from_image, detect_code_in_text
 from backend.extractors.pdf import extract_text_from_pdf
 from backend.extractors.audio import extract_text_from_audio
 from backend.extractors.youtube import extract_youtube_transcript, extract_youtube_video_id, detect_youtube_url
-from backend.tasks.summarize import summarize_text
-from backend.tasks.sentiment import analyze_sentiment
-from backend.tasks.code_explain import explain_code
-from backend.tasks.qa import answer_question, extract_action_items
+from backend.tasks.summarize import summarize_text, asummarize_text
+from backend.tasks.sentiment import analyze_sentiment, aanalyze_sentiment
+from backend.tasks.code_explain import explain_code, aexplain_code
+from backend.tasks.qa import answer_question, extract_action_items, aanswer_question, aextract_action_items
 from langchain.prompts import ChatPromptTemplate
-from backend.llm.config import get_llm
+from backend.llm.config import get_chain, register_chain
+from backend.services.upload_store import get_upload_store
+from backend.services.executors import get_extractor_executor
+from backend.services.metrics import INTENT_CLASSIFICATIONS
+from backend.services.tracing import span
+from backend.agent.intent_rules import classify_by_rules, fast_path_enabled
+import asyncio
+import contextvars
+import functools
+import os
+
+
+CLASSIFY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an intent classifier for an AI agent.
+Analyze the extracted content and determine what the user wants to do.
+
+Possible tasks:
+1. SUMMARIZE - User wants a summary of the content
+2. SENTIMENT - User wants sentiment analysis
+3. CODE_EXPLAIN - User wants code explained (if content contains code)
+4. EXTRACT - User wants specific information extracted (e.g., action items)
+5. QA - User has a question or wants conversational response
+6. UNCLEAR - Cannot determine intent confidently
+
+Respond in this EXACT format:
+TASK: [task name from above]
+CONFIDENCE: [0.0-1.0]
+REASONING: [one sentence why]
+NEEDS_CLARIFICATION: [yes/no]
+CLARIFICATION_QUESTION: [question to ask if needs clarification, otherwise "none"]
+
+Guidelines:
+- If content is extracted from audio/pdf/image without clear instruction, confidence should be < 0.6
+- If user asks explicit question, task is QA with high confidence
+- If "summarize" or "summary" mentioned, task is SUMMARIZE
+- If "sentiment" or "feeling" mentioned, task is SENTIMENT
+- If code is detected and user says "explain", task is CODE_EXPLAIN
+- If asking for "action items" or specific extraction, task is EXTRACT
+- Set NEEDS_CLARIFICATION to yes if confidence < 0.7 or task is ambiguous"""),
+    ("user", """{context}
+
+Extracted content:
+{text}
+
+What does the user want?""")
+])
+
+register_chain("classify", CLASSIFY_PROMPT, route="classify")
 
 
 def extract_content_node(state: AgentState) -> AgentState:
@@ -16,27 +66,32 @@ def extract_content_node(state: AgentState) -> AgentState:
     print(f"[NODE] Extracting content from {state['input_type']}")
     
     try:
+        artifacts = state['artifacts']
+        
         if state['input_type'] == InputType.TEXT:
             # Check if text contains YouTube URL
-            text = state['raw_input']
+            text = resolve(state, 'raw_input')
             if detect_youtube_url(text):
                 video_id = extract_youtube_video_id(text)
                 if video_id:
                     # Extract YouTube transcript
-                    transcript, metadata = extract_youtube_transcript(video_id)
-                    state['extracted_text'] = transcript
+                    with span("extractor.youtube", video_id=video_id) as attributes:
+                        transcript, metadata = extract_youtube_transcript(video_id)
+                        attributes["output_chars"] = len(transcript)
+                    state['extracted_text'] = artifacts.put(transcript, "extracted_text")
                     state['extraction_metadata'] = metadata
                     state['input_type'] = InputType.YOUTUBE
                 else:
-                    state['extracted_text'] = text
+                    # The input is the content: share its artifact
+                    state['extracted_text'] = state['raw_input']
                     state['extraction_metadata'] = {"method": "direct_text"}
             else:
-                state['extracted_text'] = text
+                state['extracted_text'] = state['raw_input']
                 state['extraction_metadata'] = {"method": "direct_text"}
                 
         elif state['input_type'] == InputType.IMAGE:
-            text, metadata = extract_text_from_image(state['file_path'])
-            state['extracted_text'] = text
+            text, metadata = extract_file(state, "image", ocr.EXTRACTOR_VERSION, extract_text_from_image)
+            state['extracted_text'] = artifacts.put(text, "extracted_text", upload_digest(state, "image", ocr.EXTRACTOR_VERSION))
             state['extraction_metadata'] = metadata
             
             # Check if image contains code
@@ -44,13 +99,13 @@ def extract_content_node(state: AgentState) -> AgentState:
             state['extraction_metadata']['code_detection'] = code_detection
             
         elif state['input_type'] == InputType.PDF:
-            text, metadata = extract_text_from_pdf(state['file_path'])
-            state['extracted_text'] = text
+            text, metadata = extract_file(state, "pdf", pdf.EXTRACTOR_VERSION, extract_text_from_pdf)
+            state['extracted_text'] = artifacts.put(text, "extracted_text", upload_digest(state, "pdf", pdf.EXTRACTOR_VERSION))
             state['extraction_metadata'] = metadata
             
         elif state['input_type'] == InputType.AUDIO:
-            text, metadata = extract_text_from_audio(state['file_path'])
-            state['extracted_text'] = text
+            text, metadata = extract_file(state, "audio", audio.EXTRACTOR_VERSION, extract_text_from_audio)
+            state['extracted_text'] = artifacts.put(text, "extracted_text", upload_digest(state, "audio", audio.EXTRACTOR_VERSION))
             state['extraction_metadata'] = metadata
             
         state['current_step'] = 'content_extracted'
@@ -63,12 +118,96 @@ def extract_content_node(state: AgentState) -> AgentState:
     return state
 
 
+def extract_file(state: AgentState, kind: str, version: str, extractor) -> Tuple[str, Dict]:
+    """Run a file extractor through the upload store's extraction cache, in a span"""
+    try:
+        input_bytes = os.path.getsize(state['file_path'])
+    except (OSError, TypeError):
+        input_bytes = None
+    
+    with span(f"extractor.{kind}", input_bytes=input_bytes) as attributes:
+        text, metadata = get_upload_store().cached_extraction(state['file_path'], kind, version, extractor)
+        attributes["output_chars"] = len(text)
+        attributes["cached"] = bool(metadata.get("extraction_cached"))
+    
+    return text, metadata
+
+
+def upload_digest(state: AgentState, kind: str, version: str) -> Optional[str]:
+    """Content key of text extracted from a stored upload: its blob hash plus the extractor"""
+    content_hash = get_upload_store().hash_for_path(state['file_path'] or "")
+    return f"{content_hash}.{kind}.{version}" if content_hash else None
+
+
+async def aextract_content_node(state: AgentState) -> AgentState:
+    """Async variant: blocking extractors run on the extractor thread pool"""
+    if state['input_type'] == InputType.TEXT and not detect_youtube_url(resolve(state, 'raw_input')):
+        return extract_content_node(state)
+    
+    # Carry the current trace span into the pool thread
+    loop = asyncio.get_running_loop()
+    run = functools.partial(contextvars.copy_context().run, extract_content_node, state)
+    return await loop.run_in_executor(get_extractor_executor(), run)
+
+
 def classify_intent_node(state: AgentState) -> AgentState:
     """Classify user intent and determine task type"""
     print("[NODE] Classifying intent")
     
-    llm = get_llm(temperature=0.1)
+    if apply_rule_classification(state):
+        return state
+    
+    chain = get_chain("classify")
+    
+    try:
+        response = chain.invoke(classify_inputs(chain, state))
+        apply_classification(state, response.content)
+    except Exception as e:
+        classification_failed(state, e)
+    
+    return state
+
+
+async def aclassify_intent_node(state: AgentState) -> AgentState:
+    """Async variant of classify_intent_node"""
+    print("[NODE] Classifying intent")
+    
+    if apply_rule_classification(state):
+        return state
     
+    chain = get_chain("classify")
+    
+    try:
+        response = await chain.ainvoke(classify_inputs(chain, state))
+        apply_classification(state, response.content)
+    except Exception as e:
+        classification_failed(state, e)
+    
+    return state
+
+
+def apply_rule_classification(state: AgentState) -> bool:
+    """Set the task from the local rules when they are confident; False means ask the LLM"""
+    if not fast_path_enabled():
+        return False
+    
+    match = classify_by_rules(text_view(state), state['input_type'])
+    if match is None:
+        return False
+    
+    state['detected_task'] = match['task'].value
+    state['confidence'] = match['confidence']
+    state['user_goal'] = match['reasoning']
+    state['needs_clarification'] = False
+    state['clarification_question'] = ""
+    state['classifier'] = "rules"
+    state['current_step'] = 'intent_classified'
+    INTENT_CLASSIFICATIONS.labels("rules", match['task'].value).inc()
+    return True
+
+
+def classify_inputs(chain, state: AgentState) -> Dict:
+    """Prompt inputs: a sentence about the input type plus the trimmed content"""
     # Build context about the input
     context_parts = []
     if state['input_type'] == InputType.IMAGE:
@@ -83,107 +222,68 @@ def classify_intent_node(state: AgentState) -> AgentState:
     elif state['input_type'] == InputType.YOUTUBE:
         context_parts.append("User provided a YouTube URL.")
     
-    context = " ".join(context_parts)
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an intent classifier for an AI agent.
-Analyze the extracted content and determine what the user wants to do.
+    inputs = {"context": " ".join(context_parts), "text": text_view(state)}
+    inputs["text"] = chain.fit_input(inputs, "text")
+    return inputs
 
-Possible tasks:
-1. SUMMARIZE - User wants a summary of the content
-2. SENTIMENT - User wants sentiment analysis
-3. CODE_EXPLAIN - User wants code explained (if content contains code)
-4. EXTRACT - User wants specific information extracted (e.g., action items)
-5. QA - User has a question or wants conversational response
-6. UNCLEAR - Cannot determine intent confidently
 
-Respond in this EXACT format:
-TASK: [task name from above]
-CONFIDENCE: [0.0-1.0]
-REASONING: [one sentence why]
-NEEDS_CLARIFICATION: [yes/no]
-CLARIFICATION_QUESTION: [question to ask if needs clarification, otherwise "none"]
-
-Guidelines:
-- If content is extracted from audio/pdf/image without clear instruction, confidence should be < 0.6
-- If user asks explicit question, task is QA with high confidence
-- If "summarize" or "summary" mentioned, task is SUMMARIZE
-- If "sentiment" or "feeling" mentioned, task is SENTIMENT
-- If code is detected and user says "explain", task is CODE_EXPLAIN
-- If asking for "action items" or specific extraction, task is EXTRACT
-- Set NEEDS_CLARIFICATION to yes if confidence < 0.7 or task is ambiguous"""),
-        ("user", """{context}
-
-Extracted content:
-{text}
-
-What does the user want?""")
-    ])
+def apply_classification(state: AgentState, content: str):
+    """Parse the classifier response into the state"""
+    lines = content.strip().split('\n')
     
-    chain = prompt | llm
+    task = TaskType.UNCLEAR
+    confidence = 0.5
+    reasoning = ""
+    needs_clarification = True
+    clarification_question = ""
     
-    try:
-        response = chain.invoke({
-            "context": context,
-            "text": state['extracted_text'][:1500]  # Limit text
-        })
-        
-        # Parse response
-        content = response.content
-        lines = content.strip().split('\n')
-        
-        task = TaskType.UNCLEAR
-        confidence = 0.5
-        reasoning = ""
-        needs_clarification = True
-        clarification_question = ""
-        
-        for line in lines:
-            line = line.strip()
-            if line.startswith("TASK:"):
-                task_str = line.replace("TASK:", "").strip().upper()
-                # Map to TaskType
-                task_mapping = {
-                    "SUMMARIZE": TaskType.SUMMARIZE,
-                    "SENTIMENT": TaskType.SENTIMENT,
-                    "CODE_EXPLAIN": TaskType.CODE_EXPLAIN,
-                    "EXTRACT": TaskType.EXTRACT,
-                    "QA": TaskType.QA,
-                    "UNCLEAR": TaskType.UNCLEAR
-                }
-                task = task_mapping.get(task_str, TaskType.UNCLEAR)
-                
-            elif line.startswith("CONFIDENCE:"):
-                try:
-                    confidence = float(line.replace("CONFIDENCE:", "").strip())
-                except:
-                    confidence = 0.5
-                    
-            elif line.startswith("REASONING:"):
-                reasoning = line.replace("REASONING:", "").strip()
-                
-            elif line.startswith("NEEDS_CLARIFICATION:"):
-                needs_clarification = "yes" in line.lower()
+    for line in lines:
+        line = line.strip()
+        if line.startswith("TASK:"):
+            task_str = line.replace("TASK:", "").strip().upper()
+            # Map to TaskType
+            task_mapping = {
+                "SUMMARIZE": TaskType.SUMMARIZE,
+                "SENTIMENT": TaskType.SENTIMENT,
+                "CODE_EXPLAIN": TaskType.CODE_EXPLAIN,
+                "EXTRACT": TaskType.EXTRACT,
+                "QA": TaskType.QA,
+                "UNCLEAR": TaskType.UNCLEAR
+            }
+            task = task_mapping.get(task_str, TaskType.UNCLEAR)
+            
+        elif line.startswith("CONFIDENCE:"):
+            try:
+                confidence = float(line.replace("CONFIDENCE:", "").strip())
+            except:
+                confidence = 0.5
                 
-            elif line.startswith("CLARIFICATION_QUESTION:"):
-                clarification_question = line.replace("CLARIFICATION_QUESTION:", "").strip()
-                if clarification_question.lower() == "none":
-                    clarification_question = ""
-        
-        state['detected_task'] = task.value
-        state['confidence'] = confidence
-        state['user_goal'] = reasoning
-        state['needs_clarification'] = needs_clarification
-        state['clarification_question'] = clarification_question if clarification_question else generate_fallback_question(task, state)
-        state['current_step'] = 'intent_classified'
-        
-    except Exception as e:
-        state['errors'].append(f"Intent classification error: {str(e)}")
-        state['needs_clarification'] = True
-        state['clarification_question'] = "I extracted the content, but I'm not sure what you'd like me to do with it. Could you clarify?"
-        state['current_step'] = 'classification_failed'
+        elif line.startswith("REASONING:"):
+            reasoning = line.replace("REASONING:", "").strip()
+            
+        elif line.startswith("NEEDS_CLARIFICATION:"):
+            needs_clarification = "yes" in line.lower()
+            
+        elif line.startswith("CLARIFICATION_QUESTION:"):
+            clarification_question = line.replace("CLARIFICATION_QUESTION:", "").strip()
+            if clarification_question.lower() == "none":
+                clarification_question = ""
     
-    return state
+    state['detected_task'] = task.value
+    state['confidence'] = confidence
+    state['user_goal'] = reasoning
+    state['needs_clarification'] = needs_clarification
+    state['clarification_question'] = clarification_question if clarification_question else generate_fallback_question(task, state)
+    state['classifier'] = "llm"
+    state['current_step'] = 'intent_classified'
+    INTENT_CLASSIFICATIONS.labels("llm", task.value).inc()
+
+
+def classification_failed(state: AgentState, e: Exception):
+    state['errors'].append(f"Intent classification error: {str(e)}")
+    state['needs_clarification'] = True
+    state['clarification_question'] = "I extracted the content, but I'm not sure what you'd like me to do with it. Could you clarify?"
+    state['current_step'] = 'classification_failed'
 
 
 def generate_fallback_question(task: TaskType, state: AgentState) -> str:
@@ -205,60 +305,143 @@ def generate_fallback_question(task: TaskType, state: AgentState) -> str:
     return "What would you like me to do with this content?"
 
 
+# Task functions as (sync, async) pairs
+TASK_FUNCTIONS = {
+    TaskType.SUMMARIZE.value: (summarize_text, asummarize_text),
+    TaskType.SENTIMENT.value: (analyze_sentiment, aanalyze_sentiment),
+    TaskType.CODE_EXPLAIN.value: (explain_code, aexplain_code),
+    TaskType.EXTRACT.value: (extract_action_items, aextract_action_items),
+    TaskType.QA.value: (answer_question, aanswer_question),
+}
+
+
+def task_arguments(state: AgentState) -> Tuple:
+    """
+    Positional arguments for the detected task's function
+    
+    The content is passed as a TextView; tasks trim it to their token budget
+    before it is ever copied.
+    """
+    task = state['detected_task']
+    text = text_view(state)
+    
+    if task == TaskType.CODE_EXPLAIN.value:
+        return (text, state['extraction_metadata'].get('code_detection', {}).get('language'))
+    if task == TaskType.QA.value:
+        return (qa_question(state), text, content_digest(state))
+    return (text,)
+
+
+def qa_question(state: AgentState) -> str:
+    """
+    The question a QA run answers
+    
+    Pasted text carries its own question. An uploaded file, image, recording
+    or video has none, so the user's latest follow-up reply is the question.
+    """
+    if state['input_type'] == InputType.TEXT:
+        return resolve(state, 'raw_input') or ''
+    replies = [turn['content'] for turn in state.get('conversation_history') or [] if turn.get('role') == 'user']
+    return replies[-1] if replies else ''
+
+
 def execute_task_node(state: AgentState) -> AgentState:
     """Execute the determined task"""
     print(f"[NODE] Executing task: {state['detected_task']}")
     
     try:
         task = state['detected_task']
-        text = state['extracted_text']
-        metadata = state['extraction_metadata']
+        if task in TASK_FUNCTIONS:
+            run, _ = TASK_FUNCTIONS[task]
+            store_task_result(state, run(*task_arguments(state)))
+        elif task == TaskType.YOUTUBE_TRANSCRIPT.value:
+            store_task_result(state, None)
         
-        if task == TaskType.SUMMARIZE.value:
-            result = summarize_text(text)
-            result['metadata'] = metadata
-            state['result'] = result
-            
-        elif task == TaskType.SENTIMENT.value:
-            result = analyze_sentiment(text)
-            state['result'] = result
-            
-        elif task == TaskType.CODE_EXPLAIN.value:
-            language = metadata.get('code_detection', {}).get('language')
-            result = explain_code(text, language)
-            state['result'] = result
-            
-        elif task == TaskType.EXTRACT.value:
-            # Check if user wants action items
-            if "action" in state.get('user_goal', '').lower():
-                result = extract_action_items(text)
-            else:
-                result = extract_action_items(text)
-            state['result'] = result
-            
-        elif task == TaskType.QA.value:
-            question = state.get('raw_input', '')
-            result = answer_question(question, text)
-            state['result'] = result
-            
+        state['current_step'] = 'task_completed'
+        
+    except Exception as e:
+        task_failed(state, e)
+    
+    return state
+
+
+async def aexecute_task_node(state: AgentState) -> AgentState:
+    """Async variant of execute_task_node"""
+    print(f"[NODE] Executing task: {state['detected_task']}")
+    
+    try:
+        task = state['detected_task']
+        if task in TASK_FUNCTIONS:
+            _, arun = TASK_FUNCTIONS[task]
+            store_task_result(state, await arun(*task_arguments(state)))
         elif task == TaskType.YOUTUBE_TRANSCRIPT.value:
-            # Just return the transcript with metadata
-            state['result'] = {
-                "success": True,
-                "transcript": text,
-                "metadata": metadata
-            }
+            store_task_result(state, None)
         
         state['current_step'] = 'task_completed'
         
     except Exception as e:
-        state['errors'].append(f"Task execution error: {str(e)}")
-        state['result'] = {
-            "success": False,
-            "error": str(e)
+        task_failed(state, e)
+    
+    return state
+
+
+def store_task_result(state: AgentState, result: Optional[Dict]):
+    task = state['detected_task']
+    metadata = state['extraction_metadata']
+    
+    if task == TaskType.SUMMARIZE.value:
+        result['metadata'] = metadata
+    elif task == TaskType.YOUTUBE_TRANSCRIPT.value:
+        # Just return the transcript with metadata
+        result = {
+            "success": True,
+            "transcript": str(text_view(state)),
+            "metadata": metadata
         }
-        state['current_step'] = 'execution_failed'
     
+    state['result'] = result
+
+
+def task_failed(state: AgentState, e: Exception):
+    state['errors'].append(f"Task execution error: {str(e)}")
+    state['result'] = {
+        "success": False,
+        "error": str(e)
+    }
+    state['current_step'] = 'execution_failed'
+
+
+def task_branch(state: AgentState) -> AgentState:
+    """Private copy of the state for one parallel task branch"""
+    return {**state, 'errors': [], 'result': None}
+
+
+def run_task_node(state: AgentState) -> Dict:
+    """Run one of several requested tasks; receives the state with detected_task set by the fan-out"""
+    branch = execute_task_node(task_branch(state))
+    return {"task_results": {branch['detected_task']: branch['result']}}
+
+
+async def arun_task_node(state: AgentState) -> Dict:
+    """Async variant of run_task_node"""
+    branch = await aexecute_task_node(task_branch(state))
+    return {"task_results": {branch['detected_task']: branch['result']}}
+
+
+def merge_results_node(state: AgentState) -> AgentState:
+    """Combine the parallel task results into one result, in the order the tasks were requested"""
+    print(f"[NODE] Merging results of {len(state['tasks'])} tasks")
+    
+    results = {task: state['task_results'].get(task) for task in state['tasks']}
+    for task, result in results.items():
+        if result and result.get('success') is False:
+            state['errors'].append(f"Task execution error ({task}): {result.get('error')}")
+    
+    state['result'] = {
+        "success": all(result and result.get('success', True) for result in results.values()),
+        "tasks": results
+    }
+    state['current_step'] = 'task_completed'
     return state
 
 
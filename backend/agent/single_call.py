@@ -0,0 +1,216 @@
+"""
+Single-Call Mode
+One LLM call that both classifies the request and produces the task's
+output, instead of a classify call followed by a task call. Opt in with
+SINGLE_CALL_MODE=true.
+"""
+
+from typing import Optional, Tuple
+import os
+
+from langchain.prompts import ChatPromptTemplate
+
+from backend.agent.state import AgentState, TaskType
+from backend.agent.artifacts import text_view
+from backend.agent.nodes import (
+    apply_rule_classification,
+    apply_classification,
+    classification_failed,
+    classify_inputs,
+    store_task_result
+)
+from backend.llm.config import get_chain, register_chain
+from backend.tasks.summarize import summary_result
+from backend.tasks.sentiment import sentiment_result
+from backend.tasks.code_explain import code_result
+from backend.tasks.qa import qa_result, action_items_result
+
+
+OUTPUT_MARKER = "OUTPUT:"
+
+# Header a structured task output must contain to be used; their parsers
+# fill in defaults for anything missing, so they never fail on their own
+REQUIRED_OUTPUT_HEADERS = {
+    TaskType.SUMMARIZE.value: "ONE-LINE:",
+    TaskType.SENTIMENT.value: "SENTIMENT:",
+    TaskType.CODE_EXPLAIN.value: "EXPLANATION:",
+}
+
+CLASSIFY_EXECUTE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an AI agent. Decide what the user wants done with the content, then do it.
+
+Possible tasks:
+1. SUMMARIZE - User wants a summary of the content
+2. SENTIMENT - User wants sentiment analysis
+3. CODE_EXPLAIN - User wants code explained (if content contains code)
+4. EXTRACT - User wants action items extracted
+5. QA - User has a question or wants conversational response
+6. UNCLEAR - Cannot determine intent confidently
+
+Start your response with these lines in this EXACT format:
+TASK: [task name from above]
+CONFIDENCE: [0.0-1.0]
+REASONING: [one sentence why]
+NEEDS_CLARIFICATION: [yes/no]
+CLARIFICATION_QUESTION: [question to ask if needs clarification, otherwise "none"]
+
+Guidelines:
+- If content is extracted from audio/pdf/image without clear instruction, confidence should be < 0.6
+- If user asks explicit question, task is QA with high confidence
+- If "summarize" or "summary" mentioned, task is SUMMARIZE
+- If "sentiment" or "feeling" mentioned, task is SENTIMENT
+- If code is detected and user says "explain", task is CODE_EXPLAIN
+- If asking for "action items" or specific extraction, task is EXTRACT
+- Set NEEDS_CLARIFICATION to yes if confidence < 0.7 or task is ambiguous
+
+If NEEDS_CLARIFICATION is no, add a line containing only "OUTPUT:" and then the task's output:
+
+SUMMARIZE:
+ONE-LINE: [one sentence, max 20 words]
+
+BULLETS:
+• [bullet point 1]
+• [bullet point 2]
+• [bullet point 3]
+
+FIVE-SENTENCES:
+[sentence 1] [sentence 2] [sentence 3] [sentence 4] [sentence 5]
+
+SENTIMENT:
+SENTIMENT: [positive/negative/neutral]
+CONFIDENCE: [0.0-1.0]
+JUSTIFICATION: [one clear sentence]
+
+CODE_EXPLAIN:
+EXPLANATION:
+[2-3 sentence explanation]
+
+BUGS:
+- [Bug or issue] OR No obvious bugs detected
+
+COMPLEXITY:
+Time: O(...)
+Space: O(...)
+
+EXTRACT:
+A numbered list of action items (what, who, deadline if mentioned), or "No specific action items found."
+
+QA:
+A clear, concise answer.
+
+If NEEDS_CLARIFICATION is yes, stop after CLARIFICATION_QUESTION."""),
+    ("user", """{context}
+
+Extracted content:
+{text}
+
+What does the user want? Decide, then respond.""")
+])
+
+register_chain("classify_execute", CLASSIFY_EXECUTE_PROMPT, route="classify_execute")
+
+
+def single_call_enabled() -> bool:
+    return os.getenv("SINGLE_CALL_MODE", "false").lower() in ("1", "true", "yes")
+
+
+def split_response(content: str) -> Tuple[str, Optional[str]]:
+    """Split into the classification header and the task output (None if absent)"""
+    header, marker, output = content.partition(f"\n{OUTPUT_MARKER}")
+    if not marker:
+        return content, None
+    output = output.strip()
+    return header, output or None
+
+
+def result_from_output(state: AgentState, output: str) -> Optional[dict]:
+    """Parse task output with the task's own parser; None for tasks without one or malformed output"""
+    task = state['detected_task']
+
+    header = REQUIRED_OUTPUT_HEADERS.get(task)
+    if header is not None and header not in output:
+        return None
+
+    if task == TaskType.SUMMARIZE.value:
+        return summary_result(output, {}, None)
+    if task == TaskType.SENTIMENT.value:
+        return sentiment_result(output, "", None)
+    if task == TaskType.CODE_EXPLAIN.value:
+        language = state['extraction_metadata'].get('code_detection', {}).get('language')
+        return code_result(output, language)
+    if task == TaskType.EXTRACT.value:
+        return action_items_result(output)
+    if task == TaskType.QA.value:
+        return qa_result(output, {}, None)
+    return None
+
+
+def prompt_truncated(state: AgentState, inputs: dict) -> bool:
+    """Whether the prompt only held a prefix of the content"""
+    return len(inputs["text"]) < len(text_view(state).strip())
+
+
+def apply_single_call(state: AgentState, content: str, truncated: bool = False):
+    """
+    Classify from the header; store the result only when the task is confidently decided
+
+    Output over a truncated prompt is dropped, so execute_task runs the task
+    with its long-document handling (map-reduce summaries, retrieval QA).
+    """
+    header, output = split_response(content)
+    apply_classification(state, header)
+
+    if state['needs_clarification'] or state['confidence'] < 0.7 or output is None or truncated:
+        return
+
+    result = result_from_output(state, output)
+    if result is not None:
+        store_task_result(state, result)
+        state['current_step'] = 'task_completed'
+
+
+def classify_and_execute_node(state: AgentState) -> AgentState:
+    """Classify and run the task in one LLM call"""
+    print("[NODE] Classifying and executing in one call")
+
+    if apply_rule_classification(state):
+        return state
+
+    chain = get_chain("classify_execute")
+
+    try:
+        inputs = classify_inputs(chain, state)
+        response = chain.invoke(inputs)
+        apply_single_call(state, response.content, prompt_truncated(state, inputs))
+    except Exception as e:
+        classification_failed(state, e)
+
+    return state
+
+
+async def aclassify_and_execute_node(state: AgentState) -> AgentState:
+    """Async variant of classify_and_execute_node"""
+    print("[NODE] Classifying and executing in one call")
+
+    if apply_rule_classification(state):
+        return state
+
+    chain = get_chain("classify_execute")
+
+    try:
+        inputs = classify_inputs(chain, state)
+        response = await chain.ainvoke(inputs)
+        apply_single_call(state, response.content, prompt_truncated(state, inputs))
+    except Exception as e:
+        classification_failed(state, e)
+
+    return state
+
+
+def route_after_single_call(state: AgentState) -> str:
+    """Ask for clarification, finish if the result is in, otherwise run the task separately"""
+    if state['needs_clarification'] or state['confidence'] < 0.7:
+        return "ask_followup"
+    if state.get('current_step') == 'task_completed':
+        return "done"
+    return "execute_task"
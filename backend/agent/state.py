@@ -1,6 +1,9 @@
-from typing import TypedDict, Optional, List, Any, Dict
+from typing import TypedDict, Optional, List, Any, Dict, Annotated
 from enum import Enum
 
+from backend.agent.artifacts import ArtifactStore
+from backend.services.tracing import Trace, start_trace
+
 
 class InputType(str, Enum):
     TEXT = "text"
@@ -20,16 +23,22 @@ class TaskType(str, Enum):
     UNCLEAR = "unclear"
 
 
+def merge_task_results(current: Optional[Dict], update: Optional[Dict]) -> Dict:
+    """Reducer for results written by parallel task branches"""
+    return {**(current or {}), **(update or {})}
+
+
 class AgentState(TypedDict):
     """State for the agent workflow"""
     
     # Input information
     input_type: str  # Type of input received
-    raw_input: Any  # Original input (text, file path, etc.)
+    raw_input: Any  # Original input; text is a handle into `artifacts`
     file_path: Optional[str]  # Path to uploaded file if any
+    artifacts: ArtifactStore  # Large payloads of this request, referenced by handle
     
     # Extracted content
-    extracted_text: str  # Text extracted from any input type
+    extracted_text: str  # Handle of the extracted text (read with artifacts.text_view)
     extraction_metadata: Dict  # OCR confidence, duration, etc.
     
     # Intent and planning
@@ -38,9 +47,12 @@ class AgentState(TypedDict):
     confidence: float  # Confidence in intent detection (0-1)
     needs_clarification: bool  # Whether follow-up needed
     clarification_question: Optional[str]  # The question to ask
+    classifier: Optional[str]  # How the task was chosen: "rules", "llm" or "preset"
     
     # Execution
     task_plan: Optional[str]  # Plan for executing the task
+    tasks: List[str]  # Tasks named by the request; more than one run in parallel
+    task_results: Annotated[Dict[str, Dict], merge_task_results]  # Per-task results of a parallel run
     result: Optional[Dict]  # Final result
     
     # Conversation management
@@ -50,29 +62,52 @@ class AgentState(TypedDict):
     # Error handling
     errors: List[str]  # Any errors encountered
     warnings: List[str]  # Any warnings
+    
+    # Observability
+    trace: Optional[Trace]  # Spans of this request (None when tracing is off)
 
 
 def create_initial_state(
     input_type: str,
     raw_input: Any,
-    file_path: Optional[str] = None
+    file_path: Optional[str] = None,
+    task: Optional[str] = None,
+    tasks: Optional[List[str]] = None
 ) -> AgentState:
-    """Create initial state for the workflow"""
+    """
+    Create initial state for the workflow
+    
+    Passing a task skips intent classification and runs that task directly.
+    Passing several tasks runs them in parallel over the same extracted text.
+    """
+    tasks = list(dict.fromkeys(tasks or []))
+    if len(tasks) == 1:
+        task, tasks = tasks[0], []
+    
+    artifacts = ArtifactStore()
+    if isinstance(raw_input, str):
+        raw_input = artifacts.put(raw_input, "raw_input")
+    
     return AgentState(
         input_type=input_type,
         raw_input=raw_input,
         file_path=file_path,
+        artifacts=artifacts,
         extracted_text="",
         extraction_metadata={},
         user_goal=None,
-        detected_task=None,
-        confidence=0.0,
+        detected_task=task,
+        confidence=1.0 if task or tasks else 0.0,
         needs_clarification=False,
         clarification_question=None,
+        classifier="preset" if task or tasks else None,
         task_plan=None,
+        tasks=tasks,
+        task_results={},
         result=None,
         conversation_history=[],
         current_step="start",
         errors=[],
-        warnings=[]
+        warnings=[],
+        trace=start_trace()
     )
\ No newline at end of file
@@ -1,14 +1,27 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, Dict, List
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
 import os
-import shutil
 from pathlib import Path
 
-from backend.agent.graph import create_agent_workflow, process_followup_response
-from backend.agent.state import create_initial_state, InputType
+from backend.agent.graph import create_agent_workflow, aprocess_followup_response, aresume_followup
+from backend.agent.state import create_initial_state, InputType, AgentState, TaskType
+from backend.agent.artifacts import text_preview
+from backend.services.jobs import JobManager, JobQueueFullError
+from backend.services.upload_store import get_upload_store
+from backend.services.session_store import SessionStore, compact_state, restore_state
+from backend.services.checkpoints import checkpoints_enabled, get_session_checkpointer, thread_config
+from backend.services.streaming import stream_workflow
+from backend.services.batch import run_batch
+from backend.services import metrics
+from backend.services.admission import AdmissionController, AdmissionRejected
+from backend.services.warmup import WarmupState, warmup_steps, run_warmup
+from backend.services.executors import shutdown_extractor_executor
+from backend.services.tracing import get_trace_buffer, trace_summary
 
 app = FastAPI(title="Agentic Content Processor", version="1.0.0")
 
@@ -19,18 +32,68 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
+app.add_middleware(metrics.InFlightMiddleware)
 
 workflow = create_agent_workflow()
 
-session_states = {}
+# Follow-up sessions are paused graph threads in SQLite, shared by all workers;
+# SESSION_BACKEND=memory keeps them in this process instead
+resume_workflow = create_agent_workflow(checkpointer=get_session_checkpointer()) if checkpoints_enabled() else None
+
+session_states = SessionStore(
+    ttl_seconds=int(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    max_bytes=int(os.getenv("SESSION_STORE_MAX_MB", "256")) * 1024 * 1024
+)
+
+# Background jobs run on this bounded pool; request paths run the graph natively async
+job_manager = JobManager(
+    max_workers=int(os.getenv("JOB_MAX_WORKERS", "4")),
+    max_pending=int(os.getenv("JOB_MAX_PENDING", "100")),
+    retention_seconds=int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+)
+
+warmup_state = WarmupState()
+
+# Concurrency limits per input type; heavier inputs get fewer slots
+admission = AdmissionController(
+    limits={
+        "text": int(os.getenv("ADMISSION_TEXT_LIMIT", "256")),
+        "image": int(os.getenv("ADMISSION_IMAGE_LIMIT", "4")),
+        "pdf": int(os.getenv("ADMISSION_PDF_LIMIT", "2")),
+        "audio": int(os.getenv("ADMISSION_AUDIO_LIMIT", "1"))
+    },
+    max_queue=int(os.getenv("ADMISSION_QUEUE_SIZE", "32"))
+)
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "5000"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+
+INPUT_TYPE_MAPPING = {
+    'jpg': InputType.IMAGE,
+    'jpeg': InputType.IMAGE,
+    'png': InputType.IMAGE,
+    'pdf': InputType.PDF,
+    'mp3': InputType.AUDIO,
+    'wav': InputType.AUDIO,
+    'm4a': InputType.AUDIO
+}
 
 
 class TextInput(BaseModel):
     text: str
     session_id: Optional[str] = None
+    tasks: Optional[List[TaskType]] = None  # Tasks to run in parallel, skips intent classification
+
+
+class BatchItem(BaseModel):
+    text: str
+    id: Optional[str] = None
+
+
+class BatchInput(BaseModel):
+    items: List[BatchItem]
+    task: Optional[TaskType] = None  # Fixed task for every item, skips intent classification
+    concurrency: int = 4
 
 
 class FollowUpInput(BaseModel):
@@ -46,15 +109,55 @@ async def root():
         "endpoints": {
             "POST /process/text": "Process text input",
             "POST /process/file": "Process file upload (image/pdf/audio)",
+            "POST /process/text/stream": "Process text input, streaming progress as SSE",
+            "POST /process/file/stream": "Process file upload, streaming progress as SSE",
+            "POST /process/batch": "Process many texts, streaming NDJSON results",
             "POST /followup": "Respond to follow-up question",
-            "GET /health": "Health check"
+            "POST /jobs": "Submit text or a file as a background job",
+            "GET /jobs/{job_id}": "Get job status and result",
+            "DELETE /jobs/{job_id}": "Cancel a job",
+            "GET /health": "Health check",
+            "GET /ready": "Readiness check (green once warmup is done)",
+            "GET /metrics": "Prometheus metrics",
+            "GET /debug/traces": "Span timings of recent slow requests"
         }
     }
 
 
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics"""
+    sessions = await asyncio.to_thread(session_stats)
+    metrics.SESSION_STORE_ENTRIES.set(sessions["entries"])
+    metrics.SESSION_STORE_BYTES.set(sessions["bytes"])
+    body, content_type = metrics.render_metrics()
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "sessions": await asyncio.to_thread(session_stats),
+        "admission": admission.queue_depth()
+    }
+
+
+@app.get("/ready")
+async def readiness_check():
+    """Ready only after warmup preloaded models and checked binaries"""
+    snapshot = warmup_state.snapshot()
+    return JSONResponse(snapshot, status_code=200 if warmup_state.ready else 503)
+
+
+@app.get("/debug/traces")
+async def debug_traces(limit: int = 20):
+    """Recent slow request traces, newest first"""
+    buffer = get_trace_buffer()
+    return {
+        "slow_ms": buffer.slow_ms,
+        "traces": [trace_summary(trace) for trace in buffer.recent(limit)]
+    }
 
 
 @app.post("/process/text")
@@ -64,131 +167,177 @@ async def process_text(input_data: TextInput):
         # Create initial state
         state = create_initial_state(
             input_type=InputType.TEXT,
-            raw_input=input_data.text
+            raw_input=input_data.text,
+            tasks=requested_tasks(input_data.tasks)
         )
         
         # Run workflow
-        result_state = workflow.invoke(state)
-        
-        # Check if follow-up needed
-        if result_state.get('needs_clarification'):
-            # Store state for follow-up
-            session_id = generate_session_id()
-            session_states[session_id] = result_state
-            
-            return JSONResponse({
-                "status": "needs_clarification",
-                "session_id": session_id,
-                "question": result_state.get('clarification_question'),
-                "extracted_text": result_state.get('extracted_text', '')[:500],
-                "metadata": result_state.get('extraction_metadata', {})
-            })
+        async with admit(InputType.TEXT):
+            result_state = await run_workflow(state)
         
-        # Return result
-        return JSONResponse({
-            "status": "success",
-            "result": result_state.get('result'),
-            "extracted_text": result_state.get('extracted_text', '')[:500],
-            "metadata": result_state.get('extraction_metadata', {}),
-            "task": result_state.get('detected_task'),
-            "confidence": result_state.get('confidence')
-        })
+        return JSONResponse(await abuild_response(result_state))
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.post("/process/file")
-async def process_file(file: UploadFile = File(...)):
-    """Process uploaded file (image, pdf, or audio)"""
+async def process_file(file: UploadFile = File(...), tasks: Optional[str] = Form(None)):
+    """Process uploaded file (image, pdf, or audio); `tasks` is an optional comma-separated list"""
     try:
-        # Determine input type from file extension
-        file_ext = file.filename.split('.')[-1].lower()
+        input_type = resolve_input_type(file.filename)
+        task_list = parse_tasks(tasks)
         
-        input_type_mapping = {
-            'jpg': InputType.IMAGE,
-            'jpeg': InputType.IMAGE,
-            'png': InputType.IMAGE,
-            'pdf': InputType.PDF,
-            'mp3': InputType.AUDIO,
-            'wav': InputType.AUDIO,
-            'm4a': InputType.AUDIO
-        }
+        # Save uploaded file, pinned while the request waits and runs
+        file_path = await save_upload(file)
         
-        if file_ext not in input_type_mapping:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Unsupported file type: {file_ext}"
+        try:
+            # Create initial state
+            state = create_initial_state(
+                input_type=input_type,
+                raw_input=None,
+                file_path=str(file_path),
+                tasks=task_list
             )
+            
+            # Run workflow
+            async with admit(input_type):
+                result_state = await run_workflow(state)
+        finally:
+            release_upload(file_path)
         
-        input_type = input_type_mapping[file_ext]
-        
-        # Save uploaded file
-        file_path = UPLOAD_DIR / file.filename
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        return JSONResponse(await abuild_response(result_state))
         
-        # Create initial state
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/process/text/stream")
+async def process_text_stream(input_data: TextInput):
+    """Process text input, streaming node progress and task tokens as SSE"""
+    state = create_initial_state(
+        input_type=InputType.TEXT,
+        raw_input=input_data.text,
+        tasks=requested_tasks(input_data.tasks)
+    )
+    
+    release = await acquire_slot(InputType.TEXT)
+    
+    return AdmittedStreamingResponse(
+        stream_workflow(workflow, state, abuild_response),
+        release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/process/file/stream")
+async def process_file_stream(file: UploadFile = File(...), tasks: Optional[str] = Form(None)):
+    """Process uploaded file, streaming node progress and task tokens as SSE"""
+    input_type = resolve_input_type(file.filename)
+    task_list = parse_tasks(tasks)
+    file_path = await save_upload(file)
+    
+    state = create_initial_state(
+        input_type=input_type,
+        raw_input=None,
+        file_path=str(file_path),
+        tasks=task_list
+    )
+    
+    try:
+        release_slot = await acquire_slot(input_type)
+    except BaseException:
+        release_upload(file_path)
+        raise
+    
+    def release():
+        release_slot()
+        release_upload(file_path)
+    
+    return AdmittedStreamingResponse(
+        stream_workflow(workflow, state, abuild_response),
+        release,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/process/batch")
+async def process_batch(input_data: BatchInput):
+    """Process many text items, streaming one NDJSON line per item as it completes"""
+    if not input_data.items:
+        raise HTTPException(status_code=400, detail="No items provided")
+    if len(input_data.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many items: {len(input_data.items)} (max {BATCH_MAX_ITEMS})"
+        )
+    if input_data.task == TaskType.UNCLEAR:
+        raise HTTPException(status_code=400, detail="Task 'unclear' cannot be run")
+    
+    task = input_data.task.value if input_data.task else None
+    concurrency = max(1, min(input_data.concurrency, BATCH_MAX_CONCURRENCY))
+    
+    async def process_item(item: BatchItem) -> Dict:
         state = create_initial_state(
-            input_type=input_type,
-            raw_input=None,
-            file_path=str(file_path)
+            input_type=InputType.TEXT,
+            raw_input=item.text,
+            task=task
         )
+        # Items share the text lane with single requests; a rejected item is reported on its line
+        async with admission.admit(ADMISSION_KINDS[InputType.TEXT]):
+            result_state = await workflow.ainvoke(state)
+        response = await abuild_response(result_state)
+        response["id"] = item.id
         
-        # Run workflow
-        result_state = workflow.invoke(state)
-        
-        # Check if follow-up needed
-        if result_state.get('needs_clarification'):
-            session_id = generate_session_id()
-            session_states[session_id] = result_state
-            
-            return JSONResponse({
-                "status": "needs_clarification",
-                "session_id": session_id,
-                "question": result_state.get('clarification_question'),
-                "extracted_text": result_state.get('extracted_text', '')[:500],
-                "metadata": result_state.get('extraction_metadata', {})
-            })
-        
-        # Return result
-        return JSONResponse({
-            "status": "success",
-            "result": result_state.get('result'),
-            "extracted_text": result_state.get('extracted_text', '')[:500],
-            "metadata": result_state.get('extraction_metadata', {}),
-            "task": result_state.get('detected_task'),
-            "confidence": result_state.get('confidence')
-        })
+        result = result_state.get('result') or {}
+        if result.get('success') is False or (result_state.get('errors') and not result):
+            response["status"] = "error"
+            response["error"] = result.get('error') or "; ".join(result_state['errors'])
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        return response
+    
+    return StreamingResponse(
+        run_batch(input_data.items, process_item, concurrency),
+        media_type="application/x-ndjson"
+    )
 
 
 @app.post("/followup")
 async def handle_followup(input_data: FollowUpInput):
     """Handle follow-up response"""
     try:
-        # Get stored state
-        if input_data.session_id not in session_states:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        original_state = session_states[input_data.session_id]
-        
-        # Process follow-up
-        result_state = process_followup_response(
-            original_state,
-            input_data.response
-        )
-        
-        # Clean up session
-        del session_states[input_data.session_id]
+        if resume_workflow is not None:
+            # Resume the paused graph thread straight into execute_task
+            result_state = await aresume_followup(
+                resume_workflow, thread_config(input_data.session_id), input_data.response
+            )
+            if result_state is None:
+                raise HTTPException(status_code=404, detail="Session not found")
+            await asyncio.to_thread(get_session_checkpointer().delete_thread, input_data.session_id)
+        else:
+            # Get stored state
+            original_state = session_states.get(input_data.session_id)
+            if original_state is None:
+                raise HTTPException(status_code=404, detail="Session not found")
+            
+            # Process follow-up
+            result_state = await aprocess_followup_response(original_state, input_data.response)
+            
+            # Clean up session
+            session_states.pop(input_data.session_id)
         
         return JSONResponse({
             "status": "success",
             "result": result_state.get('result'),
             "task": result_state.get('detected_task'),
-            "confidence": result_state.get('confidence')
+            "confidence": result_state.get('confidence'),
+            "trace_id": finish_trace(result_state)
         })
         
     except HTTPException:
@@ -197,6 +346,275 @@ async def handle_followup(input_data: FollowUpInput):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    text: Optional[str] = Form(None),
+    file: Optional[UploadFile] = File(None)
+):
+    """Submit text or a file for background processing"""
+    if (text is None) == (file is None):
+        raise HTTPException(status_code=400, detail="Provide exactly one of 'text' or 'file'")
+    
+    file_path = None
+    if file is not None:
+        input_type = resolve_input_type(file.filename)
+        file_path = await save_upload(file)
+        state = create_initial_state(
+            input_type=input_type,
+            raw_input=None,
+            file_path=str(file_path)
+        )
+    else:
+        input_type = InputType.TEXT
+        state = create_initial_state(
+            input_type=input_type,
+            raw_input=text
+        )
+    
+    loop = asyncio.get_running_loop()
+    
+    def run_job() -> Dict:
+        # Jobs wait for the same admission slots as requests; a full queue fails the job
+        with admit_from_thread(input_type, loop):
+            return build_response(workflow.invoke(state))
+    
+    def job_done():
+        if file_path is not None:
+            release_upload(file_path)
+    
+    try:
+        job_id = job_manager.submit(run_job, on_done=job_done)
+    except JobQueueFullError as e:
+        job_done()
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    return job_manager.get(job_id)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Get job status, and the result once done"""
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    """Cancel a queued or running job"""
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.on_event("startup")
+async def start_warmup():
+    # Runs in the background so /health answers while models load
+    loop = asyncio.get_running_loop()
+    loop.run_in_executor(None, run_warmup, warmup_state, warmup_steps(workflow))
+
+
+@app.on_event("shutdown")
+async def shutdown_jobs():
+    job_manager.shutdown()
+    shutdown_extractor_executor()
+
+
+ADMISSION_KINDS = {
+    InputType.TEXT: "text",
+    InputType.YOUTUBE: "text",
+    InputType.IMAGE: "image",
+    InputType.PDF: "pdf",
+    InputType.AUDIO: "audio"
+}
+
+
+async def acquire_slot(input_type: InputType):
+    """Wait for an admission slot, or fail fast with 429 + Retry-After"""
+    try:
+        return await admission.acquire(ADMISSION_KINDS[input_type])
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+
+@asynccontextmanager
+async def admit(input_type: InputType):
+    release = await acquire_slot(input_type)
+    try:
+        yield
+    finally:
+        release()
+
+
+@contextmanager
+def admit_from_thread(input_type: InputType, loop: asyncio.AbstractEventLoop):
+    """Hold an admission slot from a worker thread; the controller lives on the event loop"""
+    release = asyncio.run_coroutine_threadsafe(
+        admission.acquire(ADMISSION_KINDS[input_type]), loop
+    ).result()
+    try:
+        yield
+    finally:
+        loop.call_soon_threadsafe(release)
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that holds an admission slot until the response is done
+
+    The slot is released around the whole ASGI call rather than in the body
+    generator, which never runs if the client disconnects before the body starts.
+    """
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self.release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.release()
+
+
+async def run_workflow(state: AgentState) -> AgentState:
+    """Run the workflow on the event loop; blocking extractors are offloaded by the nodes"""
+    return await workflow.ainvoke(state)
+
+
+def resolve_input_type(filename: str) -> InputType:
+    """Determine input type from file extension"""
+    file_ext = filename.split('.')[-1].lower()
+    
+    if file_ext not in INPUT_TYPE_MAPPING:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported file type: {file_ext}"
+        )
+    
+    return INPUT_TYPE_MAPPING[file_ext]
+
+
+def requested_tasks(tasks: Optional[List[TaskType]]) -> List[str]:
+    """Validate the tasks named by a request"""
+    if not tasks:
+        return []
+    if TaskType.UNCLEAR in tasks:
+        raise HTTPException(status_code=400, detail="Task 'unclear' cannot be run")
+    return [task.value for task in tasks]
+
+
+def parse_tasks(tasks: Optional[str]) -> List[str]:
+    """Parse a comma-separated form field of task names"""
+    if not tasks:
+        return []
+    try:
+        return requested_tasks([TaskType(name.strip().lower()) for name in tasks.split(",") if name.strip()])
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Unknown task in: {tasks}")
+
+
+async def save_upload(file: UploadFile) -> Path:
+    """
+    Save uploaded file to the content-addressed upload store
+    
+    Reading, hashing and writing run on a worker thread. The blob stays
+    pinned against eviction until release_upload is called.
+    """
+    return await asyncio.to_thread(get_upload_store().save, file.file, file.filename, True)
+
+
+def release_upload(file_path: Path):
+    """Unpin a blob saved by save_upload once its request is done with it"""
+    get_upload_store().unpin(file_path)
+
+
+def build_response(result_state: AgentState) -> Dict:
+    """Build the API response body, storing the session if follow-up is needed (blocking, for job threads)"""
+    session_id = None
+    if result_state.get('needs_clarification'):
+        session_id = generate_session_id()
+        save_session(session_id, result_state)
+    return response_body(result_state, session_id)
+
+
+async def abuild_response(result_state: AgentState) -> Dict:
+    """Async build_response for request handlers; the session write stays off the event loop"""
+    session_id = None
+    if result_state.get('needs_clarification'):
+        session_id = generate_session_id()
+        await asave_session(session_id, result_state)
+    return response_body(result_state, session_id)
+
+
+def response_body(result_state: AgentState, session_id: Optional[str]) -> Dict:
+    """Response body for a finished run; session_id is set when it awaits a follow-up"""
+    if result_state.get('needs_clarification'):
+        return {
+            "status": "needs_clarification",
+            "session_id": session_id,
+            "question": result_state.get('clarification_question'),
+            "extracted_text": text_preview(result_state, 500),
+            "metadata": result_state.get('extraction_metadata', {}),
+            "trace_id": finish_trace(result_state)
+        }
+    
+    # Return result
+    return {
+        "status": "success",
+        "result": result_state.get('result'),
+        "extracted_text": text_preview(result_state, 500),
+        "metadata": result_state.get('extraction_metadata', {}),
+        "task": result_state.get('detected_task'),
+        "tasks": result_state.get('tasks') or None,
+        "confidence": result_state.get('confidence'),
+        "classifier": result_state.get('classifier'),
+        "trace_id": finish_trace(result_state)
+    }
+
+
+def finish_trace(result_state: AgentState) -> Optional[str]:
+    """End the request's trace, keeping it if it was slow"""
+    trace = result_state.get('trace')
+    if trace is None:
+        return None
+    get_trace_buffer().record(trace)
+    return trace.trace_id
+
+
+def save_session(session_id: str, state: AgentState):
+    """Store a state awaiting follow-up, as a thread paused at ask_followup when checkpointing"""
+    if resume_workflow is not None:
+        resume_workflow.update_state(
+            thread_config(session_id), restore_state(compact_state(state)), as_node="ask_followup"
+        )
+    else:
+        session_states.put(session_id, state)
+
+
+async def asave_session(session_id: str, state: AgentState):
+    """Async save_session; the checkpointer writes SQLite on a worker thread"""
+    if resume_workflow is not None:
+        await resume_workflow.aupdate_state(
+            thread_config(session_id), restore_state(compact_state(state)), as_node="ask_followup"
+        )
+    else:
+        session_states.put(session_id, state)
+
+
+def session_stats() -> Dict:
+    """Session counts; scans the checkpoint database, so async callers run it on a thread"""
+    if resume_workflow is not None:
+        return get_session_checkpointer().stats()
+    return session_states.stats()
+
+
 def generate_session_id() -> str:
     """Generate unique session ID"""
     import uuid
@@ -8,6 +8,12 @@ from pydub import AudioSegment
 from typing import Dict, Tuple
 import os
 
+from backend.services.metrics import EXTRACTOR_LATENCY
+
+
+# Bump when transcription output changes so cached extractions are invalidated
+EXTRACTOR_VERSION = "whisper-base-1"
+
 
 _whisper_model = None
 
@@ -41,12 +47,13 @@ def extract_text_from_audio(audio_path: str) -> Tuple[str, Dict]:
         model = get_whisper_model()
         
         print(f"Transcribing audio (this may take a few moments)...")
-        result = model.transcribe(
-            audio_path,
-            language="en",
-            task="transcribe",
-            fp16=False
-        )
+        with EXTRACTOR_LATENCY.labels("whisper").time():
+            result = model.transcribe(
+                audio_path,
+                language="en",
+                task="transcribe",
+                fp16=False
+            )
         
         transcribed_text = result["text"].strip()
         
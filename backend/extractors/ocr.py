@@ -3,6 +3,12 @@ from PIL import Image
 from typing import Dict, Tuple
 import re
 
+from backend.services.metrics import EXTRACTOR_LATENCY
+
+
+# Bump when OCR output changes so cached extractions are invalidated
+EXTRACTOR_VERSION = "1"
+
 
 def extract_text_from_image(image_path: str) -> Tuple[str, Dict]:
     """
@@ -18,14 +24,15 @@ def extract_text_from_image(image_path: str) -> Tuple[str, Dict]:
         # Open image
         image = Image.open(image_path)
         
-        # Perform OCR with confidence data
-        ocr_data = pytesseract.image_to_data(
-            image, 
-            output_type=pytesseract.Output.DICT
-        )
-        
-        # Extract text
-        extracted_text = pytesseract.image_to_string(image)
+        with EXTRACTOR_LATENCY.labels("tesseract").time():
+            # Perform OCR with confidence data
+            ocr_data = pytesseract.image_to_data(
+                image, 
+                output_type=pytesseract.Output.DICT
+            )
+            
+            # Extract text
+            extracted_text = pytesseract.image_to_string(image)
         
         # Calculate average confidence
         confidences = [
@@ -4,12 +4,19 @@ import pytesseract
 from typing import Dict, Tuple
 import os
 
+from backend.services.metrics import EXTRACTOR_LATENCY
+
+
+# Bump when PDF output changes so cached extractions are invalidated
+EXTRACTOR_VERSION = "1"
+
 
 def extract_text_from_pdf(pdf_path: str) -> Tuple[str, Dict]:
     try:
         print(f"Processing PDF: {pdf_path}")
         
-        text, metadata = extract_text_directly(pdf_path)
+        with EXTRACTOR_LATENCY.labels("pypdf2").time():
+            text, metadata = extract_text_directly(pdf_path)
         
         if len(text.strip()) < 50:
             print("Direct extraction yielded minimal text. Trying OCR...")
@@ -67,7 +74,8 @@ def extract_with_ocr(pdf_path: str) -> Tuple[str, Dict]:
     try:
         print("Converting PDF pages to images...")
         
-        images = convert_from_path(pdf_path, dpi=300)  # Higher DPI = better quality
+        with EXTRACTOR_LATENCY.labels("pdf2image").time():
+            images = convert_from_path(pdf_path, dpi=300)  # Higher DPI = better quality
         
         print(f"Performing OCR on {len(images)} pages...")
         
@@ -77,7 +85,8 @@ def extract_with_ocr(pdf_path: str) -> Tuple[str, Dict]:
         for i, image in enumerate(images):
             print(f"Processing page {i + 1}/{len(images)}...")
             
-            page_text = pytesseract.image_to_string(image)
+            with EXTRACTOR_LATENCY.labels("tesseract").time():
+                page_text = pytesseract.image_to_string(image)
             
             text_content.append(f"\n--- Page {i + 1} ---\n")
             text_content.append(page_text)
@@ -3,6 +3,8 @@ from youtube_transcript_api._errors import TranscriptsDisabled, NoTranscriptFoun
 import re
 from typing import Dict, Tuple, Optional
 
+from backend.services.metrics import EXTRACTOR_LATENCY
+
 
 def extract_youtube_video_id(url_or_text: str) -> Optional[str]:
     """
@@ -39,7 +41,8 @@ def extract_youtube_transcript(video_id: str) -> Tuple[str, Dict]:
     """
     try:
         # Fetch transcript
-        transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
+        with EXTRACTOR_LATENCY.labels("youtube").time():
+            transcript_list = YouTubeTranscriptApi.get_transcript(video_id)
         
         # Combine all transcript segments
         full_transcript = ' '.join([entry['text'] for entry in transcript_list])
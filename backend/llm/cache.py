@@ -0,0 +1,142 @@
+"""
+LLM Response Cache
+SQLite-backed cache of completions shared by every worker on the host,
+with TTL expiry and least-recently-used eviction
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.messages import BaseMessage
+
+from backend.services.metrics import LLM_CACHE_REQUESTS
+
+
+class LLMResponseCache:
+    """
+    Completion cache keyed by model, sampling parameters and rendered messages
+
+    Any SQLite error is treated as a miss so the cache can never fail a request.
+
+    Args:
+        path: SQLite database file
+        ttl_seconds: Entries older than this are ignored and purged
+        max_entries: Least recently used entries beyond this are evicted
+        evict_every: Writes between expiry and eviction sweeps, so the table
+            may briefly hold up to evict_every - 1 entries over max_entries
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 86400, max_entries: int = 50000, evict_every: int = 100):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.evict_every = max(1, evict_every)
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        self._local = threading.local()
+
+        conn = self._connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache(created_at)")
+        conn.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, max_tokens: Optional[int], messages: List[BaseMessage]) -> str:
+        payload = json.dumps(
+            [model, temperature, max_tokens, [(m.type, m.content) for m in messages]],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT value FROM llm_cache WHERE key = ? AND created_at >= ?",
+                (key, now - self.ttl_seconds)
+            ).fetchone()
+            if row is not None:
+                conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                conn.commit()
+        except sqlite3.Error:
+            row = None
+
+        if row is None:
+            self.misses += 1
+            LLM_CACHE_REQUESTS.labels("miss").inc()
+            return None
+
+        self.hits += 1
+        LLM_CACHE_REQUESTS.labels("hit").inc()
+        return row[0]
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, now, now)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: could not write LLM cache entry: {str(e)}")
+            return
+
+        # get() already ignores expired rows, so sweeps only reclaim space
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Delete expired entries, then the least recently used beyond max_entries"""
+        try:
+            conn = self._connect()
+            conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+            conn.execute(
+                """
+                DELETE FROM llm_cache WHERE key IN (
+                    SELECT key FROM llm_cache ORDER BY accessed_at ASC
+                    LIMIT MAX(0, (SELECT COUNT(*) FROM llm_cache) - ?)
+                )
+                """,
+                (self.max_entries,)
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            print(f"Warning: could not evict LLM cache entries: {str(e)}")
+
+    def stats(self) -> Dict:
+        try:
+            entries = self._connect().execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        except sqlite3.Error:
+            entries = None
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def _connect(self) -> sqlite3.Connection:
+        # sqlite3 connections cannot be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=5)
+            self._local.conn = conn
+        return conn
@@ -1,37 +1,378 @@
 from langchain_groq import ChatGroq
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.messages import AIMessage
+from langgraph.constants import TAG_NOSTREAM
 from dotenv import load_dotenv
+from typing import Dict, Optional, Tuple
+import asyncio
+import httpx
 import os
+import threading
+import time
+
+from backend.services.metrics import LLMMetricsCallback, LLM_CALL_LATENCY, LLM_ROUTE_DOWNGRADES
+from backend.llm.cache import LLMResponseCache
+from backend.llm.fake import FakeChatModel
+from backend.llm.rate_limit import get_resilient_caller, estimate_tokens
+from backend.llm.routing import get_route, get_latency_tracker
+from backend.llm.tokens import count_message_tokens, field_budget, fit_field
+from backend.services.tracing import span
 
 # Load environment variables
 load_dotenv()
 
 
-def get_llm(temperature: float = 0.1, model_name: str = None):
+DEFAULT_MAX_TOKENS = 2000
+
+# Expected completion length used when budgeting tokens before a call
+COMPLETION_TOKEN_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKEN_ESTIMATE", "400"))
+
+# Process-wide registries: clients keyed by (provider, model, temperature, max_tokens),
+# prompt chains keyed by task name
+_http_client = None
+_async_http_client = None
+_llm_registry: Dict[Tuple, ChatGroq] = {}
+_chain_specs: Dict[str, Dict] = {}
+_chain_registry: Dict[str, "CachedChain"] = {}
+_registry_lock = threading.Lock()
+_llm_cache = None
+
+
+def get_http_client() -> httpx.Client:
+    """Shared keep-alive HTTP client so every LLM reuses the same connection pool"""
+    global _http_client
+
+    if _http_client is None:
+        with _registry_lock:
+            if _http_client is None:
+                _http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "64")),
+                        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "32")),
+                        keepalive_expiry=60
+                    ),
+                    timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT_SECONDS", "60")), connect=5.0)
+                )
+
+    return _http_client
+
+
+def get_provider() -> str:
+    """LLM backend: "groq" (default) or "fake" for the offline test model"""
+    return os.getenv("LLM_PROVIDER", "groq").strip().lower()
+
+
+def get_fake_llm(temperature: float, model_name: str, max_tokens: int) -> FakeChatModel:
+    """Offline model; latency and throughput come from FAKE_LLM_LATENCY_MS / FAKE_LLM_TOKENS_PER_SECOND"""
+    return FakeChatModel(
+        model_name=f"fake:{model_name}",
+        temperature=temperature,
+        max_tokens=max_tokens,
+        latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+        tokens_per_second=float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "0")),
+        callbacks=[LLMMetricsCallback(f"fake:{model_name}")]
+    )
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Async counterpart of get_http_client() used by `ainvoke`"""
+    global _async_http_client
+
+    if _async_http_client is None:
+        with _registry_lock:
+            if _async_http_client is None:
+                _async_http_client = httpx.AsyncClient(
+                    limits=httpx.Limits(
+                        max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "64")),
+                        max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE", "32")),
+                        keepalive_expiry=60
+                    ),
+                    timeout=httpx.Timeout(float(os.getenv("LLM_TIMEOUT_SECONDS", "60")), connect=5.0)
+                )
+
+    return _async_http_client
+
+
+def get_llm(temperature: float = 0.1, model_name: str = None, max_tokens: int = DEFAULT_MAX_TOKENS):
     """
-    Get Groq LLM instance
-    
+    Get Groq LLM instance (or the offline fake when LLM_PROVIDER=fake)
+
+    Instances are reused across requests, one per (model, temperature, max_tokens).
+
     Args:
         temperature: Temperature for generation (0-1)
         model_name: Model name to use (defaults to env variable)
-        
+        max_tokens: Maximum tokens to generate
+
     Returns:
         ChatGroq instance
     """
+    provider = get_provider()
+    if model_name is None:
+        model_name = os.getenv("MODEL_NAME", "llama-3.3-70b-versatile")
+
+    key = (provider, model_name, temperature, max_tokens)
+    llm = _llm_registry.get(key)
+    if llm is not None:
+        return llm
+
+    if provider == "fake":
+        with _registry_lock:
+            if key not in _llm_registry:
+                _llm_registry[key] = get_fake_llm(temperature, model_name, max_tokens)
+            return _llm_registry[key]
+
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise ValueError("GROQ_API_KEY not found in environment variables")
-    
-    if model_name is None:
-        model_name = os.getenv("MODEL_NAME", "llama-3.3-70b-versatile")
-    
-    return ChatGroq(
-        groq_api_key=api_key,
-        model_name=model_name,
-        temperature=temperature,
-        max_tokens=2000
-    )
+
+    http_client = get_http_client()
+    http_async_client = get_async_http_client()
+
+    with _registry_lock:
+        if key not in _llm_registry:
+            _llm_registry[key] = ChatGroq(
+                groq_api_key=api_key,
+                model_name=model_name,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                http_client=http_client,
+                http_async_client=http_async_client,
+                max_retries=0,  # Retries are handled by the shared rate limiter
+                callbacks=[LLMMetricsCallback(model_name)]
+            )
+        return _llm_registry[key]
 
 
 def get_structured_llm(temperature: float = 0.1):
     """Get LLM configured for structured output"""
-    return get_llm(temperature=temperature)
\ No newline at end of file
+    return get_llm(temperature=temperature)
+
+
+def get_llm_cache() -> Optional[LLMResponseCache]:
+    """Get the shared response cache, or None if LLM_CACHE_ENABLED is off"""
+    global _llm_cache
+
+    if os.getenv("LLM_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+        return None
+
+    if _llm_cache is None:
+        with _registry_lock:
+            if _llm_cache is None:
+                _llm_cache = LLMResponseCache(
+                    path=os.getenv("LLM_CACHE_PATH", "cache/llm_cache.sqlite3"),
+                    ttl_seconds=int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400")),
+                    max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "50000")),
+                    evict_every=int(os.getenv("LLM_CACHE_EVICT_EVERY", "100"))
+                )
+
+    return _llm_cache
+
+
+class CachedChain:
+    """
+    `prompt | llm` with a response cache in front of the model call
+
+    Callers use it like a chain: `chain.invoke({...})` (or `await
+    chain.ainvoke({...})`) returns a message with `.content`. Pass
+    `bypass_cache=True` to force a fresh completion (the result still
+    refreshes the cache).
+
+    With a fallback model and a latency budget (seconds), calls go to the
+    fallback while the main model's recent p95 exceeds the budget.
+    `prompt_tokens` is the stage's prompt budget used by `fit_input`.
+    With `stream=False` the model calls are tagged so LangGraph's messages
+    stream (and so SSE token events) skips them.
+    """
+
+    def __init__(self, prompt: ChatPromptTemplate, llm, fallback_llm=None,
+                 latency_budget: float = 0.0, stage: str = "", prompt_tokens: Optional[int] = None,
+                 stream: bool = True):
+        self.prompt = prompt
+        self.llm = llm
+        self.fallback_llm = fallback_llm
+        self.latency_budget = latency_budget
+        self.stage = stage
+        self.prompt_tokens = prompt_tokens
+        self.stream = stream
+
+    def fit_input(self, inputs: Dict, field: str) -> str:
+        """Trim inputs[field] on sentence/line boundaries so the prompt fits the budget"""
+        return fit_field(self.prompt, inputs, field, self.prompt_tokens)
+
+    def field_budget(self, inputs: Dict, field: str) -> int:
+        """Tokens inputs[field] may use within the prompt budget"""
+        return field_budget(self.prompt, inputs, field, self.prompt_tokens)
+
+    def select_llm(self):
+        if self.fallback_llm is None or self.latency_budget <= 0:
+            return self.llm
+
+        p95 = get_latency_tracker().p95(self.llm.model_name)
+        if p95 is not None and p95 > self.latency_budget:
+            LLM_ROUTE_DOWNGRADES.labels(self.stage).inc()
+            return self.fallback_llm
+        return self.llm
+
+    def cache_key(self, messages, llm=None) -> str:
+        llm = llm or self.llm
+        return LLMResponseCache.make_key(
+            llm.model_name,
+            llm.temperature,
+            llm.max_tokens,
+            messages
+        )
+
+    def invoke(self, inputs: Dict, bypass_cache: bool = False, **kwargs):
+        messages = self.prompt.invoke(inputs).to_messages()
+        llm = self.select_llm()
+
+        with self.call_span(llm, messages) as attributes:
+            cache = get_llm_cache()
+            if cache is None:
+                return self.traced(attributes, self._call(llm, messages, **kwargs))
+
+            key = self.cache_key(messages, llm)
+            if not bypass_cache:
+                cached = cache.get(key)
+                if cached is not None:
+                    attributes["cached"] = True
+                    return AIMessage(content=cached, response_metadata={"cached": True})
+
+            response = self._call(llm, messages, **kwargs)
+            cache.set(key, response.content)
+            return self.traced(attributes, response)
+
+    async def ainvoke(self, inputs: Dict, bypass_cache: bool = False, **kwargs):
+        """Async invoke(); SQLite cache reads and writes run off the event loop"""
+        messages = self.prompt.invoke(inputs).to_messages()
+        llm = self.select_llm()
+
+        with self.call_span(llm, messages) as attributes:
+            cache = get_llm_cache()
+            if cache is None:
+                return self.traced(attributes, await self._acall(llm, messages, **kwargs))
+
+            key = self.cache_key(messages, llm)
+            if not bypass_cache:
+                cached = await asyncio.to_thread(cache.get, key)
+                if cached is not None:
+                    attributes["cached"] = True
+                    return AIMessage(content=cached, response_metadata={"cached": True})
+
+            response = await self._acall(llm, messages, **kwargs)
+            await asyncio.to_thread(cache.set, key, response.content)
+            return self.traced(attributes, response)
+
+    def call_span(self, llm, messages):
+        """Trace span for one chain call, with the prompt size in tokens"""
+        return span(
+            f"llm.{self.stage or 'chain'}",
+            model=llm.model_name,
+            prompt_tokens=count_message_tokens(messages),
+            cached=False
+        )
+
+    @staticmethod
+    def traced(attributes: Dict, response):
+        """Add the provider's completion token count to the span"""
+        usage = getattr(response, "usage_metadata", None) or {}
+        attributes["completion_tokens"] = usage.get("output_tokens")
+        return response
+
+    def call_kwargs(self, kwargs: Dict) -> Dict:
+        if self.stream:
+            return kwargs
+        return {**kwargs, "config": {"tags": [TAG_NOSTREAM]}}
+
+    def _call(self, llm, messages, **kwargs):
+        """Call the model under the shared rate limit, with retries and circuit breaker"""
+        kwargs = self.call_kwargs(kwargs)
+        estimated = estimate_tokens(messages, min(llm.max_tokens or 0, COMPLETION_TOKEN_ESTIMATE))
+
+        def timed_invoke():
+            started = time.perf_counter()
+            response = llm.invoke(messages, **kwargs)
+            elapsed = time.perf_counter() - started
+            LLM_CALL_LATENCY.labels(llm.model_name).observe(elapsed)
+            get_latency_tracker().record(llm.model_name, elapsed)
+            return response
+
+        return get_resilient_caller().call(timed_invoke, llm.model_name, estimated)
+
+    async def _acall(self, llm, messages, **kwargs):
+        kwargs = self.call_kwargs(kwargs)
+        estimated = estimate_tokens(messages, min(llm.max_tokens or 0, COMPLETION_TOKEN_ESTIMATE))
+
+        async def timed_ainvoke():
+            started = time.perf_counter()
+            response = await llm.ainvoke(messages, **kwargs)
+            elapsed = time.perf_counter() - started
+            LLM_CALL_LATENCY.labels(llm.model_name).observe(elapsed)
+            get_latency_tracker().record(llm.model_name, elapsed)
+            return response
+
+        return await get_resilient_caller().acall(timed_ainvoke, llm.model_name, estimated)
+
+
+def register_chain(name: str, prompt: ChatPromptTemplate, temperature: float = 0.1,
+                   max_tokens: int = DEFAULT_MAX_TOKENS, route: Optional[str] = None, stream: bool = True):
+    """
+    Register a prompt for a task; the `prompt | llm` chain is built on first use
+
+    Args:
+        name: Task name used to look the chain up
+        prompt: Prompt template, built once at import time
+        temperature: Temperature for the task's LLM (ignored when routed)
+        max_tokens: Maximum tokens to generate (ignored when routed)
+        route: Pipeline stage in the routing table that picks the model,
+            temperature and max_tokens
+        stream: Whether the chain's output reaches SSE token events (False
+            for intermediate calls such as map-reduce section notes)
+    """
+    _chain_specs[name] = {
+        "prompt": prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "route": route,
+        "stream": stream
+    }
+
+
+def get_chain(name: str):
+    """Get the compiled `prompt | llm` chain for a registered task"""
+    chain = _chain_registry.get(name)
+    if chain is not None:
+        return chain
+
+    spec = _chain_specs[name]
+    if spec["route"] is None:
+        chain = CachedChain(
+            spec["prompt"], get_llm(temperature=spec["temperature"], max_tokens=spec["max_tokens"]),
+            stream=spec["stream"]
+        )
+    else:
+        route = get_route(spec["route"])
+        llm = get_llm(temperature=route["temperature"], model_name=route["model"], max_tokens=route["max_tokens"])
+        fallback_llm = None
+        if route["latency_budget"] > 0 and route["fallback_model"] != route["model"]:
+            fallback_llm = get_llm(
+                temperature=route["temperature"],
+                model_name=route["fallback_model"],
+                max_tokens=route["max_tokens"]
+            )
+        chain = CachedChain(
+            spec["prompt"], llm, fallback_llm, route["latency_budget"], spec["route"], route["prompt_tokens"],
+            stream=spec["stream"]
+        )
+
+    with _registry_lock:
+        if name not in _chain_registry:
+            _chain_registry[name] = chain
+        return _chain_registry[name]
+
+
+def build_all_chains():
+    """Build every registered chain (used by startup warmup)"""
+    for name in list(_chain_specs):
+        get_chain(name)
@@ -0,0 +1,387 @@
+"""
+LLM Rate Limiting and Resilience
+Token buckets for requests/minute and tokens/minute shared by every
+worker on the host through SQLite, retry with jittered exponential
+backoff, and a circuit breaker for provider outages
+"""
+
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+
+import groq
+
+from backend.services.metrics import LLM_RETRIES, LLM_RATE_LIMIT_WAIT, LLM_CIRCUIT_OPEN
+from backend.llm.tokens import count_message_tokens
+
+
+class RateLimitTimeout(Exception):
+    """Raised when the local budget does not free up within the max wait"""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the provider while the circuit is open"""
+
+
+class RateLimiter:
+    """
+    Per-model request and token buckets stored in SQLite
+
+    `BEGIN IMMEDIATE` serializes bucket updates across processes, so all
+    uvicorn workers draw from the same budget. SQLite errors fail open.
+
+    Args:
+        path: SQLite database file
+        requests_per_minute: Request budget per model
+        tokens_per_minute: Token budget per model (prompt + completion)
+    """
+
+    def __init__(self, path: str, requests_per_minute: int, tokens_per_minute: int):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._local = threading.local()
+
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS buckets (
+                name TEXT PRIMARY KEY,
+                level REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def try_acquire(self, model: str, tokens: int) -> float:
+        """
+        Take one request and `tokens` tokens from the model's buckets
+
+        Returns:
+            0 if the budget was taken, otherwise seconds to wait before retrying
+        """
+        tokens = min(tokens, self.tokens_per_minute)
+        limits = {
+            f"{model}:requests": (self.requests_per_minute, 1),
+            f"{model}:tokens": (self.tokens_per_minute, tokens),
+        }
+        now = time.time()
+        conn = self._connect()
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            levels = self._read_levels(conn, limits, now)
+
+            wait = 0.0
+            for name, (capacity, needed) in limits.items():
+                if levels[name] < needed:
+                    wait = max(wait, (needed - levels[name]) / (capacity / 60.0))
+
+            if wait == 0.0:
+                for name, (_, needed) in limits.items():
+                    levels[name] -= needed
+
+            self._write_levels(conn, levels, now)
+            conn.execute("COMMIT")
+            return wait
+
+        except sqlite3.Error as e:
+            print(f"Warning: rate limiter unavailable, allowing call: {str(e)}")
+            self._rollback(conn)
+            return 0.0
+
+    def acquire(self, model: str, tokens: int, max_wait: float):
+        """Block until the budget is available, or raise RateLimitTimeout"""
+        deadline = time.monotonic() + max_wait
+        started = time.monotonic()
+
+        while True:
+            wait = self.try_acquire(model, tokens)
+            if wait == 0.0:
+                LLM_RATE_LIMIT_WAIT.labels(model).observe(time.monotonic() - started)
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"LLM budget for {model} exhausted, would wait {wait:.1f}s")
+            time.sleep(wait)
+
+    async def acquire_async(self, model: str, tokens: int, max_wait: float):
+        """acquire() without blocking the event loop while waiting"""
+        deadline = time.monotonic() + max_wait
+        started = time.monotonic()
+
+        while True:
+            wait = await asyncio.to_thread(self.try_acquire, model, tokens)
+            if wait == 0.0:
+                LLM_RATE_LIMIT_WAIT.labels(model).observe(time.monotonic() - started)
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitTimeout(f"LLM budget for {model} exhausted, would wait {wait:.1f}s")
+            await asyncio.sleep(wait)
+
+    def refund(self, model: str, tokens: int):
+        """Return (or, if negative, charge) the difference between estimated and actual tokens"""
+        name = f"{model}:tokens"
+        now = time.time()
+        conn = self._connect()
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            levels = self._read_levels(conn, {name: (self.tokens_per_minute, 0)}, now)
+            levels[name] = min(self.tokens_per_minute, levels[name] + tokens)
+            self._write_levels(conn, levels, now)
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            self._rollback(conn)
+
+    def _read_levels(self, conn, limits: Dict, now: float) -> Dict[str, float]:
+        """Current bucket levels after refilling for the elapsed time"""
+        levels = {}
+        for name, (capacity, _) in limits.items():
+            row = conn.execute("SELECT level, updated_at FROM buckets WHERE name = ?", (name,)).fetchone()
+            if row is None:
+                levels[name] = float(capacity)
+            else:
+                level, updated_at = row
+                levels[name] = min(float(capacity), level + (now - updated_at) * capacity / 60.0)
+        return levels
+
+    def _write_levels(self, conn, levels: Dict[str, float], now: float):
+        conn.executemany(
+            "INSERT OR REPLACE INTO buckets (name, level, updated_at) VALUES (?, ?, ?)",
+            [(name, level, now) for name, level in levels.items()]
+        )
+
+    def _rollback(self, conn):
+        try:
+            conn.execute("ROLLBACK")
+        except sqlite3.Error:
+            pass
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode so BEGIN IMMEDIATE controls the transaction
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive provider failures
+
+    While open, calls fail immediately. After `cooldown_seconds` one trial
+    call is let through; success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self, model: str):
+        with self._lock:
+            if self.opened_at is None:
+                return
+            if time.monotonic() - self.opened_at < self.cooldown_seconds or self._trial_in_flight:
+                raise CircuitOpenError(f"LLM provider for {model} is unavailable, failing fast")
+            self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def release_trial(self):
+        """Give up a trial call that neither succeeded nor failed (e.g. it was cancelled)"""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self, model: str):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    LLM_CIRCUIT_OPEN.labels(model).inc()
+                self.opened_at = time.monotonic()
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return isinstance(error, groq.RateLimitError) or getattr(error, "status_code", None) == 429
+
+
+def is_transient(error: Exception) -> bool:
+    """Provider-side failures worth retrying (and counting toward the breaker)"""
+    if isinstance(error, (groq.APIConnectionError, groq.APITimeoutError, groq.InternalServerError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and status >= 500
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the provider's retry-after hint, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float, error: Exception) -> float:
+    """Full-jitter exponential backoff, never shorter than the provider's hint"""
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    hint = retry_after_seconds(error)
+    if hint is not None:
+        delay = max(delay, hint)
+    return delay
+
+
+class ResilientCaller:
+    """
+    Wraps LLM calls with the shared rate limiter, retries and a circuit breaker
+
+    Args:
+        limiter: Shared token buckets, or None to skip budgeting
+        max_retries: Retries after the first attempt
+        max_wait: Longest time to wait for budget before giving up
+    """
+
+    def __init__(self, limiter: Optional[RateLimiter], max_retries: int = 4, max_wait: float = 60.0,
+                 backoff_base: float = 0.5, backoff_cap: float = 20.0):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker(
+                    failure_threshold=int(os.getenv("LLM_BREAKER_THRESHOLD", "5")),
+                    cooldown_seconds=float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+                )
+            return self._breakers[model]
+
+    def call(self, fn: Callable, model: str, estimated_tokens: int, sleep: Callable[[float], None] = time.sleep):
+        """
+        Run fn() under the budget, retrying rate limits and transient errors
+
+        Other exceptions (bad request, auth) are raised immediately.
+        """
+        breaker = self.breaker(model)
+        attempt = 0
+
+        while True:
+            if self.limiter is not None:
+                self.limiter.acquire(model, estimated_tokens, self.max_wait)
+            breaker.before_call(model)
+
+            try:
+                response = fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, model, breaker)
+                attempt += 1
+                sleep(delay)
+                continue
+            except BaseException:
+                breaker.release_trial()
+                raise
+
+            breaker.record_success()
+            self._reconcile(model, estimated_tokens, response)
+            return response
+
+    async def acall(self, fn: Callable[[], Awaitable], model: str, estimated_tokens: int,
+                    sleep: Callable[[float], Awaitable] = asyncio.sleep):
+        """Async call(): fn returns an awaitable, and waits do not block the event loop"""
+        breaker = self.breaker(model)
+        attempt = 0
+
+        while True:
+            if self.limiter is not None:
+                await self.limiter.acquire_async(model, estimated_tokens, self.max_wait)
+            breaker.before_call(model)
+
+            try:
+                response = await fn()
+            except Exception as e:
+                delay = self._retry_delay(e, attempt, model, breaker)
+                attempt += 1
+                await sleep(delay)
+                continue
+            except BaseException:
+                # Cancelled (client disconnect): says nothing about the provider
+                breaker.release_trial()
+                raise
+
+            breaker.record_success()
+            if self.limiter is not None:
+                await asyncio.to_thread(self._reconcile, model, estimated_tokens, response)
+            return response
+
+    def _retry_delay(self, error: Exception, attempt: int, model: str, breaker: CircuitBreaker) -> float:
+        """Record the failure and return the backoff delay, or re-raise if not retryable"""
+        if is_transient(error):
+            breaker.record_failure(model)
+        else:
+            # The provider answered, so it is up even if it refused this call
+            breaker.record_success()
+            if not is_rate_limited(error):
+                raise error
+
+        if attempt >= self.max_retries:
+            raise error
+        delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap, error)
+        print(f"LLM call failed ({type(error).__name__}), retrying in {delay:.1f}s")
+        LLM_RETRIES.labels(model).inc()
+        return delay
+
+    def _reconcile(self, model: str, estimated_tokens: int, response):
+        usage = getattr(response, "usage_metadata", None) or {}
+        actual = usage.get("total_tokens")
+        if self.limiter is not None and actual is not None and actual != estimated_tokens:
+            self.limiter.refund(model, estimated_tokens - actual)
+
+
+def estimate_tokens(messages, completion_tokens: int) -> int:
+    """Budget estimate: counted prompt tokens plus expected output"""
+    return count_message_tokens(messages) + completion_tokens
+
+
+_resilient_caller = None
+
+
+def get_resilient_caller() -> ResilientCaller:
+    """Get the process-wide caller; budgets come from GROQ_RPM / GROQ_TPM"""
+    global _resilient_caller
+
+    if _resilient_caller is None:
+        limiter = None
+        # The offline fake provider has no provider quota to protect
+        enabled = os.getenv("LLM_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+        if enabled and os.getenv("LLM_PROVIDER", "groq").strip().lower() != "fake":
+            limiter = RateLimiter(
+                path=os.getenv("LLM_RATE_LIMIT_PATH", "cache/rate_limit.sqlite3"),
+                requests_per_minute=int(os.getenv("GROQ_RPM", "30")),
+                tokens_per_minute=int(os.getenv("GROQ_TPM", "6000"))
+            )
+        _resilient_caller = ResilientCaller(
+            limiter=limiter,
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+            max_wait=float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT", "60"))
+        )
+
+    return _resilient_caller
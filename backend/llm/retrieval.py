@@ -0,0 +1,265 @@
+"""
+Chunk Retrieval
+In-process BM25 index over a document's extracted text, so QA prompts carry
+the chunks relevant to the question instead of the document's first pages.
+Chunks are stored as offsets into the text and postings as numpy arrays, so
+the index adds little memory and a query only touches the question's terms.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+import os
+import re
+import threading
+
+import numpy as np
+
+from backend.agent.artifacts import TextView, text_digest
+from backend.llm.tokens import PAGE_MARKER, count_tokens, trim_to_tokens
+
+
+TERM_PATTERN = re.compile(r"\w+")
+
+# Chunks end at the first sentence or line end after the target size
+CHUNK_BOUNDARY = re.compile(r"[.!?。！？]\s+|\n")
+
+# Words too common to tell chunks apart
+STOP_WORDS = frozenset("""
+a an and are as at be but by can did do does for from had has have how i if in
+is it its me my of on or so that the their them then there these they this to
+was we were what when where which who why will with would you your
+""".split())
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# Characters of a long question used as the query. Pasted text is both the
+# question and the context, and usually asks its question at the start or end.
+QUERY_MAX_CHARS = 1000
+
+QUESTION_SENTENCE = re.compile(r"[^.!?\n]*\?")
+
+
+def retrieval_enabled() -> bool:
+    return os.getenv("QA_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+
+
+def needs_index(text: Union[str, TextView]) -> bool:
+    """Whether a document is long enough that QA should retrieve from it rather than read it whole"""
+    return retrieval_enabled() and len(text) > int(os.getenv("QA_INDEX_MIN_CHARS", "4000"))
+
+
+def query_terms(text: str) -> List[str]:
+    return [term for term in TERM_PATTERN.findall(text.lower()) if term not in STOP_WORDS]
+
+
+def query_text(question: str) -> str:
+    """
+    The part of a question to search with: all of a short one, else the
+    last sentence asking something near either end, else both ends
+    """
+    if len(question) <= QUERY_MAX_CHARS:
+        return question
+    half = QUERY_MAX_CHARS // 2
+    for end in (question[-half:], question[:half]):
+        asked = QUESTION_SENTENCE.findall(end)
+        if asked:
+            return asked[-1].strip()
+    return f"{question[:half]} {question[-half:]}"
+
+
+@dataclass
+class ChunkIndex:
+    """
+    BM25 index over fixed-size chunks of one document
+
+    Chunks are offsets into the text, which the caller keeps; indexes are
+    cached per process by get_chunk_index, not stored in the graph state.
+    Postings are in CSR form: the chunks containing term t are
+    chunk_ids[offsets[t]:offsets[t + 1]], with term_freqs alongside.
+    """
+
+    starts: np.ndarray  # Chunk start offsets into the text
+    ends: np.ndarray  # Chunk end offsets into the text
+    pages: np.ndarray  # Page each chunk starts on (0 without page markers)
+    lengths: np.ndarray  # Indexed terms per chunk
+    vocabulary: Dict[str, int] = field(default_factory=dict)
+    offsets: np.ndarray = field(default_factory=lambda: np.zeros(1, dtype=np.int64))
+    chunk_ids: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.int32))
+    term_freqs: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def score(self, question: str) -> np.ndarray:
+        """BM25 score of every chunk for the question's terms"""
+        scores = np.zeros(len(self), dtype=np.float32)
+        if not len(self):
+            return scores
+
+        average_length = max(float(self.lengths.mean()), 1.0)
+        norms = K1 * (1 - B + B * self.lengths / average_length)
+
+        for term in set(query_terms(question)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            chunks, freqs = self.chunk_ids[start:end], self.term_freqs[start:end]
+            idf = np.log(1 + (len(self) - len(chunks) + 0.5) / (len(chunks) + 0.5))
+            scores[chunks] += idf * freqs * (K1 + 1) / (freqs + norms[chunks])
+
+        return scores
+
+    def top_chunks(self, question: str, k: int) -> List[int]:
+        """Indices of up to k best-scoring chunks, best first (none if no term matches)"""
+        scores = self.score(question)
+        matched = int(np.count_nonzero(scores))
+        if not matched:
+            return []
+        k = min(k, matched)
+        best = np.argpartition(-scores, k - 1)[:k]
+        return [int(i) for i in best[np.argsort(-scores[best], kind="stable")]]
+
+
+def build_chunk_index(text: Union[str, TextView], chunk_chars: int = 1000) -> ChunkIndex:
+    """
+    Split text into chunks of about chunk_chars, ending on a sentence or
+    line boundary, and index their terms
+
+    Args:
+        text: Document text (a TextView is indexed without copying it whole)
+        chunk_chars: Target chunk size in characters
+
+    Returns:
+        ChunkIndex whose offsets are relative to the start of `text`
+    """
+    view = TextView(text) if isinstance(text, str) else text
+    starts, ends = [], []
+    position = 0
+    while position < len(view):
+        target = position + chunk_chars
+        if target >= len(view):
+            end = len(view)
+        else:
+            match = view[target:target + chunk_chars // 2].search(CHUNK_BOUNDARY)
+            end = match.end() - view.start if match else target
+        starts.append(position)
+        ends.append(end)
+        position = end
+
+    starts = np.array(starts, dtype=np.int64)
+    ends = np.array(ends, dtype=np.int64)
+
+    # Page of each chunk: the last marker starting at or before it
+    markers = [(match.start() - view.start, int(match.group(1))) for match in view.finditer(PAGE_MARKER)]
+    pages = np.zeros(len(starts), dtype=np.int32)
+    if markers:
+        marker_starts = np.array([start for start, _ in markers], dtype=np.int64)
+        marker_pages = np.array([0] + [page for _, page in markers], dtype=np.int32)
+        pages = marker_pages[np.searchsorted(marker_starts, starts, side="right")]
+
+    vocabulary: Dict[str, int] = {}
+    term_ids, chunk_ids, lengths = [], [], np.zeros(len(starts), dtype=np.float32)
+    for chunk, (start, end) in enumerate(zip(starts, ends)):
+        terms = query_terms(view[start:end].preview(end - start))
+        lengths[chunk] = len(terms)
+        term_ids.extend(vocabulary.setdefault(term, len(vocabulary)) for term in terms)
+        chunk_ids.extend([chunk] * len(terms))
+
+    # One posting per (term, chunk) pair, sorted by term then chunk
+    keys = np.array(term_ids, dtype=np.int64) * max(len(starts), 1) + np.array(chunk_ids, dtype=np.int64)
+    keys, freqs = np.unique(keys, return_counts=True)
+    posting_terms = keys // max(len(starts), 1)
+
+    return ChunkIndex(
+        starts=starts,
+        ends=ends,
+        pages=pages,
+        lengths=lengths,
+        vocabulary=vocabulary,
+        offsets=np.concatenate(([0], np.cumsum(np.bincount(posting_terms, minlength=len(vocabulary))))).astype(np.int64),
+        chunk_ids=(keys % max(len(starts), 1)).astype(np.int32),
+        term_freqs=freqs.astype(np.float32)
+    )
+
+
+def retrieve_context(index: ChunkIndex, text: Union[str, TextView], question: str,
+                     max_tokens: int, top_k: int = 8) -> str:
+    """
+    Best chunks for the question that fit in max_tokens, in document order
+
+    Chunks are labelled with their page unless they start with the
+    extractor's page marker; the first one that does not fit
+    is trimmed into the remaining budget. Falls back to the start of the
+    document when no chunk shares a term with the question.
+    """
+    view = TextView(text) if isinstance(text, str) else text
+    ranked = index.top_chunks(query_text(question), top_k) or list(range(min(top_k, len(index))))
+
+    chosen, used = [], 0
+    for chunk in ranked:
+        passage = view[int(index.starts[chunk]):int(index.ends[chunk])].strip().preview(len(view))
+        page = int(index.pages[chunk])
+        if page and not passage.startswith(f"--- Page {page} ---"):
+            passage = f"[Page {page}] {passage}"
+        tokens = count_tokens(passage) + 2
+        if used + tokens > max_tokens:
+            passage = trim_to_tokens(passage, max_tokens - used - 2)
+            if passage:
+                chosen.append((chunk, passage))
+            break
+        chosen.append((chunk, passage))
+        used += tokens
+
+    return "\n\n".join(passage for _, passage in sorted(chosen))
+
+
+class ChunkIndexCache:
+    """
+    LRU of chunk indexes keyed by the document's content key
+
+    Repeated questions about the same document (a re-uploaded PDF hits the
+    extraction cache and yields the same text) reuse its index. The key is
+    the artifact's digest, which for uploads is the blob hash already known,
+    so the text is neither re-indexed nor copied to be hashed.
+
+    Args:
+        max_entries: Indexes kept; the least recently used is dropped first
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, ChunkIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, text: Union[str, TextView], key: Optional[str] = None) -> ChunkIndex:
+        if key is None:
+            key = text_digest(text)
+        with self._lock:
+            index = self._entries.get(key)
+            if index is not None:
+                self._entries.move_to_end(key)
+                return index
+
+        index = build_chunk_index(text)
+        with self._lock:
+            self._entries[key] = index
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return index
+
+
+_chunk_index_cache = None
+
+
+def get_chunk_index(text: Union[str, TextView], key: Optional[str] = None) -> ChunkIndex:
+    """Chunk index of a document, built on first use and cached under key (default: a digest of the text)"""
+    global _chunk_index_cache
+
+    if _chunk_index_cache is None:
+        _chunk_index_cache = ChunkIndexCache(max_entries=int(os.getenv("QA_INDEX_CACHE_SIZE", "32")))
+
+    return _chunk_index_cache.get(text, key)
@@ -0,0 +1,131 @@
+"""
+LLM Model Routing
+Per-stage model, temperature and max_tokens, plus an optional latency
+budget that sends a stage to its smaller fallback model while the large
+model's recent p95 is too slow
+"""
+
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+import os
+import threading
+import time
+
+import numpy as np
+
+
+# Stage defaults; "large" and "small" resolve to MODEL_NAME / SMALL_MODEL_NAME.
+# Classification and follow-up only produce a label, so they default to the
+# small model with a short completion limit. prompt_tokens caps the whole
+# rendered prompt; task inputs are trimmed to fit.
+DEFAULT_ROUTES: Dict[str, Dict] = {
+    "classify": {"model": "small", "temperature": 0.1, "max_tokens": 150, "prompt_tokens": 800},
+    "followup": {"model": "small", "temperature": 0.1, "max_tokens": 20, "prompt_tokens": 400},
+    # Same budget as one map-reduce section, so a text summarized in long
+    # mode always spans several sections
+    "summarize": {"model": "large", "temperature": 0.3, "max_tokens": 2000, "prompt_tokens": 3000},
+    # Long-document mode: one call per section, many run in parallel
+    "summarize_chunk": {"model": "large", "temperature": 0.2, "max_tokens": 300, "prompt_tokens": 3000},
+    "sentiment": {"model": "large", "temperature": 0.1, "max_tokens": 300, "prompt_tokens": 800},
+    "code_explain": {"model": "large", "temperature": 0.2, "max_tokens": 2000, "prompt_tokens": 1200},
+    "qa": {"model": "large", "temperature": 0.3, "max_tokens": 2000, "prompt_tokens": 1000},
+    "extract": {"model": "large", "temperature": 0.2, "max_tokens": 2000, "prompt_tokens": 1300},
+    # Single-call mode: classification and task output in one completion
+    "classify_execute": {"model": "large", "temperature": 0.2, "max_tokens": 2000, "prompt_tokens": 1800},
+}
+
+
+def resolve_model(name: str) -> str:
+    if name == "large":
+        return os.getenv("MODEL_NAME", "llama-3.3-70b-versatile")
+    if name == "small":
+        return os.getenv("SMALL_MODEL_NAME", "llama-3.1-8b-instant")
+    return name
+
+
+def get_route(stage: str) -> Dict:
+    """
+    Resolve a stage's route; each field can be overridden with
+    LLM_ROUTE_<STAGE>_MODEL / _TEMPERATURE / _MAX_TOKENS / _PROMPT_TOKENS /
+    _FALLBACK_MODEL / _LATENCY_BUDGET_MS
+
+    Returns:
+        Dict with model, temperature, max_tokens, prompt_tokens (never more
+        than LLM_CONTEXT_WINDOW minus max_tokens), fallback_model and
+        latency_budget (seconds, 0 when downgrading is off)
+    """
+    defaults = DEFAULT_ROUTES[stage]
+    prefix = f"LLM_ROUTE_{stage.upper()}_"
+
+    budget_ms = float(os.getenv(prefix + "LATENCY_BUDGET_MS", os.getenv("LLM_LATENCY_BUDGET_MS", "0")))
+    max_tokens = int(os.getenv(prefix + "MAX_TOKENS", defaults["max_tokens"]))
+    # Reserve room for the completion within the model's context window
+    context_window = int(os.getenv("LLM_CONTEXT_WINDOW", "8192"))
+    prompt_tokens = int(os.getenv(prefix + "PROMPT_TOKENS", defaults["prompt_tokens"]))
+
+    return {
+        "model": resolve_model(os.getenv(prefix + "MODEL", defaults["model"])),
+        "temperature": float(os.getenv(prefix + "TEMPERATURE", defaults["temperature"])),
+        "max_tokens": max_tokens,
+        "prompt_tokens": min(prompt_tokens, context_window - max_tokens),
+        "fallback_model": resolve_model(os.getenv(prefix + "FALLBACK_MODEL", "small")),
+        "latency_budget": budget_ms / 1000.0
+    }
+
+
+class LatencyTracker:
+    """
+    Recent provider latencies per model
+
+    Only samples from the last `window_seconds` count, so a downgraded model
+    that stops receiving traffic ages out and gets tried again.
+
+    Args:
+        window_seconds: How far back samples count
+        max_samples: Samples kept per model
+        min_samples: Fewer recent samples than this gives no p95
+    """
+
+    def __init__(self, window_seconds: float = 300.0, max_samples: int = 200, min_samples: int = 10):
+        self.window_seconds = window_seconds
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self._samples: Dict[str, Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, seconds: float, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            samples = self._samples.get(model)
+            if samples is None:
+                samples = self._samples[model] = deque(maxlen=self.max_samples)
+            samples.append((now, seconds))
+
+    def p95(self, model: str, now: Optional[float] = None) -> Optional[float]:
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            samples = self._samples.get(model)
+            if not samples:
+                return None
+            while samples and now - samples[0][0] > self.window_seconds:
+                samples.popleft()
+            recent = [seconds for _, seconds in samples]
+
+        if len(recent) < self.min_samples:
+            return None
+        return float(np.percentile(recent, 95))
+
+
+_latency_tracker = None
+
+
+def get_latency_tracker() -> LatencyTracker:
+    global _latency_tracker
+
+    if _latency_tracker is None:
+        _latency_tracker = LatencyTracker(
+            window_seconds=float(os.getenv("LLM_LATENCY_WINDOW_SECONDS", "300")),
+            min_samples=int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "10"))
+        )
+
+    return _latency_tracker
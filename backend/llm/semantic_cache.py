@@ -0,0 +1,147 @@
+"""
+Semantic Cache
+Near-duplicate lookup for task results using hashed word n-gram vectors
+and an in-memory cosine-similarity index (CPU only, no model download)
+"""
+
+from typing import Dict, Optional
+import copy
+import os
+import re
+import threading
+import zlib
+
+import numpy as np
+
+from backend.services.metrics import SEMANTIC_CACHE_REQUESTS
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def vectorize(text: str, dim: int, min_tokens: int = 1) -> Optional[np.ndarray]:
+    """
+    Hash word unigrams and bigrams into a unit-length vector
+
+    Casing, punctuation and whitespace do not affect the vector. Returns
+    None for text with fewer than min_tokens words.
+    """
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) < max(min_tokens, 1):
+        return None
+
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    buckets = np.fromiter(
+        (zlib.crc32(feature.encode("utf-8")) % dim for feature in features),
+        dtype=np.int64,
+        count=len(features)
+    )
+
+    vector = np.zeros(dim, dtype=np.float32)
+    np.add.at(vector, buckets, 1.0)
+    # Sublinear term frequency keeps common words from dominating similarity
+    np.log1p(vector, out=vector)
+    vector /= np.linalg.norm(vector)
+    return vector
+
+
+class _Namespace:
+    """Fixed-capacity ring of vectors and cached values for one task"""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.entries = [None] * capacity
+        self.size = 0
+        self.next = 0
+        self.lock = threading.Lock()
+
+
+class SemanticCache:
+    """
+    Per-task near-duplicate cache
+
+    Args:
+        threshold: Minimum cosine similarity for a hit
+        capacity: Entries kept per namespace; the oldest is overwritten
+        dim: Hashed vector size
+        min_tokens: Shorter texts are never matched (a single changed word
+            can flip the meaning of a short text)
+    """
+
+    def __init__(self, threshold: float = 0.92, capacity: int = 500, dim: int = 2048, min_tokens: int = 20):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.dim = dim
+        self.min_tokens = min_tokens
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, namespace: str, text: str, discriminator: str = "") -> Optional[Dict]:
+        """
+        Return a copy of the closest cached result, or None
+
+        Args:
+            namespace: Task name; results never cross namespaces
+            text: Text the result was computed from
+            discriminator: Must match exactly (e.g. the question for QA)
+        """
+        vector = vectorize(text, self.dim, self.min_tokens)
+        ns = self._namespaces.get(namespace)
+
+        if vector is None or ns is None or ns.size == 0:
+            SEMANTIC_CACHE_REQUESTS.labels(namespace, "miss").inc()
+            return None
+
+        with ns.lock:
+            scores = ns.vectors[:ns.size] @ vector
+            for index in np.argsort(scores)[::-1]:
+                if scores[index] < self.threshold:
+                    break
+                entry_discriminator, value = ns.entries[index]
+                if entry_discriminator == discriminator:
+                    SEMANTIC_CACHE_REQUESTS.labels(namespace, "hit").inc()
+                    result = copy.deepcopy(value)
+                    result["semantic_cache_similarity"] = round(float(scores[index]), 4)
+                    return result
+
+        SEMANTIC_CACHE_REQUESTS.labels(namespace, "miss").inc()
+        return None
+
+    def store(self, namespace: str, text: str, value: Dict, discriminator: str = ""):
+        vector = vectorize(text, self.dim, self.min_tokens)
+        if vector is None:
+            return
+
+        with self._lock:
+            ns = self._namespaces.get(namespace)
+            if ns is None:
+                ns = self._namespaces[namespace] = _Namespace(self.capacity, self.dim)
+
+        with ns.lock:
+            ns.vectors[ns.next] = vector
+            ns.entries[ns.next] = (discriminator, copy.deepcopy(value))
+            ns.next = (ns.next + 1) % self.capacity
+            ns.size = min(ns.size + 1, self.capacity)
+
+    def stats(self) -> Dict:
+        return {name: ns.size for name, ns in self._namespaces.items()}
+
+
+_semantic_cache = None
+
+
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """Get the process-wide semantic cache, or None unless SEMANTIC_CACHE_ENABLED"""
+    global _semantic_cache
+
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() not in ("1", "true", "yes"):
+        return None
+
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            capacity=int(os.getenv("SEMANTIC_CACHE_CAPACITY", "500")),
+            min_tokens=int(os.getenv("SEMANTIC_CACHE_MIN_TOKENS", "20"))
+        )
+
+    return _semantic_cache
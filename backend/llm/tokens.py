@@ -0,0 +1,300 @@
+"""
+Token Budgeting
+Counts prompt tokens with a BPE tokenizer (tiktoken) and trims task inputs
+on paragraph, line or sentence boundaries so prompts stay within a token
+budget regardless of script or how code-heavy the text is
+"""
+
+from typing import Dict, List, Optional, Union
+import os
+import re
+import threading
+
+from backend.agent.artifacts import TextView
+
+
+# Llama 3's tokenizer is a tiktoken BPE close to cl100k_base
+DEFAULT_ENCODING = "cl100k_base"
+
+# Per-message overhead of the chat template (role header and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Fallback estimate: one token per CJK character or punctuation mark,
+# roughly one per four characters of a word
+CJK_CHARS = r"\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef"
+ESTIMATE_PATTERN = re.compile(rf"[{CJK_CHARS}]|[^\W{CJK_CHARS}]+|[^\w\s]")
+
+# Trim units, each ending at a boundary: blank line, newline, or sentence end
+BOUNDARY_PATTERN = re.compile(r"[^\n]*?(?:\n\s*\n|\n|[.!?。！？](?=\s|$)\s*|$)")
+
+# Upper bound on characters per token, so a hard cut only encodes a prefix
+MAX_CHARS_PER_TOKEN = 32
+
+# Page separators written by extract_text_from_pdf
+PAGE_MARKER = re.compile(r"\n--- Page (\d+) ---\n")
+
+_encoding = None
+_encoding_thread = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """
+    The tokenizer if it has loaded, else None (counts use the estimate)
+
+    Never loads on the caller's thread: tiktoken may download the BPE file
+    with no timeout, so the first call starts loading in the background and
+    requests are estimated until it is ready. Warmup waits for it instead.
+    """
+    if _encoding is None and _encoding_thread is None and not estimate_requested():
+        start_loading_encoding()
+    return _encoding
+
+
+def start_loading_encoding() -> threading.Thread:
+    """Start loading the tokenizer on a daemon thread, once"""
+    global _encoding_thread
+
+    with _encoding_lock:
+        if _encoding_thread is None:
+            _encoding_thread = threading.Thread(target=load_encoding, name="tokenizer-load", daemon=True)
+            _encoding_thread.start()
+        return _encoding_thread
+
+
+def wait_for_encoding(timeout: float):
+    """
+    Wait up to timeout seconds for the tokenizer
+
+    Returns:
+        The encoding, or None if TOKENIZER=estimate, loading failed, or it
+        is still loading (it is used as soon as it arrives)
+    """
+    if estimate_requested():
+        return None
+    start_loading_encoding().join(timeout)
+    return _encoding
+
+
+def load_encoding():
+    """Load tiktoken's encoding (read from TIKTOKEN_CACHE_DIR, or downloaded)"""
+    global _encoding
+
+    try:
+        import tiktoken
+        encoding = tiktoken.get_encoding(os.getenv("TOKENIZER_ENCODING", DEFAULT_ENCODING))
+    except Exception as e:
+        print(
+            f"Warning: tokenizer unavailable, prompt budgets fall back to estimated token counts: {str(e)} "
+            "(pre-fetch the encoding into TIKTOKEN_CACHE_DIR, or set TOKENIZER=estimate)"
+        )
+        return
+
+    _encoding = encoding
+    print(f"Tokenizer: tiktoken {encoding.name}")
+
+
+def estimate_requested() -> bool:
+    return os.getenv("TOKENIZER", "tiktoken").lower() == "estimate"
+
+
+def tokenizer_name() -> str:
+    encoding = get_encoding()
+    if encoding is not None:
+        return f"tiktoken:{encoding.name}"
+    if _encoding_thread is not None and _encoding_thread.is_alive():
+        return "estimate (tiktoken still loading)"
+    return "estimate"
+
+
+def estimate_text_tokens(text: str) -> int:
+    return sum(
+        1 if len(piece) == 1 else (len(piece) + 3) // 4
+        for piece in ESTIMATE_PATTERN.findall(text)
+    )
+
+
+def count_tokens(text: str) -> int:
+    """Number of tokens in text"""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return estimate_text_tokens(text)
+    return len(encoding.encode_ordinary(text))
+
+
+def count_message_tokens(messages) -> int:
+    """Prompt tokens for a list of chat messages, including template overhead"""
+    return sum(count_tokens(str(m.content)) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def hard_cut(text: str, max_tokens: int) -> str:
+    """Longest prefix within max_tokens, for a single unit with no boundary to cut on"""
+    encoding = get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode_ordinary(text)[:max_tokens])
+
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_text_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    return text[:low]
+
+
+def trim_to_tokens(text: Union[str, TextView], max_tokens: int) -> str:
+    """
+    Trim text to at most max_tokens, cutting after the last whole sentence or line
+
+    Units are read lazily from the start, so only the part of a large
+    document that can fit the budget is tokenized or copied.
+
+    Args:
+        text: Text (or a view of it) to trim
+        max_tokens: Token budget for the text
+
+    Returns:
+        The text unchanged if it fits, otherwise its longest boundary-aligned
+        prefix within the budget (a hard cut when the first unit alone is too long)
+    """
+    if max_tokens <= 0:
+        return ""
+
+    view = TextView(text) if isinstance(text, str) else text
+    # The estimate never counts more tokens than characters; a BPE tokenizer
+    # can (a CJK character or emoji may take several byte-level tokens)
+    if get_encoding() is None and len(view) <= max_tokens:
+        return str(view)
+
+    kept = []
+    used = 0
+    for match in view.finditer(BOUNDARY_PATTERN):
+        unit = match.group(0)
+        if not unit:
+            continue
+        unit_tokens = count_tokens(unit)
+        if used + unit_tokens > max_tokens:
+            break
+        kept.append(unit)
+        used += unit_tokens
+    else:
+        if count_tokens(str(view)) <= max_tokens:
+            return str(view)
+
+    if not kept:
+        return hard_cut(view.preview(max_tokens * MAX_CHARS_PER_TOKEN), max_tokens)
+
+    # Tokens can merge across unit boundaries, so confirm the joined count
+    while kept and count_tokens("".join(kept)) > max_tokens:
+        kept.pop()
+    return "".join(kept).rstrip()
+
+
+def field_budget(prompt, inputs: dict, field: str, prompt_tokens: int) -> int:
+    """Tokens left for one input once the template and the other inputs are counted"""
+    rendered = prompt.invoke({**inputs, field: ""}).to_messages()
+    return prompt_tokens - count_message_tokens(rendered)
+
+
+def fit_field(prompt, inputs: dict, field: str, prompt_tokens: Optional[int]) -> str:
+    """
+    Trim one prompt input so the whole rendered prompt fits in prompt_tokens
+
+    The template and the other inputs are counted first; the field gets
+    whatever budget is left. The field may be a TextView; a string is returned.
+    """
+    value = inputs[field]
+    if prompt_tokens is None:
+        return str(value)
+
+    return trim_to_tokens(value, field_budget(prompt, inputs, field, prompt_tokens))
+
+
+def split_to_tokens(text: str, max_tokens: int) -> List[str]:
+    """Split text into consecutive pieces of at most max_tokens, cut on sentence or line boundaries"""
+    pieces = []
+    current = []
+    used = 0
+
+    for match in BOUNDARY_PATTERN.finditer(text):
+        unit = match.group(0)
+        if not unit:
+            continue
+        unit_tokens = count_tokens(unit)
+
+        if used + unit_tokens > max_tokens and current:
+            pieces.append("".join(current))
+            current, used = [], 0
+
+        # A unit with no boundary inside it is cut hard
+        while unit_tokens > max_tokens:
+            head = hard_cut(unit[:max_tokens * MAX_CHARS_PER_TOKEN], max_tokens) or unit[:max_tokens]
+            pieces.append(head)
+            unit = unit[len(head):]
+            unit_tokens = count_tokens(unit)
+
+        if unit:
+            current.append(unit)
+            used += unit_tokens
+
+    if current:
+        pieces.append("".join(current))
+    return [piece for piece in pieces if piece.strip()]
+
+
+def chunk_by_tokens(text: Union[str, TextView], max_tokens: int) -> List[Dict]:
+    """
+    Split a long document into chunks of at most max_tokens
+
+    Whole pages (`--- Page N ---` markers) are packed together while they fit;
+    a page too long for one chunk is split on sentence or line boundaries.
+
+    Returns:
+        List of {"text", "first_page", "last_page"} (pages are None for text
+        without page markers)
+    """
+    view = TextView(text) if isinstance(text, str) else text
+
+    # (page number, page text) in document order
+    pages = []
+    position, page = view.start, None
+    for match in view.finditer(PAGE_MARKER):
+        pages.append((page, view[position - view.start:match.start() - view.start]))
+        position, page = match.end(), int(match.group(1))
+    pages.append((page, view[position - view.start:]))
+
+    chunks = []
+    current = None
+
+    def flush():
+        if current and current["text"].strip():
+            chunks.append(current)
+
+    for number, page_view in pages:
+        if not page_view.strip():
+            continue
+        # Keep the marker so packed pages stay separated and citable
+        page_text = str(page_view) if number is None else f"--- Page {number} ---\n{page_view}"
+        page_tokens = count_tokens(page_text)
+
+        if current is not None and current["tokens"] + page_tokens <= max_tokens:
+            current["text"] += page_text
+            current["tokens"] += page_tokens
+            current["last_page"] = number
+            continue
+
+        flush()
+        current = None
+        if page_tokens <= max_tokens:
+            current = {"text": page_text, "tokens": page_tokens, "first_page": number, "last_page": number}
+        else:
+            for piece in split_to_tokens(page_text, max_tokens):
+                chunks.append({"text": piece, "first_page": number, "last_page": number})
+
+    flush()
+    for chunk in chunks:
+        chunk.pop("tokens", None)
+    return chunks
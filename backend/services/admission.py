@@ -0,0 +1,133 @@
+"""
+Admission Control
+Per-input-type concurrency limits with a bounded wait queue, so bursts of
+heavy uploads are rejected cleanly instead of thrashing the box
+"""
+
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Callable, Dict
+import asyncio
+import math
+import time
+
+from backend.services.metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_RUNNING, ADMISSION_REJECTED
+
+
+# Starting guess for service time (seconds) until real durations are observed
+DEFAULT_SERVICE_SECONDS = {
+    "text": 2.0,
+    "image": 5.0,
+    "pdf": 20.0,
+    "audio": 60.0,
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a lane's wait queue is full"""
+
+    def __init__(self, kind: str, retry_after: int):
+        super().__init__(f"Server busy processing {kind} requests, retry in {retry_after}s")
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+class _Lane:
+    def __init__(self, kind: str, limit: int, max_queue: int):
+        self.kind = kind
+        self.limit = limit
+        self.max_queue = max_queue
+        self.running = 0
+        self.waiters = deque()
+        self.avg_seconds = DEFAULT_SERVICE_SECONDS.get(kind, 5.0)
+
+    def retry_after(self) -> int:
+        """Seconds until a new request would likely get a slot"""
+        return max(1, math.ceil((len(self.waiters) + 1) * self.avg_seconds / self.limit))
+
+    def publish(self):
+        ADMISSION_QUEUE_DEPTH.labels(self.kind).set(len(self.waiters))
+        ADMISSION_RUNNING.labels(self.kind).set(self.running)
+
+
+class AdmissionController:
+    """
+    Gate requests per input type
+
+    Args:
+        limits: Max concurrent requests per kind (text, image, pdf, audio)
+        max_queue: Max requests waiting per kind before rejecting
+    """
+
+    def __init__(self, limits: Dict[str, int], max_queue: int = 32):
+        self._lanes = {kind: _Lane(kind, limit, max_queue) for kind, limit in limits.items()}
+        for lane in self._lanes.values():
+            lane.publish()
+
+    async def acquire(self, kind: str) -> Callable[[], None]:
+        """
+        Wait for a slot, or raise AdmissionRejected if the queue is full
+
+        Returns:
+            Idempotent release function; call it when the work is done
+        """
+        lane = self._lanes[kind]
+
+        if lane.running < lane.limit and not lane.waiters:
+            lane.running += 1
+        else:
+            if len(lane.waiters) >= lane.max_queue:
+                ADMISSION_REJECTED.labels(kind).inc()
+                raise AdmissionRejected(kind, lane.retry_after())
+
+            waiter = asyncio.get_running_loop().create_future()
+            lane.waiters.append(waiter)
+            lane.publish()
+            try:
+                # The releasing request hands its slot over by resolving the future
+                await waiter
+            except asyncio.CancelledError:
+                if waiter.done() and not waiter.cancelled():
+                    self._release(lane)
+                else:
+                    lane.waiters.remove(waiter)
+                    lane.publish()
+                raise
+
+        lane.publish()
+        started = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            lane.avg_seconds = 0.8 * lane.avg_seconds + 0.2 * (time.monotonic() - started)
+            self._release(lane)
+
+        return release
+
+    @asynccontextmanager
+    async def admit(self, kind: str):
+        release = await self.acquire(kind)
+        try:
+            yield
+        finally:
+            release()
+
+    def queue_depth(self) -> Dict[str, Dict]:
+        return {
+            kind: {"running": lane.running, "waiting": len(lane.waiters), "limit": lane.limit}
+            for kind, lane in self._lanes.items()
+        }
+
+    def _release(self, lane: _Lane):
+        while lane.waiters:
+            waiter = lane.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                lane.publish()
+                return
+        lane.running -= 1
+        lane.publish()
@@ -0,0 +1,59 @@
+"""
+Batch Runner
+Processes many items with bounded concurrency and yields NDJSON lines in
+completion order
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List
+import asyncio
+import json
+
+
+async def run_batch(
+    items: List[Dict],
+    process_item: Callable[[Dict], Dict],
+    concurrency: int
+) -> AsyncIterator[str]:
+    """
+    Run process_item over items, at most `concurrency` at a time
+
+    Each yielded line is a JSON object with the item's index. An exception
+    raised for one item is reported on that item's line and does not stop
+    the rest of the batch.
+
+    Args:
+        items: Items to process
+        process_item: Coroutine function, or blocking function run on a
+            thread pool, turning one item into a result dict
+        concurrency: Maximum number of items in flight
+    """
+    loop = asyncio.get_running_loop()
+    is_async = asyncio.iscoroutinefunction(process_item)
+    executor = None if is_async else ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="agent-batch")
+    results: asyncio.Queue = asyncio.Queue()
+    next_index = iter(range(len(items)))
+
+    async def worker():
+        for index in next_index:
+            try:
+                if is_async:
+                    result = await process_item(items[index])
+                else:
+                    result = await loop.run_in_executor(executor, process_item, items[index])
+                line = {"index": index, **result}
+            except Exception as e:
+                line = {"index": index, "status": "error", "error": str(e)}
+            await results.put(line)
+
+    workers = [asyncio.create_task(worker()) for _ in range(min(concurrency, len(items)))]
+
+    try:
+        for _ in range(len(items)):
+            line = await results.get()
+            yield json.dumps(line, default=str) + "\n"
+    finally:
+        for task in workers:
+            task.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
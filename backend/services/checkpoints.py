@@ -0,0 +1,159 @@
+"""
+Session Checkpoints
+LangGraph checkpointer backed by SQLite, so a graph paused at its follow-up
+question can be resumed by any API worker, including after a restart. Only
+the latest checkpoint of each thread is kept, and threads expire after a TTL.
+"""
+
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Optional, Sequence, Tuple
+import asyncio
+import os
+import sqlite3
+import time
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+
+class SessionCheckpointer(SqliteSaver):
+    """
+    SqliteSaver with compaction, expiry and async methods
+
+    The async methods run the sync ones on a worker thread, so the same
+    saver serves workflow.invoke and workflow.ainvoke. WAL mode lets several
+    uvicorn worker processes share the database file.
+
+    Args:
+        path: SQLite database file
+        ttl_seconds: Threads not updated for this long are deleted
+        expire_interval: Minimum seconds between expiry sweeps
+    """
+
+    def __init__(self, path: str, ttl_seconds: int = 1800, expire_interval: float = 60.0):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        super().__init__(sqlite3.connect(path, check_same_thread=False, timeout=30))
+        self.ttl_seconds = ttl_seconds
+        self.expire_interval = expire_interval
+        self._last_expired = 0.0
+        self.expirations = 0
+
+    def setup(self):
+        if self.is_setup:
+            return
+        super().setup()
+        # Wall-clock update times, comparable across worker processes
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS session_threads (
+                thread_id TEXT PRIMARY KEY,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS session_threads_updated ON session_threads (updated_at);
+            """
+        )
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint,
+            metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = saved["configurable"]["thread_id"]
+
+        # Compaction: older checkpoints and their writes are never read again
+        with self.cursor() as cur:
+            cur.execute(
+                "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_id != ?",
+                (thread_id, checkpoint["id"])
+            )
+            cur.execute(
+                "DELETE FROM writes WHERE thread_id = ? AND checkpoint_id != ?",
+                (thread_id, checkpoint["id"])
+            )
+            cur.execute(
+                "INSERT OR REPLACE INTO session_threads (thread_id, updated_at) VALUES (?, ?)",
+                (thread_id, time.time())
+            )
+
+        self.expire()
+        return saved
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        if self.is_expired(config["configurable"]["thread_id"]):
+            return None
+        return super().get_tuple(config)
+
+    def is_expired(self, thread_id: str) -> bool:
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT updated_at FROM session_threads WHERE thread_id = ?", (thread_id,))
+            row = cur.fetchone()
+        return row is not None and row[0] < time.time() - self.ttl_seconds
+
+    def delete_thread(self, thread_id: str):
+        with self.cursor() as cur:
+            for table in ("checkpoints", "writes", "session_threads"):
+                cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    def expire(self, force: bool = False) -> int:
+        """Delete expired threads, at most once per expire_interval unless forced"""
+        now = time.time()
+        if not force and now - self._last_expired < self.expire_interval:
+            return 0
+        self._last_expired = now
+
+        with self.cursor() as cur:
+            cur.execute("SELECT thread_id FROM session_threads WHERE updated_at < ?", (now - self.ttl_seconds,))
+            expired = [(row[0],) for row in cur.fetchall()]
+            for table in ("checkpoints", "writes", "session_threads"):
+                cur.executemany(f"DELETE FROM {table} WHERE thread_id = ?", expired)
+
+        self.expirations += len(expired)
+        return len(expired)
+
+    def stats(self) -> Dict:
+        with self.cursor(transaction=False) as cur:
+            cur.execute("SELECT COUNT(*) FROM session_threads")
+            entries = cur.fetchone()[0]
+            cur.execute("SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints")
+            size = cur.fetchone()[0]
+        return {"entries": entries, "bytes": size, "expirations": self.expirations}
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> AsyncIterator[CheckpointTuple]:
+        checkpoints = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for checkpoint in checkpoints:
+            yield checkpoint
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint,
+                   metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str):
+        await asyncio.to_thread(self.put_writes, config, writes, task_id)
+
+
+def checkpoints_enabled() -> bool:
+    return os.getenv("SESSION_BACKEND", "sqlite").lower() == "sqlite"
+
+
+def thread_config(session_id: str) -> RunnableConfig:
+    return {"configurable": {"thread_id": session_id}}
+
+
+_session_checkpointer = None
+
+
+def get_session_checkpointer() -> SessionCheckpointer:
+    global _session_checkpointer
+
+    if _session_checkpointer is None:
+        _session_checkpointer = SessionCheckpointer(
+            path=os.getenv("SESSION_DB_PATH", "cache/sessions.sqlite3"),
+            ttl_seconds=int(os.getenv("SESSION_TTL_SECONDS", "1800"))
+        )
+
+    return _session_checkpointer
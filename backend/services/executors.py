@@ -0,0 +1,37 @@
+"""
+Blocking Work Executor
+Dedicated thread pool for blocking extractors (tesseract, Whisper, PyPDF2,
+YouTube fetches) so the async graph path never runs them on the event loop
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+
+
+_extractor_executor = None
+_lock = threading.Lock()
+
+
+def get_extractor_executor() -> ThreadPoolExecutor:
+    """Process-wide pool sized by EXTRACTOR_MAX_WORKERS (default: CPU count, at most 8)"""
+    global _extractor_executor
+
+    if _extractor_executor is None:
+        with _lock:
+            if _extractor_executor is None:
+                _extractor_executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("EXTRACTOR_MAX_WORKERS", str(min(8, os.cpu_count() or 1)))),
+                    thread_name_prefix="agent-extract"
+                )
+
+    return _extractor_executor
+
+
+def shutdown_extractor_executor():
+    global _extractor_executor
+
+    with _lock:
+        if _extractor_executor is not None:
+            _extractor_executor.shutdown(wait=False, cancel_futures=True)
+            _extractor_executor = None
@@ -0,0 +1,148 @@
+"""
+Background Job Manager
+Runs agent workflows on a bounded thread pool so slow extraction or LLM
+calls never block the API event loop
+"""
+
+from concurrent.futures import ThreadPoolExecutor, Future
+from enum import Enum
+from typing import Callable, Dict, Optional
+import threading
+import time
+import uuid
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+class JobQueueFullError(Exception):
+    """Raised when too many jobs are already queued or running"""
+
+
+class JobManager:
+    """
+    Track jobs submitted to a bounded executor
+
+    Args:
+        max_workers: Number of workflows allowed to run at the same time
+        max_pending: Maximum number of queued + running jobs
+        retention_seconds: How long finished jobs stay queryable
+    """
+
+    def __init__(self, max_workers: int = 4, max_pending: int = 100, retention_seconds: int = 3600):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="agent-job")
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self._jobs: Dict[str, Dict] = {}
+        self._futures: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[], Dict], on_done: Optional[Callable[[], None]] = None) -> str:
+        """
+        Queue a callable and return its job ID
+
+        Args:
+            fn: Work to run on the pool
+            on_done: Called once the job has finished, failed, or was
+                cancelled before it started (not if submit raises)
+        """
+        with self._lock:
+            self._prune_finished()
+
+            if self.pending_count() >= self.max_pending:
+                raise JobQueueFullError(f"Job queue is full ({self.max_pending} pending jobs)")
+
+            job_id = str(uuid.uuid4())
+            self._jobs[job_id] = {
+                "job_id": job_id,
+                "status": JobStatus.QUEUED.value,
+                "created_at": time.time(),
+                "started_at": None,
+                "finished_at": None,
+                "result": None,
+                "error": None
+            }
+            future = self.executor.submit(self._run, job_id, fn)
+            if on_done is not None:
+                future.add_done_callback(lambda _: on_done())
+            self._futures[job_id] = future
+
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Return a snapshot of the job, or None if unknown"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        """
+        Cancel a queued or running job
+
+        A queued job never starts. A running job cannot be interrupted
+        mid-call, so it finishes in the background and its result is dropped.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+
+            if job["status"] in (JobStatus.QUEUED.value, JobStatus.RUNNING.value):
+                future = self._futures.pop(job_id, None)
+                if future is not None:
+                    future.cancel()
+                job["status"] = JobStatus.CANCELLED.value
+                job["finished_at"] = time.time()
+
+            return dict(job)
+
+    def pending_count(self) -> int:
+        """Number of queued or running jobs"""
+        return sum(
+            1 for job in self._jobs.values()
+            if job["status"] in (JobStatus.QUEUED.value, JobStatus.RUNNING.value)
+        )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id: str, fn: Callable[[], Dict]):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] == JobStatus.CANCELLED.value:
+                return
+            job["status"] = JobStatus.RUNNING.value
+            job["started_at"] = time.time()
+
+        result = None
+        error = None
+        try:
+            result = fn()
+        except Exception as e:
+            error = str(e)
+
+        with self._lock:
+            self._futures.pop(job_id, None)
+            if job["status"] == JobStatus.CANCELLED.value:
+                return
+            job["finished_at"] = time.time()
+            if error is not None:
+                job["status"] = JobStatus.FAILED.value
+                job["error"] = error
+            else:
+                job["status"] = JobStatus.DONE.value
+                job["result"] = result
+
+    def _prune_finished(self):
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job["finished_at"] is not None and job["finished_at"] < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
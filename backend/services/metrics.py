@@ -0,0 +1,168 @@
+"""
+Prometheus Metrics
+Latency histograms for graph nodes, extractors and tasks, plus LLM usage
+counters. Each observation is a few dict lookups, cheap enough to leave on.
+"""
+
+from functools import wraps
+import inspect
+from typing import Callable
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Seconds; spans fast text requests up to long Whisper transcriptions
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+NODE_LATENCY = Histogram(
+    "agent_node_duration_seconds",
+    "Time spent in each LangGraph node",
+    ["node"],
+    buckets=LATENCY_BUCKETS
+)
+
+EXTRACTOR_LATENCY = Histogram(
+    "extractor_duration_seconds",
+    "Time spent in each content extractor",
+    ["extractor"],
+    buckets=LATENCY_BUCKETS
+)
+
+TASK_LATENCY = Histogram(
+    "task_duration_seconds",
+    "Time spent in each task function",
+    ["task"],
+    buckets=LATENCY_BUCKETS
+)
+
+LLM_CALLS = Counter("llm_calls_total", "LLM calls started", ["model"])
+LLM_ERRORS = Counter("llm_errors_total", "LLM calls that raised", ["model"])
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens used", ["model", "kind"])
+
+LLM_RETRIES = Counter("llm_retries_total", "LLM calls retried after an error", ["model"])
+LLM_CIRCUIT_OPEN = Counter("llm_circuit_open_total", "Times the LLM circuit breaker opened", ["model"])
+LLM_RATE_LIMIT_WAIT = Histogram(
+    "llm_rate_limit_wait_seconds",
+    "Time spent waiting for the shared LLM budget",
+    ["model"],
+    buckets=LATENCY_BUCKETS
+)
+
+LLM_CALL_LATENCY = Histogram(
+    "llm_call_duration_seconds",
+    "Provider time per LLM call, excluding budget waits",
+    ["model"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_ROUTE_DOWNGRADES = Counter(
+    "llm_route_downgrades_total", "Calls sent to a stage's fallback model over the latency budget", ["stage"]
+)
+
+INTENT_CLASSIFICATIONS = Counter(
+    "intent_classifications_total",
+    "Intent classifications by path (rules, llm, followup_rules or followup_llm)",
+    ["path", "task"]
+)
+
+LLM_CACHE_REQUESTS = Counter("llm_cache_requests_total", "LLM response cache lookups", ["result"])
+
+SEMANTIC_CACHE_REQUESTS = Counter(
+    "semantic_cache_requests_total", "Semantic cache lookups", ["namespace", "result"]
+)
+
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests currently being served")
+SESSION_STORE_ENTRIES = Gauge("session_store_entries", "Sessions awaiting a follow-up")
+SESSION_STORE_BYTES = Gauge("session_store_bytes", "Approximate memory held by sessions")
+
+ADMISSION_QUEUE_DEPTH = Gauge("admission_queue_depth", "Requests waiting for a slot", ["kind"])
+ADMISSION_RUNNING = Gauge("admission_running", "Requests holding a slot", ["kind"])
+ADMISSION_REJECTED = Counter("admission_rejected_total", "Requests rejected with 429", ["kind"])
+
+
+def timed(histogram, fn: Callable) -> Callable:
+    """Wrap a sync or async function so each call's duration is observed"""
+    if inspect.iscoroutinefunction(fn):
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            with histogram.time():
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        with histogram.time():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def timed_node(name: str, node: Callable) -> Callable:
+    """Wrap a graph node so its duration is recorded under `name`"""
+    return timed(NODE_LATENCY.labels(name), node)
+
+
+def timed_task(name: str) -> Callable[[Callable], Callable]:
+    """Decorator recording a task function's duration (sync or async) under `name`"""
+    histogram = TASK_LATENCY.labels(name)
+    return lambda fn: timed(histogram, fn)
+
+
+class LLMMetricsCallback(BaseCallbackHandler):
+    """Count calls, errors and tokens for one model"""
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._calls = LLM_CALLS.labels(model_name)
+        self._errors = LLM_ERRORS.labels(model_name)
+        self._prompt_tokens = LLM_TOKENS.labels(model_name, "prompt")
+        self._completion_tokens = LLM_TOKENS.labels(model_name, "completion")
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._calls.inc()
+
+    def on_llm_error(self, error, **kwargs):
+        self._errors.inc()
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens")
+        completion_tokens = usage.get("completion_tokens")
+
+        # Streamed responses carry usage on the message instead
+        if prompt_tokens is None and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            usage_metadata = getattr(message, "usage_metadata", None) or {}
+            prompt_tokens = usage_metadata.get("input_tokens")
+            completion_tokens = usage_metadata.get("output_tokens")
+
+        if prompt_tokens:
+            self._prompt_tokens.inc(prompt_tokens)
+        if completion_tokens:
+            self._completion_tokens.inc(completion_tokens)
+
+
+class InFlightMiddleware:
+    """
+    ASGI middleware tracking http_requests_in_flight
+
+    A plain ASGI wrapper rather than @app.middleware("http"): the inner app
+    returns only once the response body is fully sent, so streamed (SSE,
+    NDJSON) responses count until their last byte.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+
+
+def render_metrics():
+    """Return (body, content_type) in Prometheus text format"""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,161 @@
+"""
+Session Store
+Keeps clarification sessions between /process and /followup with a TTL,
+a total-bytes cap and LRU eviction
+"""
+
+from collections import OrderedDict
+from typing import Dict, Optional
+import sys
+import threading
+import time
+
+from backend.agent.artifacts import ArtifactStore
+from backend.agent.state import AgentState, create_initial_state
+
+
+# The only state fields process_followup_response needs to resume
+SESSION_FIELDS = (
+    "input_type",
+    "raw_input",
+    "file_path",
+    "artifacts",
+    "extracted_text",
+    "extraction_metadata",
+    "detected_task",
+    "confidence",
+    "clarification_question",
+)
+
+
+class SessionStore:
+    """
+    Bounded store for states awaiting a follow-up answer
+
+    Args:
+        ttl_seconds: How long an unanswered session is kept
+        max_bytes: Approximate memory cap across all sessions
+    """
+
+    def __init__(self, ttl_seconds: int = 1800, max_bytes: int = 256 * 1024 * 1024):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def put(self, session_id: str, state: AgentState):
+        """Store the compact part of a state"""
+        compact = compact_state(state)
+        size = estimate_size(compact)
+
+        with self._lock:
+            self._remove(session_id)
+            self._entries[session_id] = {
+                "state": compact,
+                "size": size,
+                "expires_at": time.monotonic() + self.ttl_seconds
+            }
+            self._bytes += size
+            self._expire()
+
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def get(self, session_id: str) -> Optional[AgentState]:
+        """Rebuild a full AgentState for the session, or None if unknown/expired"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+
+            if entry is None or entry["expires_at"] < time.monotonic():
+                if entry is not None:
+                    self._remove(session_id)
+                    self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(session_id)
+            self.hits += 1
+            compact = entry["state"]
+
+        return restore_state(compact)
+
+    def pop(self, session_id: str):
+        with self._lock:
+            self._remove(session_id)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            entry = self._entries.get(session_id)
+            return entry is not None and entry["expires_at"] >= time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+    def _remove(self, session_id: str):
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self._bytes -= entry["size"]
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [sid for sid, entry in self._entries.items() if entry["expires_at"] < now]
+        for session_id in expired:
+            self._remove(session_id)
+            self.expirations += 1
+
+
+def compact_state(state: AgentState) -> Dict:
+    return {field: state.get(field) for field in SESSION_FIELDS}
+
+
+def restore_state(compact: Dict) -> AgentState:
+    """Rebuild a full AgentState from its compact session fields"""
+    state = create_initial_state(
+        input_type=compact["input_type"],
+        raw_input=None,
+        file_path=compact["file_path"]
+    )
+    for field in SESSION_FIELDS:
+        state[field] = compact[field]
+    state["extraction_metadata"] = dict(compact["extraction_metadata"] or {})
+    return state
+
+
+def estimate_size(obj, seen: Optional[set] = None) -> int:
+    """
+    Approximate the memory held by a session
+
+    Objects shared by reference (e.g. one artifact behind raw_input and
+    extracted_text for plain text input) are counted once.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(estimate_size(k, seen) + estimate_size(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set)):
+        size += sum(estimate_size(item, seen) for item in obj)
+    elif isinstance(obj, ArtifactStore):
+        size += estimate_size(obj.items, seen)
+    return size
@@ -0,0 +1,99 @@
+"""
+Workflow Streaming
+Runs the agent workflow on the event loop and relays node progress and
+task output tokens as Server-Sent Events
+"""
+
+from typing import AsyncIterator, Callable, Dict, Optional
+import asyncio
+import json
+import time
+
+from backend.agent.state import AgentState
+
+
+# Only task output is streamed; classifier tokens are internal. Within a
+# task, chains registered with stream=False (map-reduce section notes) are
+# tagged so LangGraph leaves them out of the messages stream.
+TOKEN_STREAM_NODES = {"execute_task"}
+
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def stream_workflow(
+    workflow,
+    state: AgentState,
+    build_result: Callable[[AgentState], Dict]
+) -> AsyncIterator[str]:
+    """
+    Stream a workflow run as SSE
+
+    Events:
+        node_start: {"node", "task"}
+        node_end: {"node", "task", "duration_ms", "error"}
+        token: {"node", "content"}
+        result: the same body the non-streaming endpoint returns
+        error: {"detail"}
+
+    `task` is the detected task the node runs with, which tells apart the
+    parallel run_task branches of a multi-task request (None before the
+    intent is known).
+
+    If the client goes away the generator is closed, which cancels the
+    graph run at its next await.
+
+    Args:
+        workflow: Compiled LangGraph workflow
+        state: Initial state
+        build_result: Turns the final state into the response body;
+            a coroutine function is awaited
+    """
+    started = {}  # Debug task id -> (start time, detected task); parallel branches share a node name
+    final_state = None
+
+    try:
+        async for mode, chunk in workflow.astream(state, stream_mode=["debug", "messages", "values"]):
+            if mode == "values":
+                final_state = chunk
+
+            elif mode == "messages":
+                message, metadata = chunk
+                node = metadata.get("langgraph_node")
+                if node in TOKEN_STREAM_NODES and message.content:
+                    yield sse_event("token", {"node": node, "content": message.content})
+
+            elif chunk["type"] == "task":
+                payload = chunk["payload"]
+                task = node_task(payload.get("input"))
+                started[payload["id"]] = (time.perf_counter(), task)
+                yield sse_event("node_start", {"node": payload["name"], "task": task})
+
+            elif chunk["type"] == "task_result":
+                payload = chunk["payload"]
+                start, task = started.pop(payload["id"], (time.perf_counter(), None))
+                yield sse_event("node_end", {
+                    "node": payload["name"],
+                    "task": task,
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                    "error": payload.get("error")
+                })
+
+        if asyncio.iscoroutinefunction(build_result):
+            result = await build_result(final_state)
+        else:
+            result = build_result(final_state)
+    except Exception as e:
+        yield sse_event("error", {"detail": str(e)})
+        return
+
+    yield sse_event("result", result)
+
+
+def node_task(node_input) -> Optional[str]:
+    """Detected task in a node's input; for run_task, the one its Send assigned"""
+    if isinstance(node_input, dict):
+        return node_input.get("detected_task")
+    return None
@@ -0,0 +1,250 @@
+"""
+Request Tracing
+Lightweight per-request traces: a span for every graph node, extractor and
+LLM call with its duration, input size and token counts. Traces slower than
+TRACE_SLOW_MS are kept in a ring buffer for /debug/traces and optionally
+appended to a JSON-lines file in the OTLP/JSON shape OpenTelemetry tools read.
+"""
+
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import inspect
+import json
+import os
+import secrets
+import threading
+import time
+
+
+SERVICE_NAME = "agentic-content-processor"
+
+# OTLP span status codes
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Optional[str]] = ContextVar("current_span", default=None)
+
+
+def tracing_enabled() -> bool:
+    return os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+@dataclass
+class Trace:
+    """
+    Spans of one request
+
+    A dataclass so it survives follow-up checkpoints. Spans are plain dicts;
+    parallel graph branches append to the same list.
+    """
+
+    trace_id: str = field(default_factory=lambda: secrets.token_hex(16))
+    root_span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    start_ns: int = field(default_factory=time.time_ns)
+    end_ns: Optional[int] = None
+    spans: List[Dict] = field(default_factory=list)
+
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+def start_trace() -> Optional[Trace]:
+    return Trace() if tracing_enabled() else None
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]) -> Iterator[None]:
+    """Make `trace` the current trace, so spans opened in this context land in it"""
+    token = _current_trace.set(trace)
+    try:
+        yield
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Dict]:
+    """
+    Record a span in the current trace (a no-op outside one)
+
+    Yields the span's attributes dict so the caller can add results such as
+    token counts before the span ends.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield attributes
+        return
+
+    record = {
+        "span_id": secrets.token_hex(8),
+        "parent_span_id": _current_span.get() or trace.root_span_id,
+        "name": name,
+        "start_ns": time.time_ns(),
+        "attributes": attributes,
+        "status": {"code": STATUS_OK}
+    }
+    token = _current_span.set(record["span_id"])
+
+    try:
+        yield attributes
+    except BaseException as e:
+        record["status"] = {"code": STATUS_ERROR, "message": str(e)}
+        raise
+    finally:
+        _current_span.reset(token)
+        record["end_ns"] = time.time_ns()
+        trace.spans.append(record)
+
+
+def node_attributes(state: Dict, input_size: Callable[[Dict], int]) -> Dict:
+    return {"input_chars": input_size(state), "task": state.get('detected_task')}
+
+
+def traced_node(name: str, node: Callable, input_size: Callable[[Dict], int]) -> Callable:
+    """Wrap a graph node (sync or async) in a span under its state's trace"""
+    if inspect.iscoroutinefunction(node):
+        @wraps(node)
+        async def async_wrapper(state, *args, **kwargs):
+            with use_trace(state.get('trace')), span(f"node.{name}", **node_attributes(state, input_size)):
+                return await node(state, *args, **kwargs)
+        return async_wrapper
+
+    @wraps(node)
+    def wrapper(state, *args, **kwargs):
+        with use_trace(state.get('trace')), span(f"node.{name}", **node_attributes(state, input_size)):
+            return node(state, *args, **kwargs)
+    return wrapper
+
+
+def otlp_value(value: Any) -> Dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def otlp_span(trace: Trace, record: Dict) -> Dict:
+    otlp = {
+        "traceId": trace.trace_id,
+        "spanId": record["span_id"],
+        "name": record["name"],
+        "kind": 1,
+        "startTimeUnixNano": str(record["start_ns"]),
+        "endTimeUnixNano": str(record["end_ns"]),
+        "attributes": [
+            {"key": key, "value": otlp_value(value)}
+            for key, value in record["attributes"].items() if value is not None
+        ],
+        "status": record["status"]
+    }
+    if record.get("parent_span_id"):
+        otlp["parentSpanId"] = record["parent_span_id"]
+    return otlp
+
+
+def to_otlp(trace: Trace) -> Dict:
+    """One trace as an OTLP/JSON ExportTraceServiceRequest"""
+    root = {
+        "span_id": trace.root_span_id,
+        "parent_span_id": None,
+        "name": "request",
+        "start_ns": trace.start_ns,
+        "end_ns": trace.end_ns or time.time_ns(),
+        "attributes": {},
+        "status": {"code": STATUS_OK}
+    }
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [otlp_span(trace, record) for record in [root, *list(trace.spans)]]
+            }]
+        }]
+    }
+
+
+def trace_summary(trace: Trace) -> Dict:
+    """Readable form for /debug/traces: spans in start order with offsets and durations"""
+    spans = sorted(list(trace.spans), key=lambda record: record["start_ns"])
+    return {
+        "trace_id": trace.trace_id,
+        "duration_ms": round(trace.duration_ms(), 1),
+        "spans": [
+            {
+                "name": record["name"],
+                "span_id": record["span_id"],
+                "parent_span_id": record["parent_span_id"],
+                "offset_ms": round((record["start_ns"] - trace.start_ns) / 1e6, 1),
+                "duration_ms": round((record["end_ns"] - record["start_ns"]) / 1e6, 1),
+                "attributes": record["attributes"],
+                "error": record["status"].get("message")
+            }
+            for record in spans
+        ]
+    }
+
+
+class TraceBuffer:
+    """
+    Ring buffer of the most recent slow traces
+
+    Args:
+        max_traces: Traces kept; the oldest is dropped first
+        slow_ms: Traces at least this long are kept (0 keeps every trace)
+        export_path: JSON-lines file each kept trace is appended to (None to disable)
+    """
+
+    def __init__(self, max_traces: int = 100, slow_ms: float = 1000.0, export_path: Optional[str] = None):
+        self.slow_ms = slow_ms
+        self.export_path = export_path
+        self._traces = deque(maxlen=max_traces)
+        self._lock = threading.Lock()
+
+    def record(self, trace: Trace) -> bool:
+        """Finish a trace; returns True if it was slow enough to keep"""
+        if trace.end_ns is None:
+            trace.end_ns = time.time_ns()
+        if trace.duration_ms() < self.slow_ms:
+            return False
+
+        line = json.dumps(to_otlp(trace), default=str) if self.export_path else None
+        with self._lock:
+            self._traces.append(trace)
+            if line:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        return True
+
+    def recent(self, limit: Optional[int] = None) -> List[Trace]:
+        """Kept traces, newest first"""
+        with self._lock:
+            traces = list(reversed(self._traces))
+        return traces[:limit] if limit else traces
+
+
+_trace_buffer = None
+
+
+def get_trace_buffer() -> TraceBuffer:
+    global _trace_buffer
+
+    if _trace_buffer is None:
+        export_path = os.getenv("TRACE_EXPORT_PATH") or None
+        if export_path:
+            os.makedirs(os.path.dirname(export_path) or ".", exist_ok=True)
+        _trace_buffer = TraceBuffer(
+            max_traces=int(os.getenv("TRACE_BUFFER_SIZE", "100")),
+            slow_ms=float(os.getenv("TRACE_SLOW_MS", "1000")),
+            export_path=export_path
+        )
+
+    return _trace_buffer
@@ -0,0 +1,208 @@
+"""
+Content-Addressed Upload Store
+Saves uploads under their SHA-256 hash and caches extraction results so
+re-uploading the same file skips OCR/Whisper entirely
+"""
+
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+
+
+CHUNK_SIZE = 1024 * 1024
+HASH_PATTERN = re.compile(r"[0-9a-f]{64}")
+
+
+class UploadStore:
+    """
+    Upload blobs and extraction cache entries sharing one size quota
+
+    Files are evicted least-recently-used first once the quota is exceeded.
+    Access time is tracked through file mtimes so several workers sharing
+    the directory see the same LRU order. Blobs pinned by requests still
+    waiting to be processed in this process are never evicted.
+
+    Args:
+        root_dir: Directory holding uploads (cache lives in root_dir/cache)
+        max_bytes: Total size quota for uploads plus cache entries
+    """
+
+    def __init__(self, root_dir: str, max_bytes: int):
+        self.root = Path(root_dir)
+        self.cache_dir = self.root / "cache"
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cache_dir.mkdir(exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._pins: Dict[str, int] = {}  # Blob name -> requests using it
+        self._total_bytes = sum(size for _, size, _ in self._scan())
+
+    def save(self, fileobj: BinaryIO, filename: str, pin: bool = False) -> Path:
+        """
+        Stream an upload to disk while hashing it
+
+        Args:
+            fileobj: Readable binary file object
+            filename: Original filename (only the extension is kept)
+            pin: Keep the blob from eviction until unpin() is called
+
+        Returns:
+            Path of the stored blob, named <sha256><ext>
+        """
+        suffix = Path(filename).suffix.lower()
+        tmp_path = self.root / f".tmp-{uuid.uuid4().hex}"
+        digest = hashlib.sha256()
+        size = 0
+
+        try:
+            with open(tmp_path, "wb") as buffer:
+                while True:
+                    chunk = fileobj.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    buffer.write(chunk)
+                    size += len(chunk)
+
+            final_path = self.root / f"{digest.hexdigest()}{suffix}"
+            if pin:
+                self.pin(final_path)
+            if final_path.exists():
+                tmp_path.unlink()
+                self._touch(final_path)
+            else:
+                os.replace(tmp_path, final_path)
+                self._account(size)
+        finally:
+            if tmp_path.exists():
+                tmp_path.unlink()
+
+        return final_path
+
+    def pin(self, path: Path):
+        with self._lock:
+            self._pins[path.name] = self._pins.get(path.name, 0) + 1
+
+    def unpin(self, path: Path):
+        with self._lock:
+            count = self._pins.get(path.name, 0) - 1
+            if count > 0:
+                self._pins[path.name] = count
+            else:
+                self._pins.pop(path.name, None)
+
+    def hash_for_path(self, file_path: str) -> Optional[str]:
+        """Return the content hash if file_path is a blob in this store"""
+        path = Path(file_path)
+        if path.parent.resolve() != self.root.resolve():
+            return None
+        if not HASH_PATTERN.fullmatch(path.stem):
+            return None
+        return path.stem
+
+    def cached_extraction(
+        self,
+        file_path: str,
+        extractor_name: str,
+        extractor_version: str,
+        extractor: Callable[[str], Tuple[str, Dict]]
+    ) -> Tuple[str, Dict]:
+        """
+        Run an extractor, reusing a cached (text, metadata) for the same content
+
+        Files outside the store are extracted without caching.
+        """
+        content_hash = self.hash_for_path(file_path)
+        if content_hash is None:
+            return extractor(file_path)
+
+        cache_path = self.cache_dir / f"{content_hash}.{extractor_name}.{extractor_version}.json"
+
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            self._touch(cache_path)
+            metadata = entry["metadata"]
+            metadata["extraction_cached"] = True
+            return entry["text"], metadata
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+
+        text, metadata = extractor(file_path)
+
+        payload = json.dumps({"text": text, "metadata": metadata}, default=str)
+        tmp_path = cache_path.with_suffix(f".tmp-{uuid.uuid4().hex}")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_path, cache_path)
+        self._account(len(payload.encode("utf-8")))
+
+        return text, metadata
+
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def _touch(self, path: Path):
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+
+    def _account(self, size: int):
+        with self._lock:
+            self._total_bytes += size
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Delete least-recently-used unpinned files until under quota"""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+
+        for path, size, _ in entries:
+            if total <= self.max_bytes:
+                break
+            if path.parent == self.root and path.name in self._pins:
+                continue
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                total -= size
+
+        self._total_bytes = total
+
+    def _scan(self):
+        """List (path, size, mtime) for stored blobs and cache entries"""
+        entries = []
+        for directory in (self.root, self.cache_dir):
+            for path in directory.iterdir():
+                if not path.is_file() or path.name.startswith(".tmp-") or ".tmp-" in path.suffix:
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+
+_upload_store = None
+
+
+def get_upload_store() -> UploadStore:
+    """Get the process-wide upload store"""
+    global _upload_store
+
+    if _upload_store is None:
+        _upload_store = UploadStore(
+            root_dir=os.getenv("UPLOAD_DIR", "uploads"),
+            max_bytes=int(os.getenv("UPLOAD_STORE_MAX_MB", "2048")) * 1024 * 1024
+        )
+
+    return _upload_store
@@ -0,0 +1,120 @@
+"""
+Startup Warmup
+Preloads heavy models and checks external binaries before the pod reports
+ready, so the first real request does not pay cold-start latency
+"""
+
+from typing import Callable, Dict, List, Optional, Tuple
+import os
+import shutil
+import threading
+import time
+
+
+def env_flag(name: str, default: bool) -> bool:
+    return os.getenv(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+
+class WarmupState:
+    """Tracks warmup progress for the /ready endpoint"""
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.checks: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.finished and all(check["ok"] for check in self.checks.values())
+
+    def record(self, name: str, ok: bool, seconds: float, error: Optional[str] = None, detail: Optional[str] = None):
+        with self._lock:
+            self.checks[name] = {"ok": ok, "seconds": round(seconds, 3), "error": error, "detail": detail}
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            if self.ready:
+                status = "ready"
+            elif self.finished:
+                status = "not_ready"
+            else:
+                status = "warming_up"
+            return {"status": status, "checks": dict(self.checks)}
+
+
+def check_binaries():
+    """Fail if tesseract or poppler (used by pdf2image) is missing"""
+    missing = [name for name in ("tesseract", "pdftoppm") if shutil.which(name) is None]
+    if missing:
+        raise RuntimeError(f"Missing binaries: {', '.join(missing)}")
+
+
+def load_whisper():
+    from backend.extractors.audio import get_whisper_model
+    get_whisper_model()
+
+
+def build_llm_clients():
+    # Importing the graph registers every task's prompt chain
+    import backend.agent.graph  # noqa: F401
+    from backend.llm.config import build_all_chains
+
+    build_all_chains()
+
+
+def load_tokenizer() -> str:
+    """Wait for the prompt tokenizer; without it budgets use the estimate, which is reported, not failed"""
+    from backend.llm.tokens import tokenizer_name, wait_for_encoding
+
+    wait_for_encoding(float(os.getenv("TOKENIZER_LOAD_TIMEOUT_SECONDS", "30")))
+    return tokenizer_name()
+
+
+def dummy_graph_run(workflow) -> Callable[[], None]:
+    def run():
+        from backend.agent.state import create_initial_state, InputType
+
+        state = create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="Summarize: warmup request."
+        )
+        result = workflow.invoke(state)
+        if result.get("errors"):
+            raise RuntimeError("; ".join(result["errors"]))
+
+    return run
+
+
+def warmup_steps(workflow=None) -> List[Tuple[str, Callable[[], Optional[str]]]]:
+    """Build the list of warmup steps enabled by configuration"""
+    steps = []
+
+    if env_flag("WARMUP_CHECK_BINARIES", True):
+        steps.append(("binaries", check_binaries))
+    if env_flag("WARMUP_WHISPER", True):
+        steps.append(("whisper", load_whisper))
+    if env_flag("WARMUP_LLM", True):
+        steps.append(("llm_clients", build_llm_clients))
+        steps.append(("tokenizer", load_tokenizer))
+    if workflow is not None and env_flag("WARMUP_DUMMY_RUN", False):
+        steps.append(("dummy_run", dummy_graph_run(workflow)))
+
+    return steps
+
+
+def run_warmup(state: WarmupState, steps: List[Tuple[str, Callable[[], Optional[str]]]]):
+    """Run each step, recording timing, failures and any detail it returns; never raises"""
+    state.started = True
+
+    for name, step in steps:
+        print(f"[WARMUP] {name}")
+        started = time.perf_counter()
+        try:
+            detail = step()
+            state.record(name, True, time.perf_counter() - started, detail=detail)
+        except Exception as e:
+            print(f"[WARMUP] {name} failed: {str(e)}")
+            state.record(name, False, time.perf_counter() - started, str(e))
+
+    state.finished = True
@@ -1,15 +1,11 @@
 from typing import Dict
 from langchain.prompts import ChatPromptTemplate
-from backend.llm.config import get_llm
+from backend.llm.config import get_chain, register_chain
+from backend.services.metrics import timed_task
 
 
-def explain_code(code: str, language: str = None) -> Dict:
-    llm = get_llm(temperature=0.2)
-    
-    language_hint = f"This appears to be {language} code." if language else "Detect the programming language."
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert code reviewer and computer science educator.
+CODE_EXPLAIN_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert code reviewer and computer science educator.
 
 Your task is to analyze code and provide:
 1. EXPLANATION - A clear 2-3 sentence explanation of what the code does
@@ -32,7 +28,7 @@ Time: O(n)
 Space: O(1)
 
 Be specific, educational, and helpful. Focus on helping the user understand the code."""),
-        ("user", """{language_hint}
+    ("user", """{language_hint}
 
 Code to analyze:
 ```
@@ -43,37 +39,65 @@ Please provide:
 1. Explanation of what this code does
 2. Any bugs or issues you detect
 3. Time and space complexity analysis""")
-    ])
+])
+
+register_chain("code_explain", CODE_EXPLAIN_PROMPT, route="code_explain")
+
+
+@timed_task("code_explain")
+def explain_code(code: str, language: str = None) -> Dict:
+    chain = get_chain("code_explain")
     
-    chain = prompt | llm
+    try:
+        print("Analyzing code with LLM...")
+        response = chain.invoke(code_inputs(chain, code, language))
+        return code_result(response.content, language)
+    except Exception as e:
+        return code_error(e, language)
+
+
+@timed_task("code_explain")
+async def aexplain_code(code: str, language: str = None) -> Dict:
+    """Async variant of explain_code"""
+    chain = get_chain("code_explain")
     
     try:
         print("Analyzing code with LLM...")
-        response = chain.invoke({
-            "code": code[:3000],  # Limit code length to avoid token limits
-            "language_hint": language_hint
-        })
-        
-        content = response.content
-        result = parse_code_explanation(content)
-        
-        result["success"] = True
-        result["language"] = language
-        
-        print("Code analysis complete!")
-        return result
-        
+        response = await chain.ainvoke(code_inputs(chain, code, language))
+        return code_result(response.content, language)
     except Exception as e:
-        print(f"Error during code explanation: {str(e)}")
-        return {
-            "success": False,
-            "error": str(e),
-            "explanation": "Error analyzing code",
-            "bugs": ["Could not analyze for bugs"],
-            "time_complexity": "Unknown",
-            "space_complexity": "Unknown",
-            "language": language
-        }
+        return code_error(e, language)
+
+
+def code_inputs(chain, code: str, language: str = None) -> Dict:
+    """Prompt inputs with the code trimmed to the stage's token budget"""
+    language_hint = f"This appears to be {language} code." if language else "Detect the programming language."
+    inputs = {"code": code, "language_hint": language_hint}
+    inputs["code"] = chain.fit_input(inputs, "code")
+    return inputs
+
+
+def code_result(content: str, language: str = None) -> Dict:
+    result = parse_code_explanation(content)
+    
+    result["success"] = True
+    result["language"] = language
+    
+    print("Code analysis complete!")
+    return result
+
+
+def code_error(e: Exception, language: str = None) -> Dict:
+    print(f"Error during code explanation: {str(e)}")
+    return {
+        "success": False,
+        "error": str(e),
+        "explanation": "Error analyzing code",
+        "bugs": ["Could not analyze for bugs"],
+        "time_complexity": "Unknown",
+        "space_complexity": "Unknown",
+        "language": language
+    }
 
 
 def parse_code_explanation(content: str) -> Dict:
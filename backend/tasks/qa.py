@@ -1,66 +1,157 @@
-from typing import Dict
+from typing import Dict, Optional
 from langchain.prompts import ChatPromptTemplate
-from backend.llm.config import get_llm
+from backend.llm.config import get_chain, register_chain
+from backend.llm.retrieval import get_chunk_index, needs_index, query_text, retrieve_context
+from backend.llm.semantic_cache import get_semantic_cache
+from backend.services.metrics import timed_task
+from backend.services.tracing import span
+import asyncio
 
 
-def answer_question(question: str, context: str = "") -> Dict:
+QA_CONTEXT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a helpful assistant that answers questions based on provided context.
+If the answer is in the context, provide a clear and accurate response.
+If the answer is not in the context, say so and provide general knowledge if appropriate.
+Be concise, friendly, and helpful."""),
+    ("user", """Context:
+{context}
+
+Question: {question}
+
+Answer:""")
+])
+
+QA_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are a helpful, friendly assistant.
+Provide clear, accurate, and conversational responses.
+Be concise but thorough."""),
+    ("user", "{question}")
+])
+
+EXTRACT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert at extracting action items from meeting notes and documents.
+Action items are tasks, to-dos, or decisions that require follow-up.
+
+Extract ALL action items and format them as a numbered list.
+For each action item, include:
+- What needs to be done
+- Who is responsible (if mentioned)
+- Deadline (if mentioned)
+
+If no clear action items exist, say "No specific action items found."""),
+    ("user", """Extract action items from this text:
+
+{text}
+
+Action items:""")
+])
+
+register_chain("qa_context", QA_CONTEXT_PROMPT, route="qa")
+register_chain("qa", QA_PROMPT, route="qa")
+register_chain("extract", EXTRACT_PROMPT, route="extract")
+
+
+@timed_task("qa")
+def answer_question(question: str, context: str = "", context_key: Optional[str] = None) -> Dict:
     """
     Answer a question, optionally with context
     
     Args:
         question: The question to answer
-        context: Optional context from extracted content
+        context: Optional context from extracted content; a long document
+            is indexed and only the chunks relevant to the question are used
+        context_key: Content key of the context, caching its index without hashing it
         
     Returns:
         Dict with answer
     """
-    llm = get_llm(temperature=0.3)
+    chain = get_chain("qa_context" if context else "qa")
+    inputs = qa_inputs(chain, question, context, context_key)
     
-    if context:
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a helpful assistant that answers questions based on provided context.
-If the answer is in the context, provide a clear and accurate response.
-If the answer is not in the context, say so and provide general knowledge if appropriate.
-Be concise, friendly, and helpful."""),
-            ("user", """Context:
-{context}
+    # Only context QA is matched semantically, and only for the exact same question
+    semantic_cache = get_semantic_cache() if context else None
+    if semantic_cache:
+        cached = semantic_cache.lookup("qa", inputs["context"], discriminator=inputs["question"].strip().lower())
+        if cached is not None:
+            return cached
+    
+    try:
+        response = chain.invoke(inputs)
+        return qa_result(response.content, inputs, semantic_cache)
+    except Exception as e:
+        return qa_error(e)
 
-Question: {question}
 
-Answer:""")
-        ])
+@timed_task("qa")
+async def aanswer_question(question: str, context: str = "", context_key: Optional[str] = None) -> Dict:
+    """Async variant of answer_question"""
+    chain = get_chain("qa_context" if context else "qa")
+    if context and needs_index(context):
+        # Indexing a long document takes a while: keep it off the event loop
+        inputs = await asyncio.to_thread(qa_inputs, chain, question, context, context_key)
     else:
-        prompt = ChatPromptTemplate.from_messages([
-            ("system", """You are a helpful, friendly assistant.
-Provide clear, accurate, and conversational responses.
-Be concise but thorough."""),
-            ("user", "{question}")
-        ])
+        inputs = qa_inputs(chain, question, context, context_key)
     
-    chain = prompt | llm
+    semantic_cache = get_semantic_cache() if context else None
+    if semantic_cache:
+        cached = semantic_cache.lookup("qa", inputs["context"], discriminator=inputs["question"].strip().lower())
+        if cached is not None:
+            return cached
     
     try:
-        if context:
-            response = chain.invoke({
-                "question": question,
-                "context": context[:3000]  # Limit context length
-            })
-        else:
-            response = chain.invoke({"question": question})
-        
-        return {
-            "success": True,
-            "answer": response.content.strip()
-        }
-        
+        response = await chain.ainvoke(inputs)
+        return qa_result(response.content, inputs, semantic_cache)
     except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "answer": "I apologize, but I encountered an error while processing your question."
-        }
+        return qa_error(e)
+
+
+def qa_inputs(chain, question: str, context: str, context_key: Optional[str] = None) -> Dict:
+    """
+    Prompt inputs with the context cut to the stage's token budget
+    
+    A long document contributes the chunks most relevant to the question,
+    so the prompt stays the same size however long the document is.
+    """
+    if not context:
+        return {"question": question}
+    
+    inputs = {"question": question, "context": context}
+    if not needs_index(context):
+        inputs["context"] = chain.fit_input(inputs, "context")
+        return inputs
+    
+    # Pasted text is both the question and the context: ask with its ends
+    inputs["question"] = query_text(question)
+    with span("retrieval.index", input_chars=len(context)) as attributes:
+        index = get_chunk_index(context, context_key)
+        attributes["chunks"] = len(index)
+    with span("retrieval.query") as attributes:
+        inputs["context"] = retrieve_context(index, context, question, chain.field_budget(inputs, "context"))
+        attributes["context_chars"] = len(inputs["context"])
+    return inputs
+
+
+def qa_result(content: str, inputs: Dict, semantic_cache) -> Dict:
+    result = {
+        "success": True,
+        "answer": content.strip()
+    }
+    
+    if semantic_cache:
+        semantic_cache.store("qa", inputs["context"], result, discriminator=inputs["question"].strip().lower())
+    
+    return result
+
 
+def qa_error(e: Exception) -> Dict:
+    return {
+        "success": False,
+        "error": str(e),
+        "answer": "I apologize, but I encountered an error while processing your question."
+    }
 
+
+@timed_task("extract")
 def extract_action_items(text: str) -> Dict:
     """
     Extract action items from meeting notes or similar text
@@ -71,58 +162,57 @@ def extract_action_items(text: str) -> Dict:
     Returns:
         Dict with list of action items
     """
-    llm = get_llm(temperature=0.2)
+    chain = get_chain("extract")
     
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at extracting action items from meeting notes and documents.
-Action items are tasks, to-dos, or decisions that require follow-up.
+    try:
+        response = chain.invoke({"text": chain.fit_input({"text": text}, "text")})
+        return action_items_result(response.content)
+    except Exception as e:
+        return action_items_error(e)
 
-Extract ALL action items and format them as a numbered list.
-For each action item, include:
-- What needs to be done
-- Who is responsible (if mentioned)
-- Deadline (if mentioned)
 
-If no clear action items exist, say "No specific action items found."""),
-        ("user", """Extract action items from this text:
+@timed_task("extract")
+async def aextract_action_items(text: str) -> Dict:
+    """Async variant of extract_action_items"""
+    chain = get_chain("extract")
+    
+    try:
+        response = await chain.ainvoke({"text": chain.fit_input({"text": text}, "text")})
+        return action_items_result(response.content)
+    except Exception as e:
+        return action_items_error(e)
 
-{text}
 
-Action items:""")
-    ])
+def action_items_result(content: str) -> Dict:
+    content = content.strip()
     
-    chain = prompt | llm
+    # Parse action items into a list
+    action_items = []
+    lines = content.split('\n')
     
-    try:
-        response = chain.invoke({"text": text[:4000]})
-        content = response.content.strip()
-        
-        # Parse action items into a list
-        action_items = []
-        lines = content.split('\n')
-        
-        for line in lines:
-            line = line.strip()
-            if line and (line[0].isdigit() or line.startswith('-') or line.startswith('•')):
-                # Remove numbering/bullets
-                cleaned = line.lstrip('0123456789.-•*').strip()
-                if cleaned:
-                    action_items.append(cleaned)
-        
-        if not action_items and content:
-            # Fallback: treat the whole response as one item
-            action_items = [content]
-        
-        return {
-            "success": True,
-            "action_items": action_items,
-            "count": len(action_items)
-        }
-        
-    except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "action_items": [],
-            "count": 0
-        }
\ No newline at end of file
+    for line in lines:
+        line = line.strip()
+        if line and (line[0].isdigit() or line.startswith('-') or line.startswith('•')):
+            # Remove numbering/bullets
+            cleaned = line.lstrip('0123456789.-•*').strip()
+            if cleaned:
+                action_items.append(cleaned)
+    
+    if not action_items and content:
+        # Fallback: treat the whole response as one item
+        action_items = [content]
+    
+    return {
+        "success": True,
+        "action_items": action_items,
+        "count": len(action_items)
+    }
+
+
+def action_items_error(e: Exception) -> Dict:
+    return {
+        "success": False,
+        "error": str(e),
+        "action_items": [],
+        "count": 0
+    }
@@ -1,13 +1,12 @@
 from typing import Dict
 from langchain.prompts import ChatPromptTemplate
-from backend.llm.config import get_llm
+from backend.llm.config import get_chain, register_chain
+from backend.llm.semantic_cache import get_semantic_cache
+from backend.services.metrics import timed_task
 
 
-def analyze_sentiment(text: str) -> Dict:
-    llm = get_llm(temperature=0.1)
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert sentiment analyzer.
+SENTIMENT_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert sentiment analyzer.
 
 Analyze the sentiment of the text and provide your response in this EXACT format:
 
@@ -25,32 +24,71 @@ Example response:
 SENTIMENT: positive
 CONFIDENCE: 0.85
 JUSTIFICATION: The text expresses enthusiasm and satisfaction with clear positive language and emotional words."""),
-        ("user", "Analyze the sentiment of this text:\n\n{text}")
-    ])
+    ("user", "Analyze the sentiment of this text:\n\n{text}")
+])
+
+register_chain("sentiment", SENTIMENT_PROMPT, route="sentiment")
+
+
+@timed_task("sentiment")
+def analyze_sentiment(text: str) -> Dict:
+    chain = get_chain("sentiment")
     
-    chain = prompt | llm
+    text = chain.fit_input({"text": text}, "text")
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        cached = semantic_cache.lookup("sentiment", text)
+        if cached is not None:
+            return cached
     
     try:
         print("Analyzing sentiment with LLM...")
-        response = chain.invoke({"text": text[:2000]})  # Limit text length
-        
-        content = response.content
-        result = parse_sentiment_response(content)
-        
-        result["success"] = True
-        
-        print(f"Sentiment analysis complete! Detected: {result['label']} ({result['confidence']})")
-        return result
-        
+        response = chain.invoke({"text": text})
+        return sentiment_result(response.content, text, semantic_cache)
+    except Exception as e:
+        return sentiment_error(e)
+
+
+@timed_task("sentiment")
+async def aanalyze_sentiment(text: str) -> Dict:
+    """Async variant of analyze_sentiment"""
+    chain = get_chain("sentiment")
+    
+    text = chain.fit_input({"text": text}, "text")
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        cached = semantic_cache.lookup("sentiment", text)
+        if cached is not None:
+            return cached
+    
+    try:
+        print("Analyzing sentiment with LLM...")
+        response = await chain.ainvoke({"text": text})
+        return sentiment_result(response.content, text, semantic_cache)
     except Exception as e:
-        print(f"Error during sentiment analysis: {str(e)}")
-        return {
-            "success": False,
-            "error": str(e),
-            "label": "neutral",
-            "confidence": 0.0,
-            "justification": "Error occurred during sentiment analysis"
-        }
+        return sentiment_error(e)
+
+
+def sentiment_result(content: str, text: str, semantic_cache) -> Dict:
+    result = parse_sentiment_response(content)
+    result["success"] = True
+    
+    if semantic_cache:
+        semantic_cache.store("sentiment", text, result)
+    
+    print(f"Sentiment analysis complete! Detected: {result['label']} ({result['confidence']})")
+    return result
+
+
+def sentiment_error(e: Exception) -> Dict:
+    print(f"Error during sentiment analysis: {str(e)}")
+    return {
+        "success": False,
+        "error": str(e),
+        "label": "neutral",
+        "confidence": 0.0,
+        "justification": "Error occurred during sentiment analysis"
+    }
 
 
 def parse_sentiment_response(content: str) -> Dict:
@@ -1,26 +1,18 @@
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
 from langchain.prompts import ChatPromptTemplate
-from backend.llm.config import get_llm
+from backend.agent.artifacts import TextView
+from backend.llm.config import get_chain, register_chain
+from backend.llm.semantic_cache import get_semantic_cache
+from backend.llm.tokens import chunk_by_tokens, count_tokens
+from backend.services.metrics import timed_task
+import asyncio
+import contextvars
+import os
 
 
-def summarize_text(text: str, context: str = "") -> Dict:
-    """
-    Summarize text in three formats:
-    1. One-line summary
-    2. Three bullet points
-    3. Five-sentence summary
-    
-    Args:
-        text: Text to summarize
-        context: Additional context about the text
-        
-    Returns:
-        Dict with all three summary formats
-    """
-    llm = get_llm(temperature=0.3)
-    
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", """You are an expert at creating clear, concise summaries.
+SUMMARIZE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You are an expert at creating clear, concise summaries.
 You must provide exactly three types of summaries:
 1. A single-line summary (one sentence, max 20 words)
 2. Three bullet points highlighting key points
@@ -36,38 +28,254 @@ BULLETS:
 
 FIVE-SENTENCES:
 [sentence 1] [sentence 2] [sentence 3] [sentence 4] [sentence 5]"""),
-        ("user", """Text to summarize:
+    ("user", """Text to summarize:
 {text}
 
 {context}
 
 Provide the three summary formats.""")
-    ])
+])
+
+register_chain("summarize", SUMMARIZE_PROMPT, route="summarize")
+
+# Map and reduce steps of long-document mode: condense one section (or a
+# group of section notes) into notes that are summarized as a whole
+SECTION_NOTES_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """You condense one section of a long document so the whole document can be summarized later.
+Write the section's key facts, names, numbers, decisions and conclusions as 3 to 6 short sentences of plain prose.
+Do not add anything that is not in the section.
+Respond with the section notes only."""),
+    ("user", """Section ({label}):
+{text}
+
+Section notes:""")
+])
+
+register_chain("summarize_chunk", SECTION_NOTES_PROMPT, route="summarize_chunk", stream=False)
+
+# Sections condensed at once per document
+MAP_REDUCE_CONCURRENCY = int(os.getenv("SUMMARY_MAP_REDUCE_CONCURRENCY", "4"))
+
+# Reduce levels before the remaining notes are trimmed to fit
+MAP_REDUCE_MAX_LEVELS = 4
+
+
+def map_reduce_enabled() -> bool:
+    return os.getenv("SUMMARY_MAP_REDUCE", "true").lower() in ("1", "true", "yes")
+
+
+@timed_task("summarize")
+def summarize_text(text: str, context: str = "") -> Dict:
+    """
+    Summarize text in three formats:
+    1. One-line summary
+    2. Three bullet points
+    3. Five-sentence summary
     
-    chain = prompt | llm
+    Args:
+        text: Text to summarize
+        context: Additional context about the text
+        
+    Returns:
+        Dict with all three summary formats
+    """
+    chain = get_chain("summarize")
+    inputs = summary_inputs(chain, text, context)
+    
+    if is_truncated(inputs, text):
+        sections = document_sections(text)
+        if len(sections) > 1:
+            return summarize_long(sections, context)
+    
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        cached = semantic_cache.lookup("summarize", inputs["text"], discriminator=inputs["context"])
+        if cached is not None:
+            return cached
     
     try:
-        response = chain.invoke({
-            "text": text[:4000],  # Limit text length
-            "context": f"Context: {context}" if context else ""
-        })
-        
-        # Parse the response
-        content = response.content
-        
-        result = parse_summary_response(content)
-        result["success"] = True
+        response = chain.invoke(inputs)
+        return summary_result(response.content, inputs, semantic_cache)
+    except Exception as e:
+        return summary_error(e)
+
+
+@timed_task("summarize")
+async def asummarize_text(text: str, context: str = "") -> Dict:
+    """Async variant of summarize_text"""
+    chain = get_chain("summarize")
+    inputs = summary_inputs(chain, text, context)
+    
+    if is_truncated(inputs, text):
+        # Chunking a multi-megabyte document takes a while: keep it off the event loop
+        sections = await asyncio.to_thread(document_sections, text)
+        if len(sections) > 1:
+            return await asummarize_long(sections, context)
+    
+    semantic_cache = get_semantic_cache()
+    if semantic_cache:
+        cached = semantic_cache.lookup("summarize", inputs["text"], discriminator=inputs["context"])
+        if cached is not None:
+            return cached
+    
+    try:
+        response = await chain.ainvoke(inputs)
+        return summary_result(response.content, inputs, semantic_cache)
+    except Exception as e:
+        return summary_error(e)
+
+
+def summary_inputs(chain, text: str, context: str) -> Dict:
+    """Prompt inputs with the text trimmed to the stage's token budget"""
+    context = f"Context: {context}" if context else ""
+    return {
+        "text": chain.fit_input({"text": text, "context": context}, "text"),
+        "context": context
+    }
+
+
+def is_truncated(inputs: Dict, text) -> bool:
+    """Whether the summary prompt had to drop part of the text (long-document mode applies)"""
+    view = TextView(text) if isinstance(text, str) else text
+    return map_reduce_enabled() and len(inputs["text"]) < len(view.strip())
+
+
+def document_sections(text) -> List[tuple]:
+    """(label, text) sections that each fit one section-notes call"""
+    budget = section_budget(get_chain("summarize_chunk"))
+    return [(section_label(chunk), chunk["text"]) for chunk in chunk_by_tokens(text, budget)]
+
+
+def summarize_long(sections: List[tuple], context: str = "") -> Dict:
+    """
+    Map-reduce summary of a document too long for one prompt
+    
+    Sections (from document_sections) are condensed into notes in parallel (at most
+    SUMMARY_MAP_REDUCE_CONCURRENCY calls at a time); groups of notes are
+    condensed again until they fit the summarize prompt, which produces
+    the usual three formats. Latency grows with the number of levels,
+    not the number of sections.
+    """
+    chunk_chain = get_chain("summarize_chunk")
+    
+    try:
+        with ThreadPoolExecutor(max_workers=MAP_REDUCE_CONCURRENCY) as pool:
+            def condense(batch):
+                # Each call keeps the caller's trace context
+                futures = [
+                    pool.submit(contextvars.copy_context().run, chunk_chain.invoke, {"label": label, "text": section})
+                    for label, section in batch
+                ]
+                return [future.result().content.strip() for future in futures]
+            
+            notes = condense(sections)
+            levels = 1
+            while not notes_fit(notes) and levels < MAP_REDUCE_MAX_LEVELS:
+                notes = condense(note_groups(notes, section_budget(chunk_chain)))
+                levels += 1
         
-        return result
+        chain = get_chain("summarize")
+        inputs = summary_inputs(chain, join_notes(notes), context)
+        response = chain.invoke(inputs)
+        return map_reduce_result(response.content, len(sections), levels)
+    except Exception as e:
+        return summary_error(e)
+
+
+async def asummarize_long(sections: List[tuple], context: str = "") -> Dict:
+    """Async variant of summarize_long"""
+    chunk_chain = get_chain("summarize_chunk")
+    semaphore = asyncio.Semaphore(MAP_REDUCE_CONCURRENCY)
+    
+    async def condense_one(label: str, section: str) -> str:
+        async with semaphore:
+            response = await chunk_chain.ainvoke({"label": label, "text": section})
+        return response.content.strip()
+    
+    async def condense(batch) -> List[str]:
+        return list(await asyncio.gather(*(condense_one(label, section) for label, section in batch)))
+    
+    try:
+        notes = await condense(sections)
+        levels = 1
+        while not notes_fit(notes) and levels < MAP_REDUCE_MAX_LEVELS:
+            notes = await condense(note_groups(notes, section_budget(chunk_chain)))
+            levels += 1
         
+        chain = get_chain("summarize")
+        inputs = summary_inputs(chain, join_notes(notes), context)
+        response = await chain.ainvoke(inputs)
+        return map_reduce_result(response.content, len(sections), levels)
     except Exception as e:
-        return {
-            "success": False,
-            "error": str(e),
-            "one_liner": "Error generating summary",
-            "bullets": ["Error occurred"],
-            "five_sentences": "An error occurred while generating the summary."
-        }
+        return summary_error(e)
+
+
+def section_budget(chunk_chain) -> int:
+    """Tokens of document text one section-notes call can take"""
+    return chunk_chain.field_budget({"label": "pages 9999-9999", "text": ""}, "text")
+
+
+def section_label(chunk: Dict) -> str:
+    if chunk["first_page"] is None:
+        return "part of the document"
+    if chunk["first_page"] == chunk["last_page"]:
+        return f"page {chunk['first_page']}"
+    return f"pages {chunk['first_page']}-{chunk['last_page']}"
+
+
+def join_notes(notes: List[str]) -> str:
+    return "\n\n".join(notes)
+
+
+def notes_fit(notes: List[str]) -> bool:
+    """Whether the notes fit the final summarize prompt"""
+    chain = get_chain("summarize")
+    return count_tokens(join_notes(notes)) <= chain.field_budget({"text": "", "context": ""}, "text")
+
+
+def note_groups(notes: List[str], max_tokens: int) -> List[tuple]:
+    """Pack consecutive notes into (label, text) groups of at most max_tokens for the next level"""
+    groups = []
+    current, used, first = [], 0, 1
+    
+    for index, note in enumerate(notes, 1):
+        tokens = count_tokens(note)
+        if current and used + tokens > max_tokens:
+            groups.append((f"notes on sections {first}-{index - 1}", join_notes(current)))
+            current, used, first = [], 0, index
+        current.append(note)
+        used += tokens
+    
+    if current:
+        groups.append((f"notes on sections {first}-{len(notes)}", join_notes(current)))
+    return groups
+
+
+def map_reduce_result(content: str, sections: int, levels: int) -> Dict:
+    result = parse_summary_response(content)
+    result["success"] = True
+    result["map_reduce"] = {"sections": sections, "levels": levels}
+    return result
+
+
+def summary_result(content: str, inputs: Dict, semantic_cache) -> Dict:
+    result = parse_summary_response(content)
+    result["success"] = True
+    
+    if semantic_cache:
+        semantic_cache.store("summarize", inputs["text"], result, discriminator=inputs["context"])
+    
+    return result
+
+
+def summary_error(e: Exception) -> Dict:
+    return {
+        "success": False,
+        "error": str(e),
+        "one_liner": "Error generating summary",
+        "bullets": ["Error occurred"],
+        "five_sentences": "An error occurred while generating the summary."
+    }
 
 
 def parse_summary_response(content: str) -> Dict:
@@ -0,0 +1,15 @@
+import os
+import tempfile
+
+# Run the suite offline against the deterministic fake model unless a
+# provider is chosen explicitly (LLM_PROVIDER=groq for live API runs)
+os.environ.setdefault("LLM_PROVIDER", "fake")
+
+# Caches, session checkpoints and uploads go to a throwaway directory, not
+# the repo's cache/ and uploads/. Set before any test module imports the
+# app, whose stores read these paths once.
+_tmp_dir = tempfile.mkdtemp(prefix="agentic-tests-")
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(_tmp_dir, "llm_cache.sqlite3"))
+os.environ.setdefault("LLM_RATE_LIMIT_PATH", os.path.join(_tmp_dir, "rate_limit.sqlite3"))
+os.environ.setdefault("SESSION_DB_PATH", os.path.join(_tmp_dir, "sessions.sqlite3"))
+os.environ.setdefault("UPLOAD_DIR", os.path.join(_tmp_dir, "uploads"))
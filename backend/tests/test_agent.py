@@ -1,5 +1,6 @@
 import pytest
 from backend.agent.graph import create_agent_workflow
+from backend.agent.artifacts import text_preview
 from backend.agent.state import create_initial_state, InputType
 from backend.tasks.summarize import summarize_text
 from backend.tasks.sentiment import analyze_sentiment
@@ -20,7 +21,8 @@ class TestContentExtraction:
         
         result = workflow.invoke(state)
         
-        assert result['extracted_text'] != ""
+        # extracted_text is an artifact handle; check the text it resolves to
+        assert text_preview(result, 100) == "Please summarize this: AI is transforming the world."
         assert 'errors' not in result or len(result['errors']) == 0
     
     def test_youtube_url_detection(self):
@@ -105,6 +107,39 @@ class TestSummarization:
         assert len(result['one_liner']) > 0
 
 
+    def test_long_document_streams_only_final_summary(self, monkeypatch):
+        """Test that map-reduce section notes never reach SSE token events"""
+        import asyncio
+        import json
+        from backend.llm import config, rate_limit
+        from backend.services.streaming import stream_workflow
+        
+        monkeypatch.setenv("LLM_PROVIDER", "fake")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_PROMPT_TOKENS", "600")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_CHUNK_PROMPT_TOKENS", "500")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        document = "".join(
+            f"\n--- Page {page} ---\n" + " ".join(f"Page {page} point {i} covers topic {i % 7}." for i in range(60))
+            for page in range(1, 5)
+        )
+        state = create_initial_state(input_type=InputType.TEXT, raw_input=document, task="summarize")
+        
+        async def collect():
+            return [event async for event in stream_workflow(create_agent_workflow(), state, lambda s: s['result'])]
+        
+        events = asyncio.run(collect())
+        tokens = "".join(
+            json.loads(event.split("data: ", 1)[1])["content"] for event in events if event.startswith("event: token")
+        )
+        result = json.loads(events[-1].split("data: ", 1)[1])
+        
+        assert result['map_reduce']['sections'] > 1
+        assert tokens.startswith("ONE-LINE:") and tokens.count("ONE-LINE:") == 1
+
+
 class TestSentimentAnalysis:
     """Test sentiment analysis task"""
     
@@ -225,6 +260,385 @@ class TestEndToEnd:
             assert result['result']['success'] == True
 
 
+class TestRuleClassifier:
+    """Test the local fast-path intent classifier"""
+    
+    def test_obvious_intents_skip_the_llm(self):
+        """Test that keyword and question rules decide without the LLM"""
+        from backend.agent.intent_rules import classify_by_rules
+        from backend.agent.state import TaskType
+        
+        code = "Explain this:\ndef add(a, b):\n    return a + b\n\nclass Calc:\n    pass"
+        
+        assert classify_by_rules("Please summarize this article.", InputType.TEXT)['task'] == TaskType.SUMMARIZE
+        assert classify_by_rules("What's the sentiment here: great!", InputType.TEXT)['task'] == TaskType.SENTIMENT
+        assert classify_by_rules("List the action items from: ...", InputType.TEXT)['task'] == TaskType.EXTRACT
+        assert classify_by_rules(code, InputType.TEXT)['task'] == TaskType.CODE_EXPLAIN
+        assert classify_by_rules("Who wrote Hamlet?", InputType.TEXT)['task'] == TaskType.QA
+    
+    def test_ambiguous_inputs_fall_back(self):
+        """Test that unclear, conflicting or extracted content goes to the LLM"""
+        from backend.agent.intent_rules import classify_by_rules
+        
+        assert classify_by_rules("Here is some text about machine learning.", InputType.TEXT) is None
+        assert classify_by_rules("Summarize the sentiment of reviews.", InputType.TEXT) is None
+        assert classify_by_rules("Summary of Q3 results", InputType.PDF) is None
+    
+    def test_path_is_recorded(self):
+        """Test that the result records which classifier chose the task"""
+        workflow = create_agent_workflow()
+        
+        fast = workflow.invoke(create_initial_state(input_type=InputType.TEXT, raw_input="Summarize: AI is here."))
+        slow = workflow.invoke(create_initial_state(input_type=InputType.TEXT, raw_input="Some notes on AI."))
+        
+        assert fast['classifier'] == "rules"
+        assert slow['classifier'] == "llm"
+
+    def test_followup_replies_match_locally(self):
+        """Test keywords, synonyms and a plain "yes" to the offered option"""
+        from backend.agent.intent_rules import classify_followup
+        from backend.agent.state import TaskType
+        
+        offered = "I detected code in the image. Would you like me to explain it, or do something else?"
+        
+        assert classify_followup("summarize it", "") == TaskType.SUMMARIZE
+        assert classify_followup("sentiment please", "") == TaskType.SENTIMENT
+        assert classify_followup("just the gist", "") == TaskType.SUMMARIZE
+        assert classify_followup("what are the next steps", "") == TaskType.EXTRACT
+        assert classify_followup("Yes please", offered) == TaskType.CODE_EXPLAIN
+        assert classify_followup("Who signed the contract?", "") == TaskType.QA
+    
+    def test_ambiguous_followups_fall_back(self):
+        """Test that negated, conflicting or unmatched replies go to the LLM"""
+        from backend.agent.intent_rules import classify_followup
+        
+        assert classify_followup("not a summary, the sentiment", "") is None
+        assert classify_followup("a summary and the sentiment", "") is None
+        assert classify_followup("hmm, whatever you think is best", "") is None
+        assert classify_followup("yes", "What would you like me to do with this content?") is None
+    
+    def test_followup_skips_llm_when_matched(self, monkeypatch):
+        """Test that a matched reply runs the task with a single LLM call"""
+        from backend.agent.graph import process_followup_response
+        from backend.llm import config
+        
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        calls = []
+        invoke = config.CachedChain.invoke
+        monkeypatch.setattr(config.CachedChain, "invoke", lambda self, *a, **kw: calls.append(self.stage) or invoke(self, *a, **kw))
+        workflow = create_agent_workflow()
+        
+        state = workflow.invoke(create_initial_state(input_type=InputType.TEXT, raw_input="Some notes on AI. It is useful."))
+        calls.clear()
+        result = process_followup_response(state, "a quick recap please")
+        
+        assert result['detected_task'] == "summarize"
+        assert result['classifier'] == "rules"
+        assert calls == ["summarize"]
+
+
+class TestSingleCallMode:
+    """Test classifying and executing in one LLM call"""
+    
+    def test_one_call_returns_task_output(self, monkeypatch):
+        """Test that a confident request completes with a single LLM call"""
+        from backend.llm import config
+        
+        monkeypatch.setenv("INTENT_FAST_PATH", "false")
+        calls = []
+        invoke = config.CachedChain.invoke
+        monkeypatch.setattr(config.CachedChain, "invoke", lambda self, *a, **kw: calls.append(1) or invoke(self, *a, **kw))
+        workflow = create_agent_workflow(single_call=True)
+        
+        result = workflow.invoke(create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="Please summarize this: AI is transforming the world. It changes work."
+        ))
+        
+        assert len(calls) == 1
+        assert result['detected_task'] == "summarize"
+        assert len(result['result']['bullets']) == 3
+    
+    def test_long_document_runs_task_separately(self, monkeypatch):
+        """Test that output over a trimmed prompt is dropped so long-document summarisation runs"""
+        from backend.llm import config, rate_limit
+        
+        monkeypatch.setenv("INTENT_FAST_PATH", "false")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setenv("LLM_ROUTE_CLASSIFY_EXECUTE_PROMPT_TOKENS", "900")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_PROMPT_TOKENS", "600")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_CHUNK_PROMPT_TOKENS", "500")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        document = "Please summarize this report." + "".join(
+            f"\n--- Page {page} ---\n" + " ".join(f"Page {page} point {i} covers topic {i % 7}." for i in range(60))
+            for page in range(1, 5)
+        )
+        
+        result = create_agent_workflow(single_call=True).invoke(create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input=document
+        ))
+        
+        assert result['detected_task'] == "summarize"
+        assert result['result']['map_reduce']['sections'] > 1
+    
+    def test_malformed_output_falls_back(self):
+        """Test that structured output missing its header is not used"""
+        from backend.agent.single_call import result_from_output
+        
+        state = create_initial_state(input_type=InputType.TEXT, raw_input="text", task="summarize")
+        
+        assert result_from_output(state, "Sorry, I can't help with that.") is None
+        assert result_from_output(state, "ONE-LINE: Short.\n\nBULLETS:\n• a\n• b\n• c")['one_liner'] == "Short."
+    
+    def test_low_confidence_asks_followup(self, monkeypatch):
+        """Test that an unclear request still goes to the clarification path"""
+        monkeypatch.setenv("INTENT_FAST_PATH", "false")
+        workflow = create_agent_workflow(single_call=True)
+        
+        result = workflow.invoke(create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="Here is some text about machine learning."
+        ))
+        
+        assert result['needs_clarification']
+        assert result['current_step'] == 'awaiting_clarification'
+        assert result['result'] is None
+
+
+class TestMultiTask:
+    """Test running several requested tasks in one request"""
+    
+    def test_tasks_merge_into_result(self):
+        """Test that each requested task's result is merged into the result"""
+        workflow = create_agent_workflow()
+        
+        result = workflow.invoke(create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="We will ship the release by Friday. The team did a great job.",
+            tasks=["summarize", "sentiment", "extract"]
+        ))
+        
+        assert result['result']['success']
+        assert list(result['result']['tasks']) == ["summarize", "sentiment", "extract"]
+        assert result['result']['tasks']['sentiment']['label'] == "positive"
+        assert result['current_step'] == 'task_completed'
+    
+    def test_tasks_run_in_parallel(self, monkeypatch):
+        """Test that wall time is the slowest task, not the sum of all tasks"""
+        import asyncio
+        import time
+        from backend.llm import config, rate_limit
+        
+        monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "300")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        workflow = create_agent_workflow()
+        
+        state = create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="Review this: the launch went well and we should celebrate.",
+            tasks=["summarize", "sentiment", "extract"]
+        )
+        
+        started = time.perf_counter()
+        result = asyncio.run(workflow.ainvoke(state))
+        elapsed = time.perf_counter() - started
+        
+        # Three 300ms calls in sequence would take 0.9s+
+        assert len(result['result']['tasks']) == 3
+        assert elapsed < 0.8
+    
+    def test_parallel_branches_stream_their_own_timings(self, monkeypatch):
+        """Test that each run_task branch has its own node events and a real duration"""
+        import asyncio
+        import json
+        from backend.llm import config, rate_limit
+        from backend.services.streaming import stream_workflow
+        
+        monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "200")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        state = create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="Review this: the launch went well and we should celebrate.",
+            tasks=["summarize", "sentiment", "extract"]
+        )
+        
+        async def collect():
+            return [event async for event in stream_workflow(create_agent_workflow(), state, lambda s: s['result'])]
+        
+        events = [
+            (event.split("\n")[0].replace("event: ", ""), json.loads(event.split("data: ", 1)[1]))
+            for event in asyncio.run(collect())
+        ]
+        starts = {data['task'] for name, data in events if name == "node_start" and data['node'] == "run_task"}
+        ends = {data['task']: data['duration_ms'] for name, data in events if name == "node_end" and data['node'] == "run_task"}
+        
+        assert starts == set(ends) == {"summarize", "sentiment", "extract"}
+        assert all(duration >= 150 for duration in ends.values())
+
+
+class TestCheckpointedFollowup:
+    """Test resuming a paused graph thread with the user's answer"""
+    
+    def test_resume_runs_answered_task(self, tmp_path):
+        """Test that the follow-up answer continues the thread into execute_task"""
+        import asyncio
+        from backend.agent.graph import aresume_followup
+        from backend.services.checkpoints import SessionCheckpointer, thread_config
+        
+        workflow = create_agent_workflow(checkpointer=SessionCheckpointer(str(tmp_path / "sessions.sqlite3")))
+        config = thread_config("s1")
+        
+        paused = workflow.invoke(create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="Here is some text about machine learning. It learns from data."
+        ), config)
+        assert paused['current_step'] == 'awaiting_clarification'
+        assert workflow.get_state(config).next == ("execute_task",)
+        
+        result = asyncio.run(aresume_followup(workflow, config, "Summarize it please"))
+        
+        assert result['detected_task'] == "summarize"
+        assert result['result']['success']
+        assert asyncio.run(aresume_followup(workflow, thread_config("unknown"), "Summarize")) is None
+
+
+    def test_uploaded_document_question_reaches_retrieval(self, tmp_path, monkeypatch):
+        """Test that a follow-up question about an uploaded PDF is what QA retrieves with"""
+        import asyncio
+        from backend.agent import nodes
+        from backend.agent.graph import aresume_followup
+        from backend.services.checkpoints import SessionCheckpointer, thread_config
+        
+        filler = " ".join(f"Filler sentence {i} about general operations." for i in range(40))
+        document = "".join(
+            f"\n--- Page {page} ---\n{filler}" + (" Q3 revenue was 4.2 million dollars." if page == 45 else "")
+            for page in range(1, 61)
+        )
+        monkeypatch.setattr(nodes, "extract_text_from_pdf", lambda path: (document, {"num_pages": 60}))
+        pdf_path = tmp_path / "report.pdf"
+        pdf_path.write_bytes(b"%PDF-1.4 quarterly report")
+        
+        workflow = create_agent_workflow(checkpointer=SessionCheckpointer(str(tmp_path / "sessions.sqlite3")))
+        config = thread_config("s2")
+        
+        paused = workflow.invoke(create_initial_state(
+            input_type=InputType.PDF,
+            raw_input=None,
+            file_path=str(pdf_path)
+        ), config)
+        assert paused['current_step'] == 'awaiting_clarification'
+        
+        result = asyncio.run(aresume_followup(workflow, config, "What was the Q3 revenue?"))
+        
+        assert result['detected_task'] == "qa"
+        # The fake model answers with the start of the retrieved context
+        assert "Page 45" in result['result']['answer']
+
+
+class TestArtifactStore:
+    """Test that large payloads are held once per request and read by handle"""
+    
+    def test_state_carries_handles(self):
+        """Test that text input and its extracted text share one stored artifact"""
+        from backend.agent.artifacts import text_view, resolve
+        
+        text = "Please summarize this: " + "AI is transforming the world. " * 1000
+        workflow = create_agent_workflow()
+        
+        result = workflow.invoke(create_initial_state(input_type=InputType.TEXT, raw_input=text))
+        
+        assert result['extracted_text'] == result['raw_input']
+        assert len(result['artifacts'].items) == 1
+        assert resolve(result, 'raw_input') is text
+        assert str(text_view(result)) is text
+        assert result['result']['success']
+    
+    def test_views_slice_without_copying(self):
+        """Test slicing, stripping and previewing a view"""
+        from backend.agent.artifacts import TextView
+        
+        view = TextView("  hello world, how are you?  ")
+        
+        assert str(view.strip()) == "hello world, how are you?"
+        assert view.strip().endswith("?")
+        assert view.strip()[6:11].preview(100) == "world"
+        assert len(view[2:7]) == 5
+    
+    def test_truncation_check_does_not_copy(self, monkeypatch):
+        """Test that deciding on map-reduce measures the view instead of copying it"""
+        from backend.agent.artifacts import TextView
+        from backend.tasks.summarize import is_truncated
+        
+        view = TextView("  " + "word " * 10000)[1:]
+        monkeypatch.setattr(TextView, "__str__", lambda self: pytest.fail("view copied"))
+        
+        assert is_truncated({"text": "word word"}, view)
+        assert not is_truncated({"text": "word " * 10000}, view)
+
+
+class TestTracing:
+    """Test that a workflow run records node and LLM spans on its trace"""
+    
+    def test_trace_has_node_and_llm_spans(self, monkeypatch):
+        """Test that LLM spans nest under the node that made the call"""
+        monkeypatch.setenv("INTENT_FAST_PATH", "false")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        workflow = create_agent_workflow()
+        
+        result = workflow.invoke(create_initial_state(
+            input_type=InputType.TEXT,
+            raw_input="Please summarize this: AI is transforming the world."
+        ))
+        
+        spans = {record["name"]: record for record in result['trace'].spans}
+        assert {"node.extract_content", "node.classify_intent", "node.execute_task"} <= set(spans)
+        assert spans["llm.summarize"]["parent_span_id"] == spans["node.execute_task"]["span_id"]
+        assert spans["llm.summarize"]["attributes"]["prompt_tokens"] > 0
+        assert spans["node.execute_task"]["attributes"]["task"] == "summarize"
+
+
+class TestAsyncExecution:
+    """Test the native asyncio workflow path"""
+    
+    def test_concurrent_runs_overlap_llm_calls(self, monkeypatch):
+        """Test that concurrent ainvoke runs wait on the LLM together, not in turn"""
+        import asyncio
+        import time
+        from backend.llm import config, rate_limit
+        
+        monkeypatch.setenv("LLM_PROVIDER", "fake")
+        monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "200")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        workflow = create_agent_workflow()
+        
+        async def run_all():
+            states = [
+                create_initial_state(input_type=InputType.TEXT, raw_input=f"Summarize this: note number {i}.")
+                for i in range(20)
+            ]
+            return await asyncio.gather(*(workflow.ainvoke(state) for state in states))
+        
+        started = time.perf_counter()
+        results = asyncio.run(run_all())
+        elapsed = time.perf_counter() - started
+        
+        # Each run waits at least 200ms on the LLM; run one after another this would take 4s+
+        assert all(result['result']['success'] for result in results)
+        assert elapsed < 2.0
+
+
 # Run tests
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
\ No newline at end of file
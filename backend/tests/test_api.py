@@ -0,0 +1,286 @@
+import asyncio
+import json
+import os
+import time
+import pytest
+from fastapi.testclient import TestClient
+
+# Warmup runs on startup; skip the steps that need tesseract and whisper weights
+os.environ.setdefault("WARMUP_CHECK_BINARIES", "false")
+os.environ.setdefault("WARMUP_WHISPER", "false")
+
+import backend.app as app_module
+from backend.services.admission import AdmissionController
+from backend.services.warmup import WarmupState, run_warmup
+
+
+@pytest.fixture(scope="module")
+def client():
+    # One client for the module: its shutdown handler stops the job pool
+    with TestClient(app_module.app) as client:
+        yield client
+
+
+def wait_for_job(client, job_id, timeout=30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job['status'] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} never finished")
+
+
+def on_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return False
+
+
+def full_admission():
+    """Admission controller with every slot taken and no queue, so new requests are rejected"""
+    admission = AdmissionController(
+        limits={"text": 1, "image": 1, "pdf": 1, "audio": 1},
+        max_queue=0
+    )
+    for kind in ("text", "image", "pdf", "audio"):
+        asyncio.run(admission.acquire(kind))
+    return admission
+
+
+class TestJobsApi:
+    """Test the background job endpoints"""
+
+    def test_submit_and_poll(self, client):
+        """Test that a submitted text job is accepted and later carries its result"""
+        response = client.post("/jobs", data={"text": "Please summarize this: AI is everywhere. It helps."})
+
+        assert response.status_code == 202
+        job = response.json()
+        assert job['status'] in ("queued", "running")
+
+        job = wait_for_job(client, job['job_id'])
+
+        assert job['status'] == "done"
+        assert job['result']['status'] == "success"
+        assert job['result']['task'] == "summarize"
+
+    def test_requires_exactly_one_input(self, client):
+        """Test that a job needs either text or a file"""
+        response = client.post("/jobs", data={})
+
+        assert response.status_code == 400
+
+    def test_unknown_job(self, client):
+        """Test that polling an unknown job is a 404"""
+        assert client.get("/jobs/missing").status_code == 404
+
+
+class TestAdmissionApi:
+    """Test that overload is rejected with 429 and a retry hint"""
+
+    def test_full_lane_rejects_with_retry_after(self, client, monkeypatch):
+        """Test that a request is rejected when its lane and queue are full"""
+        monkeypatch.setattr(app_module, "admission", full_admission())
+
+        response = client.post("/process/text", json={"text": "Summarize: a. b. c."})
+
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+
+    def test_full_lane_rejects_stream(self, client, monkeypatch):
+        """Test that streaming requests are rejected before the stream starts"""
+        monkeypatch.setattr(app_module, "admission", full_admission())
+
+        response = client.post("/process/text/stream", json={"text": "Summarize: a. b. c."})
+
+        assert response.status_code == 429
+        assert "Retry-After" in response.headers
+
+    def test_stream_slot_released_when_client_leaves_early(self):
+        """Test that a stream's slot is released even if its body never starts"""
+        released = []
+
+        async def body():
+            released.append("body started")
+            yield "data: {}\n\n"
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("client went away")
+
+        response = app_module.AdmittedStreamingResponse(body(), lambda: released.append("slot"))
+
+        with pytest.raises(Exception):
+            asyncio.run(response({"type": "http"}, receive, send))
+
+        assert released == ["slot"]
+
+    def test_stream_releases_its_slot(self, client, monkeypatch):
+        """Test that a finished stream gives its admission slot back"""
+        admission = AdmissionController(limits={"text": 1, "image": 1, "pdf": 1, "audio": 1}, max_queue=0)
+        monkeypatch.setattr(app_module, "admission", admission)
+
+        for _ in range(2):
+            response = client.post("/process/text/stream", json={"text": "Summarize: a. b. c."})
+            assert response.status_code == 200
+
+        assert admission.queue_depth()['text']['running'] == 0
+
+    def test_jobs_wait_for_admission(self, client, monkeypatch):
+        """Test that a background job takes an admission slot and fails when the lane is full"""
+        monkeypatch.setattr(app_module, "admission", full_admission())
+
+        job_id = client.post("/jobs", data={"text": "Summarize: a. b. c."}).json()['job_id']
+        job = wait_for_job(client, job_id)
+
+        assert job['status'] == "failed"
+        assert "Server busy" in job['error']
+
+    def test_job_releases_its_slot(self, client, monkeypatch):
+        """Test that a finished job gives its admission slot back"""
+        admission = AdmissionController(limits={"text": 1, "image": 1, "pdf": 1, "audio": 1}, max_queue=0)
+        monkeypatch.setattr(app_module, "admission", admission)
+
+        for _ in range(2):
+            job_id = client.post("/jobs", data={"text": "Summarize: a. b. c."}).json()['job_id']
+            assert wait_for_job(client, job_id)['status'] == "done"
+
+        assert admission.queue_depth()['text']['running'] == 0
+
+    def test_batch_items_are_admitted(self, client, monkeypatch):
+        """Test that batch items share the text lane and report rejection per item"""
+        monkeypatch.setattr(app_module, "admission", full_admission())
+
+        response = client.post("/process/batch", json={
+            "items": [{"text": "Summarize: a. b. c."}, {"text": "I love it!"}],
+            "task": "sentiment"
+        })
+        lines = [json.loads(line) for line in response.text.splitlines()]
+
+        assert response.status_code == 200
+        assert [line['status'] for line in lines] == ["error", "error"]
+        assert all("Server busy" in line['error'] for line in lines)
+
+
+class TestUploadsApi:
+    """Test that uploads are saved off the event loop and pinned while in use"""
+
+    def test_upload_is_saved_off_the_loop_and_unpinned(self, client, monkeypatch):
+        """Test that /process/file saves the blob on a worker thread and unpins it when done"""
+        from backend.agent import nodes
+        from backend.services.upload_store import get_upload_store
+
+        store = get_upload_store()
+        save = store.save
+        saved_on_loop = []
+        monkeypatch.setattr(store, "save", lambda *args: saved_on_loop.append(on_event_loop()) or save(*args))
+        monkeypatch.setattr(nodes, "extract_text_from_pdf", lambda path: ("Quarterly results were strong.", {"num_pages": 1}))
+
+        response = client.post(
+            "/process/file",
+            files={"file": ("report.pdf", b"%PDF-1.4 upload test", "application/pdf")},
+            data={"tasks": "summarize"}
+        )
+
+        assert response.status_code == 200
+        assert saved_on_loop == [False]
+        assert store._pins == {}
+
+
+class TestFollowupApi:
+    """Test that follow-up sessions are stored without blocking the event loop"""
+
+    @pytest.fixture(autouse=True)
+    def no_blocking_checkpoint_writes(self, monkeypatch):
+        if app_module.resume_workflow is None:
+            pytest.skip("session checkpoints disabled")
+
+        def update_state(*args, **kwargs):
+            raise AssertionError("blocking update_state called from an async handler")
+
+        monkeypatch.setattr(app_module.resume_workflow, "update_state", update_state)
+
+    def test_clarification_roundtrip(self, client):
+        """Test that an unclear request stores its session and the follow-up resumes it"""
+        response = client.post("/process/text", json={"text": "Some notes about a meeting."})
+
+        assert response.status_code == 200
+        body = response.json()
+        assert body['status'] == "needs_clarification"
+
+        response = client.post("/followup", json={"session_id": body['session_id'], "response": "summarize it please"})
+
+        assert response.status_code == 200
+        assert response.json()['task'] == "summarize"
+
+    def test_streamed_clarification(self, client):
+        """Test that a streamed run needing clarification stores its session"""
+        response = client.post("/process/text/stream", json={"text": "Some notes about a meeting."})
+        result = next(
+            json.loads(line[len("data: "):]) for line in response.text.splitlines()
+            if line.startswith("data: ") and '"session_id"' in line
+        )
+
+        assert result['status'] == "needs_clarification"
+        assert client.post("/followup", json={"session_id": result['session_id'], "response": "summarize"}).status_code == 200
+
+
+class TestOperationalEndpoints:
+    """Test readiness and metrics endpoints"""
+
+    def test_ready_after_warmup(self, client, monkeypatch):
+        """Test that /ready is 503 while warming up and 200 once every step passed"""
+        state = WarmupState()
+        monkeypatch.setattr(app_module, "warmup_state", state)
+
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()['status'] == "warming_up"
+
+        run_warmup(state, [("noop", lambda: None)])
+
+        response = client.get("/ready")
+        assert response.status_code == 200
+        assert response.json()['status'] == "ready"
+
+    def test_not_ready_when_a_step_fails(self, client, monkeypatch):
+        """Test that a failed warmup step keeps /ready at 503"""
+        state = WarmupState()
+        monkeypatch.setattr(app_module, "warmup_state", state)
+
+        def fail():
+            raise RuntimeError("missing binary")
+
+        run_warmup(state, [("binaries", fail)])
+
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()['checks']['binaries']['error'] == "missing binary"
+
+    def test_session_stats_run_off_the_loop(self, client, monkeypatch):
+        """Test that /metrics and /health scan the session database on a worker thread"""
+        if app_module.resume_workflow is None:
+            pytest.skip("session checkpoints disabled")
+        from backend.services.checkpoints import get_session_checkpointer
+
+        checkpointer = get_session_checkpointer()
+        stats = checkpointer.stats
+        scanned_on_loop = []
+        monkeypatch.setattr(checkpointer, "stats", lambda: scanned_on_loop.append(on_event_loop()) or stats())
+
+        assert client.get("/metrics").status_code == 200
+        assert client.get("/health").status_code == 200
+        assert scanned_on_loop == [False, False]
+
+    def test_metrics_exposition(self, client):
+        """Test that /metrics serves Prometheus text including the in-flight gauge"""
+        response = client.get("/metrics")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        assert "http_requests_in_flight" in response.text
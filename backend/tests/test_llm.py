@@ -0,0 +1,669 @@
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+from backend.llm import config
+
+
+class TestClientRegistry:
+    """Test reuse of LLM clients and prompt chains"""
+    
+    def test_llm_instances_are_reused(self, monkeypatch):
+        """Test that clients are shared per (model, temperature, max_tokens)"""
+        monkeypatch.setenv("LLM_PROVIDER", "groq")
+        monkeypatch.setenv("GROQ_API_KEY", "test-key")
+        
+        first = config.get_llm(temperature=0.1, model_name="test-model")
+        second = config.get_llm(temperature=0.1, model_name="test-model")
+        other = config.get_llm(temperature=0.3, model_name="test-model")
+        
+        assert first is second
+        assert first is not other
+        assert first.http_client is other.http_client
+    
+    def test_chains_are_built_once(self, monkeypatch):
+        """Test that a registered chain is compiled on first use and then reused"""
+        monkeypatch.setenv("GROQ_API_KEY", "test-key")
+        prompt = ChatPromptTemplate.from_messages([("user", "{text}")])
+        config.register_chain("test_chain", prompt, temperature=0.5)
+        
+        assert config.get_chain("test_chain") is config.get_chain("test_chain")
+
+
+class CountingLLM:
+    """Minimal chat model stand-in that counts calls"""
+    
+    model_name = "counting-model"
+    temperature = 0.1
+    max_tokens = 100
+    
+    def __init__(self):
+        self.calls = 0
+    
+    def invoke(self, messages, **kwargs):
+        from langchain_core.messages import AIMessage
+        self.calls += 1
+        return AIMessage(content=f"answer {self.calls}")
+
+
+class TestResponseCache:
+    """Test the persistent LLM response cache"""
+    
+    def make_chain(self, tmp_path, monkeypatch, **cache_kwargs):
+        from backend.llm import rate_limit
+        from backend.llm.cache import LLMResponseCache
+        
+        cache = LLMResponseCache(str(tmp_path / "llm.sqlite3"), **cache_kwargs)
+        monkeypatch.setattr(config, "_llm_cache", cache)
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        prompt = ChatPromptTemplate.from_messages([("user", "{text}")])
+        return config.CachedChain(prompt, CountingLLM()), cache
+    
+    def test_identical_prompts_hit_cache(self, tmp_path, monkeypatch):
+        """Test that a repeated prompt is answered from the cache"""
+        chain, cache = self.make_chain(tmp_path, monkeypatch)
+        
+        first = chain.invoke({"text": "hello"})
+        second = chain.invoke({"text": "hello"})
+        chain.invoke({"text": "different"})
+        
+        assert second.content == first.content
+        assert chain.llm.calls == 2
+        assert cache.stats() == {"hits": 1, "misses": 2, "entries": 2}
+    
+    def test_bypass_forces_fresh_call(self, tmp_path, monkeypatch):
+        """Test per-call cache bypass"""
+        chain, _ = self.make_chain(tmp_path, monkeypatch)
+        
+        chain.invoke({"text": "hello"})
+        fresh = chain.invoke({"text": "hello"}, bypass_cache=True)
+        
+        assert fresh.content == "answer 2"
+        assert chain.invoke({"text": "hello"}).content == "answer 2"
+    
+    def test_lru_eviction(self, tmp_path, monkeypatch):
+        """Test that the least recently used entry is evicted"""
+        chain, cache = self.make_chain(tmp_path, monkeypatch, max_entries=2, evict_every=1)
+        
+        chain.invoke({"text": "a"})
+        chain.invoke({"text": "b"})
+        chain.invoke({"text": "a"})
+        chain.invoke({"text": "c"})
+        calls = chain.llm.calls
+        chain.invoke({"text": "a"})
+        
+        assert cache.stats()['entries'] == 2
+        assert chain.llm.calls == calls
+    
+    def test_eviction_is_batched(self, tmp_path, monkeypatch):
+        """Test that sweeps run every evict_every writes, and the created_at index exists"""
+        chain, cache = self.make_chain(tmp_path, monkeypatch, max_entries=2, evict_every=4)
+        
+        for text in "abc":
+            chain.invoke({"text": text})
+        assert cache.stats()['entries'] == 3
+        
+        chain.invoke({"text": "d"})
+        assert cache.stats()['entries'] == 2
+        
+        indexes = {row[1] for row in cache._connect().execute("PRAGMA index_list(llm_cache)")}
+        assert {"idx_llm_cache_accessed", "idx_llm_cache_created"} <= indexes
+    
+    def test_ttl_expiry(self, tmp_path, monkeypatch):
+        """Test that expired entries are not served"""
+        chain, _ = self.make_chain(tmp_path, monkeypatch, ttl_seconds=-1)
+        
+        chain.invoke({"text": "hello"})
+        chain.invoke({"text": "hello"})
+        
+        assert chain.llm.calls == 2
+
+
+class TestSemanticCache:
+    """Test near-duplicate matching of task results"""
+    
+    ARTICLE = (
+        "Artificial intelligence is transforming healthcare by helping doctors detect "
+        "diseases earlier, personalise treatments and reduce paperwork. Hospitals that "
+        "adopted machine learning tools report shorter waiting times and fewer errors, "
+        "although regulators warn that models must be audited for bias."
+    )
+    
+    def test_whitespace_case_and_trailing_sentence_hit(self):
+        """Test that re-pasted, lightly edited text is a hit"""
+        from backend.llm.semantic_cache import SemanticCache
+        
+        cache = SemanticCache(threshold=0.85)
+        cache.store("summarize", self.ARTICLE, {"one_liner": "AI helps hospitals"})
+        
+        edited = "  " + self.ARTICLE.upper().replace(" ", "   ") + " Read more on our site."
+        result = cache.lookup("summarize", edited)
+        
+        assert result['one_liner'] == "AI helps hospitals"
+        assert result['semantic_cache_similarity'] >= 0.85
+    
+    def test_namespaces_and_discriminators_are_isolated(self):
+        """Test that results never cross tasks or questions"""
+        from backend.llm.semantic_cache import SemanticCache
+        
+        cache = SemanticCache()
+        cache.store("qa", self.ARTICLE, {"answer": "earlier detection"}, discriminator="what does ai do?")
+        
+        assert cache.lookup("sentiment", self.ARTICLE) is None
+        assert cache.lookup("qa", self.ARTICLE, discriminator="who warns?") is None
+        assert cache.lookup("qa", self.ARTICLE, discriminator="what does ai do?") is not None
+    
+    def test_unrelated_and_short_texts_miss(self):
+        """Test that different content and short texts are not matched"""
+        from backend.llm.semantic_cache import SemanticCache
+        
+        cache = SemanticCache()
+        cache.store("sentiment", self.ARTICLE, {"label": "positive"})
+        cache.store("sentiment", "I love it", {"label": "positive"})
+        
+        other = (
+            "The quarterly budget meeting moved to Thursday afternoon. Finance will "
+            "present revised forecasts, and every team lead must submit hiring plans "
+            "and travel estimates before the end of the month."
+        )
+        assert cache.lookup("sentiment", other) is None
+        assert cache.lookup("sentiment", "I love it") is None
+    
+    def test_capacity_is_bounded(self):
+        """Test that the oldest entry is overwritten at capacity"""
+        from backend.llm.semantic_cache import SemanticCache
+        
+        cache = SemanticCache(capacity=2, min_tokens=1)
+        for i in range(3):
+            cache.store("summarize", f"document number {i} " * 5, {"i": i})
+        
+        assert cache.stats() == {"summarize": 2}
+        assert cache.lookup("summarize", "document number 0 " * 5) is None
+
+
+def make_groq_error(status, headers=None):
+    import groq
+    import httpx
+    
+    request = httpx.Request("POST", "https://api.groq.com/openai/v1/chat/completions")
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    error_class = groq.RateLimitError if status == 429 else groq.InternalServerError
+    return error_class("error", response=response, body=None)
+
+
+class TestRateLimiting:
+    """Test the shared LLM budget, retries and circuit breaker"""
+    
+    def test_budget_is_shared_between_workers(self, tmp_path):
+        """Test that two limiters on the same file draw from one budget"""
+        from backend.llm.rate_limit import RateLimiter
+        
+        path = str(tmp_path / "limits.sqlite3")
+        worker_a = RateLimiter(path, requests_per_minute=2, tokens_per_minute=10000)
+        worker_b = RateLimiter(path, requests_per_minute=2, tokens_per_minute=10000)
+        
+        assert worker_a.try_acquire("m", 10) == 0.0
+        assert worker_b.try_acquire("m", 10) == 0.0
+        assert worker_a.try_acquire("m", 10) > 0.0
+    
+    def test_token_budget_limits_large_prompts(self, tmp_path):
+        """Test that the token bucket delays calls once spent"""
+        from backend.llm.rate_limit import RateLimiter
+        
+        limiter = RateLimiter(str(tmp_path / "limits.sqlite3"), requests_per_minute=100, tokens_per_minute=1000)
+        
+        assert limiter.try_acquire("m", 900) == 0.0
+        wait = limiter.try_acquire("m", 500)
+        
+        assert 20 < wait <= 30
+    
+    def test_rate_limit_retry_honors_retry_after(self):
+        """Test that 429s are retried no sooner than the provider's hint"""
+        from backend.llm.rate_limit import ResilientCaller
+        
+        caller = ResilientCaller(limiter=None, max_retries=3)
+        attempts = []
+        sleeps = []
+        
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise make_groq_error(429, {"retry-after": "2"})
+            return "ok"
+        
+        assert caller.call(flaky, "m", 100, sleep=sleeps.append) == "ok"
+        assert len(sleeps) == 2
+        assert all(delay >= 2 for delay in sleeps)
+    
+    def test_client_errors_are_not_retried(self):
+        """Test that non-transient errors propagate immediately"""
+        from backend.llm.rate_limit import ResilientCaller
+        
+        caller = ResilientCaller(limiter=None)
+        sleeps = []
+        
+        def bad_request():
+            raise ValueError("bad request")
+        
+        with pytest.raises(ValueError):
+            caller.call(bad_request, "m", 100, sleep=sleeps.append)
+        assert sleeps == []
+    
+    def test_circuit_opens_and_fails_fast(self, monkeypatch):
+        """Test that repeated provider failures open the circuit"""
+        from backend.llm.rate_limit import ResilientCaller, CircuitOpenError
+        
+        monkeypatch.setenv("LLM_BREAKER_THRESHOLD", "2")
+        caller = ResilientCaller(limiter=None, max_retries=1)
+        calls = []
+        
+        def down():
+            calls.append(1)
+            raise make_groq_error(503)
+        
+        with pytest.raises(Exception):
+            caller.call(down, "m", 100, sleep=lambda s: None)
+        with pytest.raises(CircuitOpenError):
+            caller.call(down, "m", 100, sleep=lambda s: None)
+        assert len(calls) == 2
+    
+    def test_cancelled_trial_does_not_wedge_circuit(self, monkeypatch):
+        """Test that a cancelled half-open trial lets the next call try again"""
+        import asyncio
+        from backend.llm.rate_limit import ResilientCaller
+        
+        monkeypatch.setenv("LLM_BREAKER_THRESHOLD", "1")
+        monkeypatch.setenv("LLM_BREAKER_COOLDOWN_SECONDS", "0")
+        caller = ResilientCaller(limiter=None, max_retries=0)
+        
+        async def down():
+            raise make_groq_error(503)
+        
+        async def hang():
+            await asyncio.sleep(10)
+        
+        async def ok():
+            return "ok"
+        
+        async def scenario():
+            with pytest.raises(Exception):
+                await caller.acall(down, "m", 100)
+            trial = asyncio.ensure_future(caller.acall(hang, "m", 100))
+            await asyncio.sleep(0.01)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+            return await caller.acall(ok, "m", 100)
+        
+        assert asyncio.run(scenario()) == "ok"
+
+
+class TestFakeProvider:
+    """Test the offline fake LLM provider"""
+    
+    @pytest.fixture
+    def fake_provider(self, monkeypatch):
+        from backend.llm import rate_limit
+        
+        monkeypatch.setenv("LLM_PROVIDER", "fake")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+    
+    def test_provider_switch_needs_no_api_key(self, fake_provider, monkeypatch):
+        """Test that LLM_PROVIDER=fake returns the local model without a key"""
+        from backend.llm.fake import FakeChatModel
+        
+        monkeypatch.delenv("GROQ_API_KEY", raising=False)
+        llm = config.get_llm(temperature=0.1, model_name="test-model")
+        
+        assert isinstance(llm, FakeChatModel)
+        assert llm.model_name == "fake:test-model"
+    
+    def test_task_responses_are_well_formed(self, fake_provider):
+        """Test that task parsers accept the fake model's responses"""
+        from backend.tasks.summarize import summarize_text
+        from backend.tasks.sentiment import analyze_sentiment
+        from backend.tasks.code_explain import explain_code
+        
+        summary = summarize_text("AI is transforming the world. It changes how we work.")
+        positive = analyze_sentiment("This is absolutely amazing! I love it so much!")
+        negative = analyze_sentiment("This is terrible. I hate it and it is broken.")
+        code = explain_code("def add(a, b):\n    return a + b")
+        
+        assert summary['success'] and len(summary['bullets']) == 3
+        assert positive['label'] == "positive"
+        assert negative['label'] == "negative"
+        assert code['success'] and code['explanation']
+    
+    def test_classification_is_deterministic(self, fake_provider):
+        """Test that classification follows the prompt's keyword guidelines"""
+        from backend.llm.fake import classify_response
+        
+        clear = classify_response("User input\n\nExtracted content:\nPlease summarize this.\n\nWhat does the user want?")
+        unclear = classify_response("User input\n\nExtracted content:\nSome notes.\n\nWhat does the user want?")
+        
+        assert "TASK: SUMMARIZE" in clear and "NEEDS_CLARIFICATION: no" in clear
+        assert "TASK: UNCLEAR" in unclear and "NEEDS_CLARIFICATION: yes" in unclear
+    
+    def test_simulated_latency_and_throughput(self):
+        """Test that streaming honors time-to-first-token and tokens per second"""
+        import time
+        from langchain_core.messages import HumanMessage
+        from backend.llm.fake import FakeChatModel
+        
+        llm = FakeChatModel(latency_ms=50, tokens_per_second=200)
+        started = time.perf_counter()
+        chunks = list(llm.stream([HumanMessage(content="Tell me something about caching.")]))
+        elapsed = time.perf_counter() - started
+        
+        assert len(chunks) > 1
+        assert elapsed >= 0.05 + len(chunks) / 200 * 0.9
+
+
+    def test_long_document_is_map_reduced(self, fake_provider, monkeypatch):
+        """Test that a document over the summarize budget is condensed per section, concurrently"""
+        import asyncio
+        import time
+        from backend.tasks.summarize import asummarize_text, summarize_text
+        
+        monkeypatch.setenv("FAKE_LLM_LATENCY_MS", "50")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_PROMPT_TOKENS", "600")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_CHUNK_PROMPT_TOKENS", "500")
+        document = "".join(
+            f"\n--- Page {page} ---\n" + " ".join(f"Page {page} point {i} covers topic {i % 7}." for i in range(60))
+            for page in range(1, 9)
+        )
+        
+        started = time.perf_counter()
+        summary = summarize_text(document)
+        elapsed = time.perf_counter() - started
+        async_summary = asyncio.run(asummarize_text(document))
+        
+        assert summary['success'] and len(summary['bullets']) == 3
+        assert summary['bullets'][0].startswith("Page 1 point 0")
+        assert summary['map_reduce']['sections'] >= 8
+        assert elapsed < summary['map_reduce']['sections'] * 0.05
+        assert async_summary['map_reduce'] == summary['map_reduce']
+        assert "map_reduce" not in summarize_text("A short note. It fits in one prompt.")
+    
+    def test_single_section_is_summarized_directly(self, fake_provider, monkeypatch):
+        """Test that text over the summarize budget but within one section skips map-reduce"""
+        import asyncio
+        import threading
+        from backend.tasks import summarize
+        
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_PROMPT_TOKENS", "600")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_CHUNK_PROMPT_TOKENS", "1500")
+        threads = []
+        document_sections = summarize.document_sections
+        monkeypatch.setattr(
+            summarize, "document_sections",
+            lambda text: threads.append(threading.current_thread()) or document_sections(text)
+        )
+        text = " ".join(f"Point {i} covers topic {i % 7}." for i in range(120))
+        
+        summary = asyncio.run(summarize.asummarize_text(text))
+        
+        assert summary['success'] and "map_reduce" not in summary
+        assert threads and threads[0] is not threading.main_thread()
+
+
+class TestModelRouting:
+    """Test per-stage model routing and latency-budget downgrades"""
+    
+    def test_stages_use_their_own_routes(self, monkeypatch):
+        """Test that label-only stages default to the small model and routes can be overridden"""
+        from backend.llm.routing import get_route
+        
+        monkeypatch.setenv("MODEL_NAME", "large-model")
+        monkeypatch.setenv("SMALL_MODEL_NAME", "small-model")
+        monkeypatch.setenv("LLM_ROUTE_SUMMARIZE_MAX_TOKENS", "800")
+        
+        assert get_route("classify")["model"] == "small-model"
+        assert get_route("summarize")["model"] == "large-model"
+        assert get_route("summarize")["max_tokens"] == 800
+        assert get_route("followup")["max_tokens"] < get_route("qa")["max_tokens"]
+    
+    def test_slow_model_is_downgraded_until_samples_age_out(self, monkeypatch):
+        """Test that a p95 over budget routes to the fallback, and recovers later"""
+        from backend.llm import routing
+        from backend.llm.routing import LatencyTracker
+        
+        tracker = LatencyTracker(window_seconds=60, min_samples=5)
+        monkeypatch.setattr(routing, "_latency_tracker", tracker)
+        large, small = CountingLLM(), CountingLLM()
+        prompt = ChatPromptTemplate.from_messages([("user", "{text}")])
+        chain = config.CachedChain(prompt, large, small, latency_budget=2.0, stage="summarize")
+        
+        assert chain.select_llm() is large
+        for _ in range(5):
+            tracker.record(large.model_name, 5.0, now=0.0)
+        
+        monkeypatch.setattr(routing.time, "monotonic", lambda: 1.0)
+        assert chain.select_llm() is small
+        monkeypatch.setattr(routing.time, "monotonic", lambda: 120.0)
+        assert chain.select_llm() is large
+
+
+class TestTokenBudget:
+    """Test token counting and boundary-aware trimming"""
+    
+    def test_trim_respects_budget_and_sentence_boundaries(self):
+        """Test that trimmed text fits the budget and ends on a whole sentence"""
+        from backend.llm.tokens import count_tokens, trim_to_tokens
+        
+        text = " ".join(f"Sentence number {i} talks about caching." for i in range(200))
+        trimmed = trim_to_tokens(text, 100)
+        
+        assert count_tokens(trimmed) <= 100
+        assert trimmed.endswith("caching.")
+        assert text.startswith(trimmed)
+        assert trim_to_tokens("Short text.", 100) == "Short text."
+    
+    def test_dense_scripts_get_fewer_characters(self):
+        """Test that CJK text is budgeted by tokens rather than characters"""
+        from backend.llm.tokens import trim_to_tokens
+        
+        prose = "The quick brown fox jumps over the lazy dog. " * 100
+        cjk = "这是一个关于缓存的句子。" * 100
+        
+        assert len(trim_to_tokens(cjk, 200)) < len(trim_to_tokens(prose, 200))
+    
+    def test_multi_token_characters_stay_within_budget(self, monkeypatch):
+        """Test that short text is still counted when a character can take several BPE tokens"""
+        from backend.llm import tokens
+        
+        class ByteEncoding:
+            name = "bytes"
+            
+            def encode_ordinary(self, text):
+                return list(text.encode("utf-8"))
+            
+            def decode(self, ids):
+                return bytes(ids).decode("utf-8", "ignore")
+        
+        monkeypatch.setattr(tokens, "get_encoding", lambda: ByteEncoding())
+        text = "缓存命中。缓存未命中。"
+        
+        trimmed = tokens.trim_to_tokens(text, 15)
+        
+        # 11 characters fit the old characters-per-token shortcut, but take 33 byte tokens
+        assert tokens.count_tokens(trimmed) <= 15
+        assert trimmed == "缓存命中。"
+    
+    def test_tokenizer_loads_off_the_request_path(self, monkeypatch):
+        """Test that counting never waits for the BPE download; the estimate is used until it lands"""
+        import threading
+        from backend.llm import tokens
+        
+        release = threading.Event()
+        encoding = type("Encoding", (), {"name": "slow", "encode_ordinary": lambda self, text: list(text)})()
+        
+        def slow_load():
+            release.wait(5)
+            monkeypatch.setattr(tokens, "_encoding", encoding)
+        
+        monkeypatch.delenv("TOKENIZER", raising=False)
+        monkeypatch.setattr(tokens, "_encoding", None)
+        monkeypatch.setattr(tokens, "_encoding_thread", None)
+        monkeypatch.setattr(tokens, "load_encoding", slow_load)
+        
+        assert tokens.get_encoding() is None
+        assert tokens.count_tokens("hello world") == tokens.estimate_text_tokens("hello world")
+        assert tokens.tokenizer_name() == "estimate (tiktoken still loading)"
+        
+        release.set()
+        assert tokens.wait_for_encoding(5) is encoding
+        assert tokens.count_tokens("hello world") == 11
+    
+    def test_large_view_only_tokenizes_prefix(self, monkeypatch):
+        """Test that trimming a view of a large document never tokenizes the whole document"""
+        from backend.agent.artifacts import TextView
+        from backend.llm import tokens
+        
+        counted = []
+        count_tokens = tokens.count_tokens
+        monkeypatch.setattr(tokens, "count_tokens", lambda text: counted.append(len(text)) or count_tokens(text))
+        text = "A line about quarterly revenue.\n" * 100000
+        
+        trimmed = tokens.trim_to_tokens(TextView(text)[10:], 200)
+        
+        assert text[10:].startswith(trimmed)
+        assert sum(counted) < 10000
+    
+    def test_chunks_follow_pages_within_budget(self):
+        """Test that chunks pack whole pages and split only pages over the budget"""
+        from backend.llm.tokens import chunk_by_tokens, count_tokens
+        
+        short_page = "A short page about caching."
+        long_page = " ".join(f"Sentence {i} about token budgets." for i in range(200))
+        text = f"Intro.\n--- Page 1 ---\n{short_page}\n--- Page 2 ---\n{short_page}\n--- Page 3 ---\n{long_page}"
+        
+        chunks = chunk_by_tokens(text, 100)
+        
+        assert chunks[0]['first_page'] is None and chunks[0]['last_page'] == 2
+        assert "--- Page 2 ---" in chunks[0]['text']
+        assert len(chunks) > 3 and all(chunk['first_page'] == 3 for chunk in chunks[1:])
+        assert all(count_tokens(chunk['text']) <= 100 for chunk in chunks)
+    
+    def test_chain_fits_whole_prompt(self, monkeypatch):
+        """Test that fit_input leaves room for the template and other inputs"""
+        from backend.llm.tokens import count_message_tokens
+        
+        prompt = ChatPromptTemplate.from_messages([("system", "Answer using the context."), ("user", "{context}\n\n{question}")])
+        chain = config.CachedChain(prompt, CountingLLM(), prompt_tokens=150)
+        inputs = {"question": "What is cached?", "context": "Responses are cached on disk.\n" * 100}
+        inputs["context"] = chain.fit_input(inputs, "context")
+        
+        assert count_message_tokens(prompt.invoke(inputs).to_messages()) <= 150
+        assert inputs["context"].endswith("disk.")
+
+
+class TestRetrieval:
+    """Test the BM25 chunk index used for QA over long documents"""
+    
+    def make_document(self, pages: int, needle_page: int) -> str:
+        filler = " ".join(f"Filler sentence {i} about general operations." for i in range(40))
+        return "".join(
+            f"\n--- Page {page} ---\n{filler}" + (" The turbine warranty lasts seventeen years." if page == needle_page else "")
+            for page in range(1, pages + 1)
+        )
+    
+    def test_relevant_chunk_ranks_first(self):
+        """Test that the chunk holding the question's terms is retrieved with its page"""
+        from backend.llm.retrieval import build_chunk_index, query_text, retrieve_context
+        from backend.llm.tokens import count_tokens
+        
+        document = self.make_document(pages=300, needle_page=250)
+        index = build_chunk_index(document)
+        
+        context = retrieve_context(index, document, "How long does the turbine warranty last?", 300)
+        fallback = retrieve_context(index, document, "zebra", 300)
+        
+        assert "Page 250" in context and "seventeen years" in context
+        assert count_tokens(context) <= 300
+        # A chunk opening on a page marker is not labelled twice
+        assert fallback.startswith("--- Page 1 ---")
+        assert "[Page 1]" not in fallback
+        assert query_text(document + "\n\nHow long does the turbine warranty last?") == "How long does the turbine warranty last?"
+        assert int(index.offsets[-1]) == len(index.chunk_ids) == len(index.term_freqs)
+    
+    def test_prompt_size_is_flat(self, monkeypatch):
+        """Test that QA prompts stay within budget and find late pages however long the document is"""
+        from backend.llm import rate_limit
+        from backend.tasks.qa import qa_inputs
+        from backend.llm.tokens import count_tokens
+        
+        monkeypatch.setenv("LLM_PROVIDER", "fake")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        chain = config.get_chain("qa_context")
+        question = "How long does the turbine warranty last?"
+        
+        sizes = []
+        for pages in (50, 1000):
+            inputs = qa_inputs(chain, question, self.make_document(pages, needle_page=pages - 1))
+            assert "seventeen years" in inputs["context"]
+            sizes.append(count_tokens(inputs["context"]))
+        
+        assert max(sizes) <= chain.prompt_tokens
+        assert abs(sizes[0] - sizes[1]) < 100
+    
+    def test_async_indexing_runs_off_the_event_loop(self, monkeypatch):
+        """Test that aanswer_question builds the chunk index on a worker thread"""
+        import asyncio
+        import threading
+        from backend.llm import rate_limit, retrieval
+        from backend.tasks.qa import aanswer_question
+        
+        monkeypatch.setenv("LLM_PROVIDER", "fake")
+        monkeypatch.setenv("LLM_CACHE_ENABLED", "false")
+        monkeypatch.setattr(config, "_llm_registry", {})
+        monkeypatch.setattr(config, "_chain_registry", {})
+        monkeypatch.setattr(rate_limit, "_resilient_caller", rate_limit.ResilientCaller(limiter=None))
+        monkeypatch.setattr(retrieval, "_chunk_index_cache", None)
+        threads = []
+        build_chunk_index = retrieval.build_chunk_index
+        monkeypatch.setattr(
+            retrieval, "build_chunk_index",
+            lambda text: threads.append(threading.current_thread()) or build_chunk_index(text)
+        )
+        
+        answer = asyncio.run(aanswer_question("How long does the turbine warranty last?", self.make_document(200, 150)))
+        
+        assert "Page 150" in answer['answer']
+        assert threads and threads[0] is not threading.main_thread()
+    
+    def test_index_cache_does_not_copy_the_document(self, monkeypatch):
+        """Test that chunk indexes are cached by the stored digest or a sliced hash, never a full copy"""
+        from backend.agent import artifacts as artifacts_module
+        from backend.agent.artifacts import ArtifactStore, TextView, content_digest, text_digest
+        from backend.llm import retrieval
+        
+        document = self.make_document(pages=100, needle_page=60)
+        artifacts = ArtifactStore()
+        state = {
+            "artifacts": artifacts,
+            "extracted_text": artifacts.put(document, "extracted_text", digest="abc123.pdf.1"),
+            "raw_input": artifacts.put("typed text", "raw_input")
+        }
+        view = artifacts.view(state['extracted_text'])
+        builds = []
+        build_chunk_index = retrieval.build_chunk_index
+        monkeypatch.setattr(retrieval, "build_chunk_index", lambda text: builds.append(len(text)) or build_chunk_index(text))
+        monkeypatch.setattr(retrieval, "_chunk_index_cache", None)
+        monkeypatch.setattr(TextView, "__str__", lambda self: pytest.fail("document copied"))
+        # Hash in several slices
+        monkeypatch.setattr(artifacts_module, "DIGEST_SLICE_CHARS", 1000)
+        
+        assert content_digest(state) == "abc123.pdf.1"
+        assert content_digest(state, "raw_input") is None
+        assert text_digest(view) == text_digest(document)
+        
+        first = retrieval.get_chunk_index(view, content_digest(state))
+        assert retrieval.get_chunk_index(view, content_digest(state)) is first
+        retrieval.get_chunk_index(view)
+        retrieval.get_chunk_index(document)
+        
+        assert builds == [len(document), len(document)]
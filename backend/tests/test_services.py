@@ -0,0 +1,558 @@
+import json
+import time
+import threading
+import pytest
+from backend.services.jobs import JobManager, JobStatus, JobQueueFullError
+
+
+def wait_for_status(manager, job_id, statuses, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = manager.get(job_id)
+        if job['status'] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} never reached {statuses}")
+
+
+class TestJobManager:
+    """Test background job execution"""
+    
+    def test_job_runs_to_completion(self):
+        """Test that a submitted job reports its result when done"""
+        manager = JobManager(max_workers=1)
+        
+        job_id = manager.submit(lambda: {"status": "success"})
+        job = wait_for_status(manager, job_id, {JobStatus.DONE.value})
+        
+        assert job['result'] == {"status": "success"}
+        assert job['started_at'] is not None
+    
+    def test_failed_job_records_error(self):
+        """Test that exceptions are captured on the job"""
+        manager = JobManager(max_workers=1)
+        
+        def boom():
+            raise ValueError("boom")
+        
+        job_id = manager.submit(boom)
+        job = wait_for_status(manager, job_id, {JobStatus.FAILED.value})
+        
+        assert job['error'] == "boom"
+    
+    def test_cancel_queued_job(self):
+        """Test that a queued job never runs after cancellation"""
+        manager = JobManager(max_workers=1)
+        release = threading.Event()
+        ran = []
+        
+        done = []
+        
+        blocker = manager.submit(lambda: release.wait(5), on_done=lambda: done.append("blocker"))
+        queued = manager.submit(lambda: ran.append(True), on_done=lambda: done.append("queued"))
+        
+        job = manager.cancel(queued)
+        release.set()
+        wait_for_status(manager, blocker, {JobStatus.DONE.value})
+        
+        assert job['status'] == JobStatus.CANCELLED.value
+        assert ran == []
+        # Cleanup runs for finished and never-started jobs alike
+        manager.executor.shutdown(wait=True)
+        assert sorted(done) == ["blocker", "queued"]
+    
+    def test_queue_limit(self):
+        """Test that submissions are rejected once the queue is full"""
+        manager = JobManager(max_workers=1, max_pending=1)
+        release = threading.Event()
+        
+        manager.submit(lambda: release.wait(5))
+        
+        with pytest.raises(JobQueueFullError):
+            manager.submit(lambda: None)
+        
+        release.set()
+
+
+class TestUploadStore:
+    """Test content-addressed uploads and extraction caching"""
+    
+    def test_identical_uploads_share_a_blob(self, tmp_path):
+        """Test that the same content is stored once under its hash"""
+        import io
+        from backend.services.upload_store import UploadStore
+        
+        store = UploadStore(str(tmp_path), max_bytes=10 * 1024 * 1024)
+        
+        first = store.save(io.BytesIO(b"same bytes"), "a.pdf")
+        second = store.save(io.BytesIO(b"same bytes"), "b.PDF")
+        
+        assert first == second
+        assert first.suffix == ".pdf"
+        assert store.hash_for_path(str(first)) == first.stem
+    
+    def test_extraction_is_cached(self, tmp_path):
+        """Test that a second extraction of the same blob skips the extractor"""
+        import io
+        from backend.services.upload_store import UploadStore
+        
+        store = UploadStore(str(tmp_path), max_bytes=10 * 1024 * 1024)
+        path = store.save(io.BytesIO(b"scanned deck"), "deck.pdf")
+        calls = []
+        
+        def extractor(file_path):
+            calls.append(file_path)
+            return "page text", {"num_pages": 3}
+        
+        store.cached_extraction(str(path), "pdf", "1", extractor)
+        text, metadata = store.cached_extraction(str(path), "pdf", "1", extractor)
+        store.cached_extraction(str(path), "pdf", "2", extractor)
+        
+        assert text == "page text"
+        assert metadata['extraction_cached'] == True
+        assert len(calls) == 2
+    
+    def test_lru_eviction(self, tmp_path):
+        """Test that the least recently used blob is evicted over quota"""
+        import io
+        import os
+        from backend.services.upload_store import UploadStore
+        
+        store = UploadStore(str(tmp_path), max_bytes=250)
+        old = store.save(io.BytesIO(b"a" * 100), "old.png")
+        os.utime(old, (1, 1))
+        recent = store.save(io.BytesIO(b"b" * 100), "recent.png")
+        store.save(io.BytesIO(b"c" * 100), "new.png")
+        
+        assert not old.exists()
+        assert recent.exists()
+        assert store.total_bytes() <= 250
+    
+    def test_pinned_blob_is_not_evicted(self, tmp_path):
+        """Test that a blob still waiting to be processed survives eviction until unpinned"""
+        import io
+        import os
+        from backend.services.upload_store import UploadStore
+        
+        store = UploadStore(str(tmp_path), max_bytes=250)
+        queued = store.save(io.BytesIO(b"a" * 100), "queued.pdf", pin=True)
+        os.utime(queued, (1, 1))
+        recent = store.save(io.BytesIO(b"b" * 100), "recent.png")
+        os.utime(recent, (2, 2))
+        store.save(io.BytesIO(b"c" * 100), "new.png")
+        
+        assert queued.exists()
+        assert not recent.exists()
+        
+        store.unpin(queued)
+        store.save(io.BytesIO(b"d" * 100), "newer.png")
+        
+        assert not queued.exists()
+
+
+class TestSessionStore:
+    """Test bounded follow-up session storage"""
+    
+    def make_state(self, text):
+        from backend.agent.state import create_initial_state, InputType
+        
+        state = create_initial_state(input_type=InputType.TEXT, raw_input=text)
+        state['extracted_text'] = text
+        state['clarification_question'] = "What would you like me to do?"
+        state['conversation_history'] = [{"role": "user", "content": text}]
+        return state
+    
+    def test_roundtrip_keeps_followup_fields(self):
+        """Test that a stored session rebuilds a usable state"""
+        from backend.services.session_store import SessionStore
+        
+        store = SessionStore()
+        store.put("s1", self.make_state("some text"))
+        
+        state = store.get("s1")
+        
+        assert state['extracted_text'] == "some text"
+        assert state['clarification_question'] == "What would you like me to do?"
+        assert state['conversation_history'] == []
+        assert store.stats()['hits'] == 1
+    
+    def test_shared_text_counted_once(self):
+        """Test that raw_input and extracted_text sharing a string are counted once"""
+        from backend.services.session_store import SessionStore
+        
+        store = SessionStore()
+        text = "x" * 100000
+        store.put("s1", self.make_state(text))
+        
+        assert store.stats()['bytes'] < 2 * len(text)
+    
+    def test_ttl_expiry(self):
+        """Test that expired sessions are misses"""
+        from backend.services.session_store import SessionStore
+        
+        store = SessionStore(ttl_seconds=0)
+        store.put("s1", self.make_state("text"))
+        time.sleep(0.01)
+        
+        assert store.get("s1") is None
+        assert store.stats()['misses'] == 1
+    
+    def test_lru_eviction_by_bytes(self):
+        """Test that the least recently used session is evicted over the cap"""
+        from backend.services.session_store import SessionStore
+        
+        store = SessionStore(max_bytes=25000)
+        store.put("old", self.make_state("a" * 10000))
+        store.put("recent", self.make_state("b" * 10000))
+        store.get("old")
+        store.put("new", self.make_state("c" * 10000))
+        
+        assert "recent" not in store
+        assert "old" in store
+        assert store.stats()['evictions'] == 1
+
+
+class TestSessionCheckpointer:
+    """Test SQLite checkpoints for paused follow-up threads"""
+    
+    def make_graph(self, checkpointer):
+        from typing import TypedDict
+        from langgraph.graph import StateGraph, END
+        
+        class State(TypedDict):
+            text: str
+            answer: str
+        
+        graph = StateGraph(State)
+        graph.add_node("ask", lambda state: {"answer": ""})
+        graph.add_node("run", lambda state: {"answer": state["text"].upper()})
+        graph.set_entry_point("ask")
+        graph.add_edge("ask", "run")
+        graph.add_edge("run", END)
+        return graph.compile(checkpointer=checkpointer, interrupt_after=["ask"])
+    
+    def test_resume_from_another_worker(self, tmp_path):
+        """Test that a thread paused by one saver resumes from a fresh one on the same file"""
+        from backend.services.checkpoints import SessionCheckpointer, thread_config
+        
+        path = str(tmp_path / "sessions.sqlite3")
+        config = thread_config("s1")
+        self.make_graph(SessionCheckpointer(path)).invoke({"text": "hello", "answer": ""}, config)
+        
+        saver = SessionCheckpointer(path)
+        result = self.make_graph(saver).invoke(None, config)
+        
+        assert result["answer"] == "HELLO"
+        assert len(list(saver.list(config))) == 1
+        assert saver.stats()["entries"] == 1
+    
+    def test_expired_threads_are_deleted(self, tmp_path):
+        """Test that threads past the TTL read as missing and are swept"""
+        from backend.services.checkpoints import SessionCheckpointer, thread_config
+        
+        saver = SessionCheckpointer(str(tmp_path / "sessions.sqlite3"), ttl_seconds=0)
+        graph = self.make_graph(saver)
+        graph.invoke({"text": "hello", "answer": ""}, thread_config("s1"))
+        time.sleep(0.01)
+        
+        assert not graph.get_state(thread_config("s1")).values
+        assert saver.expire(force=True) == 1
+        assert saver.stats()["entries"] == 0
+
+
+class TestTracing:
+    """Test request trace spans and the slow-trace buffer"""
+    
+    def test_spans_nest_and_record_errors(self):
+        """Test parent links, attributes added in the span and error status"""
+        from backend.services.tracing import Trace, use_trace, span, STATUS_ERROR
+        
+        trace = Trace()
+        with use_trace(trace):
+            with span("node.execute_task") as outer:
+                with span("llm.summarize", prompt_tokens=120) as attributes:
+                    attributes["completion_tokens"] = 40
+                outer["task"] = "summarize"
+            with pytest.raises(ValueError):
+                with span("extractor.pdf"):
+                    raise ValueError("bad pdf")
+        
+        spans = {record["name"]: record for record in trace.spans}
+        assert spans["llm.summarize"]["parent_span_id"] == spans["node.execute_task"]["span_id"]
+        assert spans["node.execute_task"]["parent_span_id"] == trace.root_span_id
+        assert spans["llm.summarize"]["attributes"] == {"prompt_tokens": 120, "completion_tokens": 40}
+        assert spans["extractor.pdf"]["status"] == {"code": STATUS_ERROR, "message": "bad pdf"}
+    
+    def test_buffer_keeps_slow_traces_and_exports_otlp(self, tmp_path):
+        """Test the slow threshold, ring buffer size and OTLP JSON-lines export"""
+        from backend.services.tracing import Trace, TraceBuffer
+        
+        path = tmp_path / "traces.jsonl"
+        buffer = TraceBuffer(max_traces=2, slow_ms=50, export_path=str(path))
+        now = time.time_ns()
+        
+        assert not buffer.record(Trace(start_ns=now - 10_000_000))
+        slow = [Trace(start_ns=now - 100_000_000) for _ in range(3)]
+        for trace in slow:
+            assert buffer.record(trace)
+        
+        assert [trace.trace_id for trace in buffer.recent()] == [slow[2].trace_id, slow[1].trace_id]
+        lines = [json.loads(line) for line in path.read_text().splitlines()]
+        assert len(lines) == 3
+        span = lines[0]["resourceSpans"][0]["scopeSpans"][0]["spans"][0]
+        assert span["traceId"] == slow[0].trace_id and span["name"] == "request"
+
+
+class TestWorkflowStreaming:
+    """Test SSE streaming of node progress and tokens"""
+    
+    def test_stream_emits_nodes_tokens_and_result(self):
+        """Test event order for a two-node graph"""
+        import asyncio
+        from typing import TypedDict
+        from langgraph.graph import StateGraph, END
+        from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+        from langchain_core.messages import AIMessage
+        from backend.services.streaming import stream_workflow
+        
+        class State(TypedDict):
+            text: str
+            result: str
+        
+        def classify_intent(state):
+            return state
+        
+        def execute_task(state):
+            llm = GenericFakeChatModel(messages=iter([AIMessage(content="a short summary")]))
+            state['result'] = llm.invoke(state['text']).content
+            return state
+        
+        graph = StateGraph(State)
+        graph.add_node("classify_intent", classify_intent)
+        graph.add_node("execute_task", execute_task)
+        graph.set_entry_point("classify_intent")
+        graph.add_edge("classify_intent", "execute_task")
+        graph.add_edge("execute_task", END)
+        workflow = graph.compile()
+        
+        async def collect():
+            events = []
+            async for event in stream_workflow(
+                workflow,
+                {"text": "hello", "result": ""},
+                lambda state: {"result": state['result']}
+            ):
+                events.append(event)
+            return events
+        
+        events = asyncio.run(collect())
+        names = [event.split('\n')[0].replace('event: ', '') for event in events]
+        
+        assert names[0] == 'node_start'
+        assert 'token' in names
+        assert names.index('token') > names.index('node_end')
+        assert names[-1] == 'result'
+        assert '"a short summary"' in events[-1]
+
+
+class TestBatchRunner:
+    """Test bounded batch execution"""
+    
+    def test_errors_are_per_item_and_concurrency_is_bounded(self):
+        """Test that one failing item does not stop the batch"""
+        import asyncio
+        import json
+        from backend.services.batch import run_batch
+        
+        lock = threading.Lock()
+        in_flight = []
+        peak = []
+        
+        def process_item(item):
+            with lock:
+                in_flight.append(item)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.remove(item)
+            if item == "bad":
+                raise ValueError("bad item")
+            return {"status": "success", "result": item.upper()}
+        
+        async def collect():
+            return [
+                json.loads(line)
+                async for line in run_batch(["a", "bad", "c", "d", "e"], process_item, concurrency=2)
+            ]
+        
+        lines = asyncio.run(collect())
+        by_index = {line['index']: line for line in lines}
+        
+        assert len(lines) == 5
+        assert by_index[1] == {"index": 1, "status": "error", "error": "bad item"}
+        assert by_index[4]['result'] == "E"
+        assert max(peak) <= 2
+
+
+class TestMetrics:
+    """Test Prometheus instrumentation"""
+    
+    def test_timed_node_records_latency(self):
+        """Test that wrapped nodes observe their duration"""
+        from prometheus_client import REGISTRY
+        from backend.services.metrics import timed_node
+        
+        def sample(labels):
+            return REGISTRY.get_sample_value('agent_node_duration_seconds_count', labels) or 0
+        
+        before = sample({"node": "test_node"})
+        node = timed_node("test_node", lambda state: state)
+        
+        assert node({"x": 1}) == {"x": 1}
+        assert sample({"node": "test_node"}) == before + 1
+    
+    def test_llm_callback_counts_tokens(self):
+        """Test that token usage is read from the LLM result"""
+        from prometheus_client import REGISTRY
+        from langchain_core.outputs import LLMResult
+        from backend.services.metrics import LLMMetricsCallback
+        
+        callback = LLMMetricsCallback("test-model")
+        callback.on_chat_model_start({}, [[]])
+        callback.on_llm_end(LLMResult(
+            generations=[[]],
+            llm_output={"token_usage": {"prompt_tokens": 12, "completion_tokens": 5}}
+        ))
+        
+        assert REGISTRY.get_sample_value('llm_calls_total', {"model": "test-model"}) == 1
+        assert REGISTRY.get_sample_value(
+            'llm_tokens_total', {"model": "test-model", "kind": "prompt"}
+        ) == 12
+    
+    def test_streamed_response_stays_in_flight(self):
+        """Test that a streaming response counts as in flight until its body is sent"""
+        from fastapi import FastAPI
+        from fastapi.responses import StreamingResponse
+        from fastapi.testclient import TestClient
+        from prometheus_client import REGISTRY
+        from backend.services.metrics import InFlightMiddleware
+        
+        def in_flight():
+            return REGISTRY.get_sample_value('http_requests_in_flight')
+        
+        app = FastAPI()
+        app.add_middleware(InFlightMiddleware)
+        before = in_flight()
+        seen = []
+        
+        @app.get("/stream")
+        async def stream():
+            async def body():
+                for _ in range(3):
+                    seen.append(in_flight())
+                    yield "chunk\n"
+            return StreamingResponse(body())
+        
+        response = TestClient(app).get("/stream")
+        
+        assert response.text == "chunk\n" * 3
+        assert seen == [before + 1] * 3
+        assert in_flight() == before
+
+
+class TestAdmissionControl:
+    """Test per-input-type admission limits"""
+    
+    def test_queue_then_reject(self):
+        """Test that requests queue up to the limit and are then rejected"""
+        import asyncio
+        from backend.services.admission import AdmissionController, AdmissionRejected
+        
+        async def scenario():
+            controller = AdmissionController(limits={"audio": 1}, max_queue=1)
+            
+            release = await controller.acquire("audio")
+            waiting = asyncio.create_task(controller.acquire("audio"))
+            await asyncio.sleep(0)
+            
+            assert controller.queue_depth()["audio"] == {"running": 1, "waiting": 1, "limit": 1}
+            
+            with pytest.raises(AdmissionRejected) as rejected:
+                await controller.acquire("audio")
+            assert rejected.value.retry_after >= 1
+            
+            release()
+            second_release = await waiting
+            assert controller.queue_depth()["audio"]["running"] == 1
+            second_release()
+            assert controller.queue_depth()["audio"]["running"] == 0
+        
+        asyncio.run(scenario())
+    
+    def test_cancelled_waiter_leaves_queue(self):
+        """Test that a client disconnect while queued frees its queue spot"""
+        import asyncio
+        from backend.services.admission import AdmissionController
+        
+        async def scenario():
+            controller = AdmissionController(limits={"pdf": 1}, max_queue=2)
+            
+            release = await controller.acquire("pdf")
+            waiting = asyncio.create_task(controller.acquire("pdf"))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            await asyncio.sleep(0)
+            
+            assert controller.queue_depth()["pdf"]["waiting"] == 0
+            release()
+            assert controller.queue_depth()["pdf"]["running"] == 0
+        
+        asyncio.run(scenario())
+
+
+class TestWarmup:
+    """Test startup warmup and readiness"""
+    
+    def test_ready_only_after_all_steps_pass(self):
+        """Test readiness transitions"""
+        from backend.services.warmup import WarmupState, run_warmup
+        
+        state = WarmupState()
+        assert state.snapshot()['status'] == 'warming_up'
+        
+        run_warmup(state, [("fast", lambda: None)])
+        
+        assert state.ready
+        assert state.snapshot()['checks']['fast']['ok'] == True
+    
+    def test_failed_step_is_not_ready(self):
+        """Test that a failing step is reported and blocks readiness"""
+        from backend.services.warmup import WarmupState, run_warmup
+        
+        def missing_binary():
+            raise RuntimeError("Missing binaries: tesseract")
+        
+        state = WarmupState()
+        run_warmup(state, [("binaries", missing_binary), ("fast", lambda: None)])
+        
+        snapshot = state.snapshot()
+        assert not state.ready
+        assert snapshot['status'] == 'not_ready'
+        assert snapshot['checks']['binaries']['error'] == "Missing binaries: tesseract"
+        assert snapshot['checks']['fast']['ok'] == True
+    
+    def test_unavailable_tokenizer_reports_estimate(self, monkeypatch):
+        """Test that a tokenizer that cannot load leaves the pod ready in estimate mode"""
+        from backend.llm import tokens
+        from backend.services.warmup import WarmupState, load_tokenizer, run_warmup
+        
+        monkeypatch.delenv("TOKENIZER", raising=False)
+        monkeypatch.setattr(tokens, "_encoding", None)
+        monkeypatch.setattr(tokens, "_encoding_thread", None)
+        monkeypatch.setattr(tokens, "load_encoding", lambda: None)
+        
+        state = WarmupState()
+        run_warmup(state, [("tokenizer", load_tokenizer)])
+        
+        assert state.ready
+        assert state.snapshot()['checks']['tokenizer']['detail'] == "estimate"